@@ -0,0 +1,190 @@
+"""Build the cleaned incident matrix (`dfmatrix`) from the raw Toronto CSVs.
+
+Vectorized, importable version of the cleaning steps in
+datacleaningprontoV2.ipynb. The raw files are read in chunks, keeping only
+the columns the matrix needs in compact dtypes, so peak memory is set by the
+cleaned data rather than by the raw CSVs.
+
+    python data_cleaning/data_cleaning.py --majorcrimes raw_data/majorcrimes.csv \
+        --homicides raw_data/homicidies.csv --output raw_data/dfmatrix.parquet
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Toronto boundaries
+NORTH_BOUNDARY = 43.8554
+SOUTH_BOUNDARY = 43.5810
+EAST_BOUNDARY = -79.1161
+WEST_BOUNDARY = -79.6393
+
+COLUMNS = ['EVENT_UNIQUE_ID', 'DATASET', 'OFFENCE', 'MCI_CATEGORY', 'OCC_HOUR', 'OCC_DAY', 'OCC_MONTH',
+           'OCC_YEAR', 'OCC_DOW', 'OCC_DOY', 'LAT_WGS84', 'LONG_WGS84']
+
+MONTHS = {'January': 1, 'February': 2, 'March': 3, 'April': 4, 'May': 5, 'June': 6, 'July': 7,
+          'August': 8, 'September': 9, 'October': 10, 'November': 11, 'December': 12}
+
+DAYS_OF_WEEK = {'Sunday': 1, 'Monday': 2, 'Tuesday': 3, 'Wednesday': 4, 'Thursday': 5,
+                'Friday': 6, 'Saturday': 7}
+
+FIRST_COLUMNS = ['OCC_YEAR', 'OCC_MONTH', 'OCC_DAY', 'OCC_HOUR', 'OCC_DOW', 'OCC_DOY', 'OCC_MONTH_NUM',
+                 'MONTH_SIN', 'MONTH_COS', 'HOUR_SIN', 'HOUR_COS', 'OCC_DAY_SIN', 'OCC_DAY_COS',
+                 'OCC_DOY_SIN', 'OCC_DOY_COS', 'OCC_DOW_NUM', 'OCC_DOW_SIN', 'OCC_DOW_COS']
+
+NUMERIC_COLUMNS = ['OCC_HOUR', 'OCC_DAY', 'OCC_YEAR', 'OCC_DOY', 'LAT_WGS84', 'LONG_WGS84']
+CATEGORY_COLUMNS = ['DATASET', 'MCI_CATEGORY', 'OCC_MONTH', 'OCC_DOW']
+
+
+def read_incidents(path, dataset, chunksize=100000):
+    """Read one raw CSV in chunks, keeping the matrix columns in compact dtypes."""
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [column for column in COLUMNS if column in header]
+    chunks = []
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize, low_memory=False):
+        chunk = chunk.reindex(columns=COLUMNS)
+        chunk['DATASET'] = dataset
+        if dataset == 'HOMICIDES':
+            chunk['MCI_CATEGORY'] = 'Homicide'
+
+        within_boundaries = (chunk['LAT_WGS84'] <= NORTH_BOUNDARY) & (chunk['LAT_WGS84'] >= SOUTH_BOUNDARY) & \
+                            (chunk['LONG_WGS84'] >= WEST_BOUNDARY) & (chunk['LONG_WGS84'] <= EAST_BOUNDARY)
+        chunk = chunk.loc[within_boundaries].drop(columns=['OFFENCE'])
+
+        for column in NUMERIC_COLUMNS:
+            chunk[column] = pd.to_numeric(chunk[column], errors='coerce')
+        for column in CATEGORY_COLUMNS:
+            chunk[column] = chunk[column].astype('category')
+        chunks.append(chunk)
+
+    # Union the categories so the concatenation stays categorical
+    return concat_categorical(chunks)
+
+
+def concat_categorical(frames):
+    frames = [frame for frame in frames if len(frame)] or frames[:1]
+    for column in CATEGORY_COLUMNS:
+        categories = pd.api.types.union_categoricals([frame[column] for frame in frames]).categories
+        for frame in frames:
+            frame[column] = frame[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def impute_homicide_hours(df):
+    """Fill missing homicide OCC_HOUR from the major-crimes hour distribution.
+
+    Same result as the notebook's two iterrows passes: the missing rows, in
+    order, take each hour in turn for trunc(n_homicides * share) rows, and
+    the sequence is applied a second time to whatever is still missing.
+    """
+    major = df['DATASET'] == 'MAJOR_CRIMES'
+    homicides = df['DATASET'] == 'HOMICIDES'
+    shares = df.loc[major, 'OCC_HOUR'].value_counts() / major.sum()
+    counts = np.trunc(homicides.sum() * shares.to_numpy()).astype(np.int64)
+    sequence = np.repeat(shares.index.to_numpy(), counts)
+
+    missing = np.flatnonzero(homicides & df['OCC_HOUR'].isna())
+    fill = np.concatenate([sequence, sequence])[:len(missing)]
+    hours = df['OCC_HOUR'].to_numpy(dtype=np.float64, copy=True)
+    hours[missing[:len(fill)]] = fill
+    df['OCC_HOUR'] = hours
+    return df
+
+
+def impute_zero_days(df):
+    """Replace OCC_DAY == 0 by cycling through the non-zero days, most frequent first."""
+    zero = np.flatnonzero(df['OCC_DAY'].to_numpy() == 0)
+    if len(zero):
+        order = df.loc[df['OCC_DAY'] != 0, 'OCC_DAY'].value_counts(normalize=True).index.to_numpy()
+        days = df['OCC_DAY'].to_numpy(copy=True)
+        days[zero] = order[np.arange(len(zero)) % len(order)]
+        df['OCC_DAY'] = days
+    return df
+
+
+def add_cyclic(df, column, period, prefix=None):
+    prefix = prefix or column
+    angle = 2 * np.pi * df[column] / period
+    df[f'{prefix}_SIN'] = np.sin(angle)
+    df[f'{prefix}_COS'] = np.cos(angle)
+
+
+def clean(df):
+    """Apply the notebook's cleaning steps to the concatenated raw incidents."""
+    df = impute_homicide_hours(df)
+    df['OCC_HOUR'] = df['OCC_HOUR'].fillna(0).astype(np.int64)
+    df['OCC_DAY'] = df['OCC_DAY'].fillna(0).astype(np.int64)
+    df = impute_zero_days(df)
+
+    # The training features use these periods, so they are kept as they are
+    add_cyclic(df, 'OCC_DAY', 24)
+    add_cyclic(df, 'OCC_DOY', 24)
+
+    df = df.dropna(subset=['OCC_MONTH'])
+    df['OCC_MONTH_NUM'] = df['OCC_MONTH'].map(MONTHS).astype(np.int64)
+    add_cyclic(df, 'OCC_MONTH_NUM', 12, prefix='MONTH')
+    add_cyclic(df, 'OCC_HOUR', 24, prefix='HOUR')
+
+    # Day names carry padding in the major-crimes file; map on the categories only
+    dow_numbers = {name: DAYS_OF_WEEK[name.strip()] for name in df['OCC_DOW'].cat.categories}
+    df['OCC_DOW_NUM'] = df['OCC_DOW'].map(dow_numbers).astype(np.int64)
+    add_cyclic(df, 'OCC_DOW_NUM', 24, prefix='OCC_DOW')
+
+    df = df.dropna(subset=['OCC_YEAR'])
+    df['OCC_YEAR'] = np.floor(df['OCC_YEAR']).astype(np.int64)
+    df = df[df['OCC_YEAR'] >= 2014]
+    df = df.drop(columns=['DATASET'])
+    df = df.dropna(subset=['OCC_DOY'])
+    df['OCC_DOY'] = df['OCC_DOY'].astype(np.int64)
+    return df
+
+
+def merge_events(df):
+    """One row per (EVENT_UNIQUE_ID, LAT_WGS84, LONG_WGS84) with a count column per crime type."""
+    keys = ['EVENT_UNIQUE_ID', 'LAT_WGS84', 'LONG_WGS84']
+    grouped = df.groupby(keys, sort=True)
+    merged = grouped[FIRST_COLUMNS].first()
+
+    categories = df['MCI_CATEGORY'].cat.remove_unused_categories()
+    counts = pd.crosstab([df[key] for key in keys], categories.rename(None)).reindex(merged.index)
+    counts = counts[sorted(counts.columns)]
+    counts.columns = list(counts.columns)
+
+    dfmatrix = pd.concat([merged, counts], axis=1).reset_index()
+    for column in ['OCC_MONTH', 'OCC_DOW']:
+        dfmatrix[column] = dfmatrix[column].astype(object)
+    return dfmatrix.fillna(0)
+
+
+def build_matrix(majorcrimes_path, homicides_path, chunksize=100000):
+    """Return the cleaned `dfmatrix` for the two raw CSV files."""
+    df = concat_categorical([
+        read_incidents(homicides_path, 'HOMICIDES', chunksize),
+        read_incidents(majorcrimes_path, 'MAJOR_CRIMES', chunksize),
+    ])
+    return merge_events(clean(df))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the cleaned incident matrix from the raw CSVs.")
+    parser.add_argument('--majorcrimes', default='raw_data/majorcrimes.csv')
+    parser.add_argument('--homicides', default='raw_data/homicidies.csv')
+    parser.add_argument('--output', default='raw_data/dfmatrix.parquet')
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--store', help='also write the partitioned incident store to this directory '
+                                        '(needs the precog-matrix package installed)')
+    args = parser.parse_args()
+
+    dfmatrix = build_matrix(args.majorcrimes, args.homicides, args.chunksize)
+    dfmatrix.to_parquet(args.output, index=False)
+    print(f"Wrote {len(dfmatrix)} rows x {dfmatrix.shape[1]} columns to {args.output}")
+
+    if args.store:
+        from app.incident_store import write_store
+
+        partitions = write_store(dfmatrix, args.store)
+        print(f"Wrote {len(partitions)} partitions to {args.store}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""Compare data_cleaning.py with the cleaning cells of datacleaningprontoV2.ipynb on small sample CSVs.
+
+    python -m pytest data_cleaning
+"""
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_cleaning import (DAYS_OF_WEEK, MONTHS, NORTH_BOUNDARY, SOUTH_BOUNDARY, EAST_BOUNDARY, WEST_BOUNDARY,
+                           build_matrix)
+
+CRIMES = ['Assault', 'Auto Theft', 'Break and Enter', 'Robbery', 'Theft Over']
+
+
+def notebook_matrix(dfmajorcrimes, dfhomicides):
+    """The notebook's cleaning cells, kept as written apart from the display-only ones."""
+    columns = ['EVENT_UNIQUE_ID', 'DATASET', 'OFFENCE', 'MCI_CATEGORY', 'OCC_HOUR', 'OCC_DAY', 'OCC_MONTH',
+               'OCC_YEAR', 'OCC_DOW', 'OCC_DOY', 'LAT_WGS84', 'LONG_WGS84']
+    for df in [dfhomicides, dfmajorcrimes]:
+        for column in columns:
+            if column not in df.columns:
+                df[column] = None
+    dfhomicides_s = dfhomicides[columns].copy()
+    dfmajorcrimes_s = dfmajorcrimes[columns].copy()
+    dfhomicides_s.loc[:, 'DATASET'] = 'HOMICIDES'
+    dfmajorcrimes_s.loc[:, 'DATASET'] = 'MAJOR_CRIMES'
+    dfmatrix = pd.concat([dfhomicides_s, dfmajorcrimes_s], ignore_index=True)
+    dfmatrix.loc[dfmatrix['DATASET'] == 'HOMICIDES', 'OFFENCE'] = 'Homicide'
+    dfmatrix.loc[dfmatrix['DATASET'] == 'HOMICIDES', 'MCI_CATEGORY'] = 'Homicide'
+
+    within_boundaries = (dfmatrix['LAT_WGS84'] <= NORTH_BOUNDARY) & (dfmatrix['LAT_WGS84'] >= SOUTH_BOUNDARY) & \
+                        (dfmatrix['LONG_WGS84'] >= WEST_BOUNDARY) & (dfmatrix['LONG_WGS84'] <= EAST_BOUNDARY)
+    dfmatrix = dfmatrix.loc[within_boundaries].reset_index(drop=True)
+
+    df_hour = dfmatrix[dfmatrix['DATASET'] == 'MAJOR_CRIMES'].OCC_HOUR.value_counts() / \
+        len(dfmatrix[dfmatrix['DATASET'] == 'MAJOR_CRIMES'])
+    df_hour = df_hour.to_frame().reset_index(drop=False)
+    # The hour imputation cell is run twice
+    for _ in range(2):
+        for i, hour_row in df_hour.iterrows():
+            size = len(dfmatrix[dfmatrix['DATASET'] == 'HOMICIDES'])
+            missing = dfmatrix[(dfmatrix['DATASET'] == 'HOMICIDES') & (pd.isnull(dfmatrix.OCC_HOUR))]
+            for index, row in missing.head(math.trunc(size * hour_row['count'])).iterrows():
+                dfmatrix.loc[index, 'OCC_HOUR'] = hour_row['OCC_HOUR']
+    dfmatrix['OCC_HOUR'] = pd.to_numeric(dfmatrix['OCC_HOUR'], errors='coerce').fillna(0).astype(int)
+    dfmatrix['OCC_HOUR'] = dfmatrix['OCC_HOUR'].apply(lambda x: np.floor(x) if pd.notnull(x) else x).astype('Int64')
+    dfmatrix['OCC_DAY'] = pd.to_numeric(dfmatrix['OCC_DAY'], errors='coerce').fillna(0).astype(int)
+    dfmatrix['OCC_DAY'] = dfmatrix['OCC_DAY'].apply(lambda x: np.floor(x) if pd.notnull(x) else x).astype('Int64')
+
+    occ_day_proportions = dfmatrix[dfmatrix['OCC_DAY'] != 0]['OCC_DAY'].value_counts(normalize=True).reset_index()
+    occ_day_proportions.columns = ['OCC_DAY', 'proportion']
+    current_proportion_index = 0
+    for index, row in dfmatrix[dfmatrix['OCC_DAY'] == 0].iterrows():
+        dfmatrix.at[index, 'OCC_DAY'] = occ_day_proportions.at[current_proportion_index, 'OCC_DAY']
+        current_proportion_index += 1
+        if current_proportion_index >= len(occ_day_proportions):
+            current_proportion_index = 0
+
+    dfmatrix['OCC_DAY_SIN'] = np.sin(2 * np.pi * dfmatrix['OCC_DAY'] / 24)
+    dfmatrix['OCC_DAY_COS'] = np.cos(2 * np.pi * dfmatrix['OCC_DAY'] / 24)
+    dfmatrix['OCC_DOY_SIN'] = np.sin(2 * np.pi * dfmatrix['OCC_DOY'] / 24)
+    dfmatrix['OCC_DOY_COS'] = np.cos(2 * np.pi * dfmatrix['OCC_DOY'] / 24)
+
+    dfmatrix = dfmatrix.dropna(subset=['OCC_MONTH'])
+    dfmatrix['OCC_MONTH_NUM'] = dfmatrix.OCC_MONTH.apply(lambda x: MONTHS[x])
+    dfmatrix['MONTH_SIN'] = np.sin(2 * np.pi * dfmatrix['OCC_MONTH_NUM'] / 12)
+    dfmatrix['MONTH_COS'] = np.cos(2 * np.pi * dfmatrix['OCC_MONTH_NUM'] / 12)
+    dfmatrix['HOUR_SIN'] = np.sin(2 * np.pi * dfmatrix['OCC_HOUR'] / 24)
+    dfmatrix['HOUR_COS'] = np.cos(2 * np.pi * dfmatrix['OCC_HOUR'] / 24)
+    dfmatrix['OCC_DOW_NUM'] = dfmatrix.OCC_DOW.apply(lambda x: DAYS_OF_WEEK[x.strip()])
+    dfmatrix['OCC_DOW_SIN'] = np.sin(2 * np.pi * dfmatrix['OCC_DOW_NUM'] / 24)
+    dfmatrix['OCC_DOW_COS'] = np.cos(2 * np.pi * dfmatrix['OCC_DOW_NUM'] / 24)
+
+    # The notebook's `dfmatrix.loc['OCC_YEAR'] = ...` adds an all-NaN row that the next cell drops
+    dfmatrix = dfmatrix.dropna(subset=['OCC_YEAR'])
+    dfmatrix['OCC_YEAR'] = dfmatrix['OCC_YEAR'].apply(lambda x: np.floor(x) if pd.notnull(x) else x).astype('Int64')
+    dfmatrix = dfmatrix[dfmatrix['OCC_YEAR'] >= 2014]
+    dfmatrix = dfmatrix.drop(columns=['DATASET', 'OFFENCE'])
+    dfmatrix = dfmatrix.dropna(subset=['OCC_DOY'])
+    dfmatrix['OCC_DOY'] = dfmatrix['OCC_DOY'].astype(int)
+
+    first = ['OCC_YEAR', 'OCC_MONTH', 'OCC_DAY', 'OCC_HOUR', 'OCC_DOW', 'OCC_DOY', 'OCC_MONTH_NUM', 'MONTH_SIN',
+             'MONTH_COS', 'HOUR_SIN', 'HOUR_COS', 'OCC_DAY_SIN', 'OCC_DAY_COS', 'OCC_DOY_SIN', 'OCC_DOY_COS',
+             'OCC_DOW_NUM', 'OCC_DOW_SIN', 'OCC_DOW_COS']
+    dfmatrix['MCI_CATEGORY'] = dfmatrix['MCI_CATEGORY'].apply(lambda x: [x])
+    dfmatrix = dfmatrix.groupby(['EVENT_UNIQUE_ID', 'LAT_WGS84', 'LONG_WGS84']).agg({
+        'MCI_CATEGORY': lambda x: sum(x, []), **{column: 'first' for column in first}}).reset_index()
+    classes = sorted({crime for crimes in dfmatrix['MCI_CATEGORY'] for crime in crimes})
+    crime_counts = pd.DataFrame({column: dfmatrix['MCI_CATEGORY'].apply(lambda x: x.count(column))
+                                 for column in classes})
+    dfmatrix = pd.concat([dfmatrix.drop(columns=['MCI_CATEGORY']), crime_counts], axis=1)
+    return dfmatrix.infer_objects().fillna(0)
+
+
+def sample_csvs(directory, seed=0):
+    """Write small major-crimes and homicides CSVs that exercise every cleaning step."""
+    rng = np.random.default_rng(seed)
+    month_names = list(MONTHS)
+    # Padded day names as in the major-crimes file
+    day_names = [f'{name:<10}' for name in DAYS_OF_WEEK]
+
+    def incidents(n, prefix, hour_weights):
+        days = rng.integers(1, 29, n).astype(float)
+        days[rng.random(n) < 0.15] = 0
+        days[rng.random(n) < 0.05] = np.nan
+        hours = rng.choice(24, n, p=hour_weights).astype(float)
+        frame = pd.DataFrame({
+            # Every third id is reused so some events hold several offences
+            'EVENT_UNIQUE_ID': [f'{prefix}-{i - i % 3 if i % 2 else i}' for i in range(n)],
+            'OCC_YEAR': rng.integers(2012, 2025, n).astype(float),
+            'OCC_MONTH': rng.choice(month_names, n),
+            'OCC_DAY': days,
+            'OCC_HOUR': hours,
+            'OCC_DOW': rng.choice(day_names, n),
+            'OCC_DOY': rng.integers(1, 366, n).astype(float),
+            'LAT_WGS84': rng.uniform(SOUTH_BOUNDARY - 0.05, NORTH_BOUNDARY, n),
+            'LONG_WGS84': rng.uniform(WEST_BOUNDARY, EAST_BOUNDARY + 0.05, n),
+        })
+        frame.loc[rng.random(n) < 0.03, 'OCC_MONTH'] = np.nan
+        frame.loc[rng.random(n) < 0.03, 'OCC_YEAR'] = np.nan
+        return frame
+
+    hour_weights = np.exp(-((np.arange(24) - 17) / 5.0) ** 2)
+    majorcrimes = incidents(600, 'GO', hour_weights / hour_weights.sum())
+    majorcrimes['MCI_CATEGORY'] = rng.choice(CRIMES, len(majorcrimes))
+    majorcrimes['OFFENCE'] = majorcrimes['MCI_CATEGORY'] + ' offence'
+    # Rows sharing an event id also share its location and date, as in the raw file
+    first_rows = majorcrimes.groupby('EVENT_UNIQUE_ID').transform('first')
+    shared = ['OCC_YEAR', 'OCC_MONTH', 'OCC_DAY', 'OCC_HOUR', 'OCC_DOW', 'OCC_DOY', 'LAT_WGS84', 'LONG_WGS84']
+    majorcrimes[shared] = first_rows[shared]
+
+    homicides = incidents(120, 'HOM', np.full(24, 1 / 24)).drop(columns=['OCC_DOY'])
+    homicides['OCC_DOY'] = rng.integers(1, 366, len(homicides))
+    homicides['EVENT_UNIQUE_ID'] = [f'HOM-{i}' for i in range(len(homicides))]
+    # No hours for homicides: every one is imputed, and one pass leaves some behind
+    homicides = homicides.drop(columns=['OCC_HOUR'])
+
+    majorcrimes_path, homicides_path = directory / 'majorcrimes.csv', directory / 'homicidies.csv'
+    majorcrimes.to_csv(majorcrimes_path, index=False)
+    homicides.to_csv(homicides_path, index=False)
+    return majorcrimes_path, homicides_path
+
+
+@pytest.fixture(scope='module')
+def matrices(tmp_path_factory):
+    majorcrimes_path, homicides_path = sample_csvs(tmp_path_factory.mktemp('raw'))
+    expected = notebook_matrix(pd.read_csv(majorcrimes_path), pd.read_csv(homicides_path))
+    return build_matrix(majorcrimes_path, homicides_path, chunksize=97), expected
+
+
+def test_matches_notebook(matrices):
+    actual, expected = matrices
+    assert list(actual.columns) == list(expected.columns)
+    for column in expected.columns:
+        if expected[column].dtype.kind == 'f':
+            np.testing.assert_allclose(actual[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float),
+                                       rtol=0, atol=1e-12, err_msg=column)
+        else:
+            assert actual[column].astype(str).tolist() == expected[column].astype(str).tolist(), column
+
+
+def test_crime_counts(matrices):
+    actual, _ = matrices
+    assert (actual[CRIMES + ['Homicide']].sum(axis=1) >= 1).all()
+    assert (actual[CRIMES].to_numpy() > 1).any(), "sample has no event with a repeated offence"
+
+
+def test_quirks_are_kept(matrices):
+    actual, _ = matrices
+    # Day, day of year and day of week stay on a 24 period
+    np.testing.assert_allclose(actual['OCC_DAY_SIN'], np.sin(2 * np.pi * actual['OCC_DAY'] / 24))
+    np.testing.assert_allclose(actual['OCC_DOY_COS'], np.cos(2 * np.pi * actual['OCC_DOY'] / 24))
+    np.testing.assert_allclose(actual['OCC_DOW_SIN'], np.sin(2 * np.pi * actual['OCC_DOW_NUM'] / 24))
+    # Zero and missing days are all imputed
+    assert (actual['OCC_DAY'] > 0).all()
+    assert actual['OCC_YEAR'].min() >= 2014
+
+
+def test_sample_needs_second_hour_pass(tmp_path):
+    """The sample only checks the repeated imputation if one pass leaves homicide hours missing."""
+    majorcrimes_path, homicides_path = sample_csvs(tmp_path)
+    majorcrimes, homicides = pd.read_csv(majorcrimes_path), pd.read_csv(homicides_path)
+    inside = lambda df: df[(df['LAT_WGS84'] >= SOUTH_BOUNDARY) & (df['LONG_WGS84'] <= EAST_BOUNDARY)]
+    majorcrimes, homicides = inside(majorcrimes), inside(homicides)
+    shares = majorcrimes['OCC_HOUR'].value_counts() / len(majorcrimes)
+    first_pass = np.trunc(len(homicides) * shares).sum()
+    assert 'OCC_HOUR' not in homicides.columns
+    assert len(homicides) > first_pass
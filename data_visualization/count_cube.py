@@ -0,0 +1,144 @@
+"""Dense incident count cube for the temporal plots.
+
+Counts are held in one int32 array indexed by
+(year, month, day, day of week, hour, crime type), built in a single
+bincount pass over the incidents and updated in place as new ones arrive.
+Every plot then reads a slice of a few hundred cells instead of
+re-aggregating row-level data:
+
+    cube = CountCube.from_frame(dfmatrix)
+    cube.add(new_incidents)
+    cube.series('hour')                          # 24 x crime type
+    cube.series('month', years=(2022, 2023))
+"""
+import numpy as np
+import pandas as pd
+
+CRIME_TYPES = ["ASSAULT", "AUTO THEFT", "BREAK AND ENTER", "HOMICIDE", "ROBBERY", "THEFT OVER"]
+
+# Axis name -> (values along the axis, incident columns it can be read from)
+AXES = {
+    'month': (np.arange(1, 13), ['OCC_MONTH_NUM', 'OCC_MONTH']),
+    'day': (np.arange(1, 32), ['OCC_DAY']),
+    'dow': (np.arange(1, 8), ['OCC_DOW_NUM', 'OCC_DOW']),  # Sunday = 1 ... Saturday = 7
+    'hour': (np.arange(24), ['OCC_HOUR']),
+}
+AXIS_ORDER = ['year', 'month', 'day', 'dow', 'hour']
+
+
+def incident_column(frame, candidates):
+    """Return the first candidate column holding numbers (dfmatrix keeps month and day names too)."""
+    for column in candidates:
+        if column in frame.columns and pd.api.types.is_numeric_dtype(frame[column]):
+            return frame[column].to_numpy()
+    raise KeyError(f"None of {candidates} found as a numeric column.")
+
+
+def crime_counts(frame):
+    """Return an (n, crime type) count array from the per-type columns of dfmatrix or the incident store."""
+    by_upper = {str(column).upper(): column for column in frame.columns}
+    counts = np.zeros((len(frame), len(CRIME_TYPES)), dtype=np.int64)
+    for i, crime in enumerate(CRIME_TYPES):
+        if crime in by_upper:
+            counts[:, i] = frame[by_upper[crime]].to_numpy()
+    return counts
+
+
+class CountCube:
+    """Incident counts by year, month, day, day of week, hour and crime type."""
+
+    def __init__(self, first_year, last_year):
+        self.first_year = first_year
+        shape = (last_year - first_year + 1,) + tuple(len(AXES[axis][0]) for axis in AXIS_ORDER[1:])
+        self.counts = np.zeros(shape + (len(CRIME_TYPES),), dtype=np.int32)
+
+    @property
+    def years(self):
+        return np.arange(self.first_year, self.first_year + self.counts.shape[0])
+
+    @classmethod
+    def from_frame(cls, frame):
+        years = frame['OCC_YEAR'].to_numpy()
+        cube = cls(int(years.min()), int(years.max()))
+        cube.add(frame)
+        return cube
+
+    @classmethod
+    def from_store(cls, store, **filters):
+        """Build the cube from an IncidentStore, reading only the columns it needs."""
+        columns = ['OCC_YEAR', 'OCC_MONTH', 'OCC_DAY', 'OCC_DOW', 'OCC_HOUR'] + CRIME_TYPES
+        return cls.from_frame(store.query(columns, **filters))
+
+    def _grow(self, first_year, last_year):
+        before = max(self.first_year - first_year, 0)
+        after = max(last_year - int(self.years[-1]), 0)
+        if before or after:
+            self.counts = np.pad(self.counts, [(before, after)] + [(0, 0)] * (self.counts.ndim - 1))
+            self.first_year -= before
+
+    def add(self, frame):
+        """Add incidents (dfmatrix rows or incident store rows) to the cube in one pass."""
+        if len(frame) == 0:
+            return self
+        years = frame['OCC_YEAR'].to_numpy().astype(np.int64)
+        self._grow(int(years.min()), int(years.max()))
+
+        index = years - self.first_year
+        for axis in AXIS_ORDER[1:]:
+            values, candidates = AXES[axis]
+            index = index * len(values) + (incident_column(frame, candidates).astype(np.int64) - values[0])
+
+        cells = int(np.prod(self.counts.shape[:-1]))
+        counts = crime_counts(frame)
+        flat = self.counts.reshape(cells, len(CRIME_TYPES))
+        for i in range(len(CRIME_TYPES)):
+            flat[:, i] += np.bincount(index, weights=counts[:, i], minlength=cells).astype(np.int32)
+        return self
+
+    def select(self, years=None, months=None):
+        """Return the count array restricted to an inclusive `years` range and a list of `months`."""
+        counts = self.counts
+        if years is not None:
+            first = max(years[0] - self.first_year, 0)
+            counts = counts[first:max(years[1] - self.first_year + 1, 0)]
+        if months is not None:
+            counts = counts[:, np.asarray(months) - 1]
+        return counts
+
+    def series(self, axis, years=None, months=None, crime_types=CRIME_TYPES):
+        """Totals along one axis (year, month, day, dow or hour) as a DataFrame of crime type columns."""
+        counts = self.select(years, months)
+        position = AXIS_ORDER.index(axis)
+        other = tuple(i for i in range(len(AXIS_ORDER)) if i != position)
+        totals = counts.sum(axis=other, dtype=np.int64)
+        if axis == 'year':
+            index = self.years if years is None else self.years[(self.years >= years[0]) & (self.years <= years[1])]
+        else:
+            index = AXES[axis][0] if axis != 'month' or months is None else np.asarray(months)
+        frame = pd.DataFrame(totals, index=pd.Index(index, name=axis), columns=CRIME_TYPES)
+        return frame[list(crime_types)]
+
+    def doy_series(self, crime_types=CRIME_TYPES):
+        """Totals by day of the year, folding each (year, month, day) cell onto its date."""
+        by_date = self.counts.sum(axis=(3, 4), dtype=np.int64)
+        years, months, days = np.meshgrid(self.years, AXES['month'][0], AXES['day'][0], indexing='ij')
+        dates = pd.to_datetime({'year': years.ravel(), 'month': months.ravel(), 'day': days.ravel()}, errors='coerce')
+        valid = dates.notna().to_numpy()
+        frame = pd.DataFrame(by_date.reshape(-1, len(CRIME_TYPES))[valid], columns=CRIME_TYPES)
+        frame['doy'] = dates[valid].dt.dayofyear.to_numpy()
+        return frame.groupby('doy')[list(crime_types)].sum()
+
+    def total(self, **selection):
+        """Total incidents of all crime types in a selection made by select()."""
+        return int(self.select(**selection).sum(dtype=np.int64))
+
+    def save(self, path):
+        np.savez_compressed(path, counts=self.counts, first_year=self.first_year)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            cube = cls.__new__(cls)
+            cube.first_year = int(data['first_year'])
+            cube.counts = data['counts']
+        return cube
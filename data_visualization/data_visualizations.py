@@ -1,20 +1,44 @@
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
+import numpy as np
 from wordcloud import WordCloud
 from collections import Counter
+from functools import lru_cache
 import folium
 from folium.plugins import HeatMap
 from branca.colormap import linear
 
+from count_cube import CountCube
+from spatial_bins import BinPyramid
+
 # List of crime types
 crime_types = ["ASSAULT", "AUTO THEFT", "BREAK AND ENTER", "HOMICIDE", "ROBBERY", "THEFT OVER"]
 
+# Most weighted cells sent to a folium HeatMap; the finest level under this is used
+HEATMAP_MAX_POINTS = 20000
+
+# Cleaned matrix written by data_cleaning.py, read by the plots called without data
+DFMATRIX_PATH = 'raw_data/dfmatrix.parquet'
+
+@lru_cache(maxsize=1)
+def default_cube():
+    return CountCube.from_frame(pd.read_parquet(DFMATRIX_PATH))
+
+# Plots below read totals from a CountCube; a row-level dfmatrix is aggregated once on the way in
+def as_cube(data=None):
+    if data is None:
+        return default_cube()
+    return data if isinstance(data, CountCube) else CountCube.from_frame(data)
+
+def plot_counts(counts, crime_types):
+    for crime in crime_types:
+        sns.lineplot(x=counts.index, y=counts[crime].to_numpy(), label=crime)
+
 # Function for plotting crimes by hour
 def plot_crimes_by_hour(dfmatrix, crime_types):
     plt.figure(figsize=(12, 6))
-    for crime in crime_types:
-        sns.lineplot(data=dfmatrix, x="OCC_HOUR", y=crime, label=crime)
+    plot_counts(as_cube(dfmatrix).series('hour'), crime_types)
     plt.xlabel('Hour of the Day')
     plt.ylabel('Number of Incidents')
     plt.title('Incidents by Hour of the Day')
@@ -27,8 +51,7 @@ def plot_crimes_by_hour(dfmatrix, crime_types):
 # Function for plotting crimes by year
 def plot_crimes_by_year(dfmatrix, crime_types):
     plt.figure(figsize=(12, 6))
-    for crime in crime_types:
-        sns.lineplot(data=dfmatrix, x="OCC_YEAR", y=crime, label=crime)
+    plot_counts(as_cube(dfmatrix).series('year'), crime_types)
     plt.xlabel('Year')
     plt.ylabel('Number of Incidents')
     plt.title('Incidents by Year')
@@ -39,8 +62,7 @@ def plot_crimes_by_year(dfmatrix, crime_types):
 # Function for plotting crimes by month
 def plot_crimes_by_month(dfmatrix, crime_types):
     plt.figure(figsize=(12, 6))
-    for crime in crime_types:
-        sns.lineplot(data=dfmatrix, x="OCC_MONTH_NUM", y=crime, label=crime)
+    plot_counts(as_cube(dfmatrix).series('month'), crime_types)
     plt.xlabel('Month')
     plt.ylabel('Number of Incidents')
     plt.title('Incidents by Month')
@@ -51,10 +73,10 @@ def plot_crimes_by_month(dfmatrix, crime_types):
 
 # Function for plotting crimes by day of the week
 def plot_crimes_by_day_of_week(dfmatrix, crime_types):
-    dfmatrix['OCC_DOW_NUM'] = dfmatrix['OCC_DOW_NUM'] % 7
+    # Cube days run Sunday = 1 ... Saturday = 7; reorder to Monday first
+    counts = as_cube(dfmatrix).series('dow').loc[[2, 3, 4, 5, 6, 7, 1]].reset_index(drop=True)
     plt.figure(figsize=(12, 6))
-    for crime in crime_types:
-        sns.lineplot(data=dfmatrix, x="OCC_DOW_NUM", y=crime, label=crime)
+    plot_counts(counts, crime_types)
     plt.xlabel('Day of the Week')
     plt.ylabel('Number of Incidents')
     plt.title('Incidents by Day of the Week')
@@ -66,8 +88,7 @@ def plot_crimes_by_day_of_week(dfmatrix, crime_types):
 # Function for plotting crimes by day of the year
 def plot_crimes_by_day_of_year(dfmatrix, crime_types):
     plt.figure(figsize=(12, 6))
-    for crime in crime_types:
-        sns.lineplot(data=dfmatrix, x="OCC_DOY", y=crime, label=crime)
+    plot_counts(as_cube(dfmatrix).doy_series(), crime_types)
     plt.xlabel('Day of the Year')
     plt.ylabel('Number of Incidents')
     plt.title('Incidents by Day of the Year')
@@ -78,8 +99,7 @@ def plot_crimes_by_day_of_year(dfmatrix, crime_types):
 # Function for plotting crimes by day of the month
 def plot_crimes_by_day_of_month(dfmatrix, crime_types):
     plt.figure(figsize=(12, 6))
-    for crime in crime_types:
-        sns.lineplot(data=dfmatrix, x="OCC_DAY", y=crime, label=crime)
+    plot_counts(as_cube(dfmatrix).series('day'), crime_types)
     plt.xlabel('Day of the Month')
     plt.ylabel('Number of Incidents')
     plt.title('Incidents by Day of the Month')
@@ -94,23 +114,32 @@ def plot_crimes_correlation(dfmatrix, crime_columns):
     plt.show()
 
 # Function for creating heatmaps for specific crimes
-def create_heatmap(dfmatrix, crime_type, north_boundary, south_boundary, east_boundary, west_boundary):
-    sampled_df = dfmatrix.sample(frac=0.3, random_state=42)
-    crime_df = sampled_df.query(f"`{crime_type}` == 1 and LAT_WGS84 >= @south_boundary and LAT_WGS84 <= @north_boundary and LONG_WGS84 >= @west_boundary and LONG_WGS84 <= @east_boundary")
-    locations = crime_df[["LAT_WGS84", "LONG_WGS84"]].values.tolist()
-    colormap = linear.YlOrRd_09.scale(0, crime_df.shape[0])
+def create_heatmap(dfmatrix, crime_type, north_boundary, south_boundary, east_boundary, west_boundary, level=None):
+    pyramid = as_pyramid(dfmatrix, north_boundary, south_boundary, east_boundary, west_boundary)
+    if level is None:
+        level = pyramid.level_for(HEATMAP_MAX_POINTS)
+    lats, longs, weights = pyramid.bins(crime_type, level)
+    locations = np.column_stack([lats, longs, weights / max(weights.max(initial=0), 1)]).round(5).tolist()
+    colormap = linear.YlOrRd_09.scale(0, float(weights.sum()))
     colormap.caption = crime_type.replace("_", " ").title()
     heatmap = HeatMap(data=locations, gradient={0.2: 'blue', 0.4: 'lime', 0.6: 'yellow', 1: 'red'}, radius=15, blur=20)
     m = folium.Map(location=[(north_boundary + south_boundary) / 2, (east_boundary + west_boundary) / 2], zoom_start=10)
     heatmap.add_to(m)
     colormap.add_to(m)
     folium.Rectangle(bounds=[[south_boundary, west_boundary], [north_boundary, east_boundary]], color='blue', fill=False).add_to(m)
-    # return m
+    return m
+
+# Heatmaps are drawn from pre-binned cell counts; a row-level dfmatrix is binned once on the way in
+def as_pyramid(data, north_boundary, south_boundary, east_boundary, west_boundary):
+    if isinstance(data, BinPyramid):
+        return data
+    return BinPyramid.from_frame(data, bounds=(south_boundary, west_boundary, north_boundary, east_boundary))
 
 # Function to create heatmaps for all crime types
 def create_heatmaps_for_all_crimes(dfmatrix, north_boundary, south_boundary, east_boundary, west_boundary):
+    pyramid = as_pyramid(dfmatrix, north_boundary, south_boundary, east_boundary, west_boundary)
     for crime in crime_types:
-        heatmap = create_heatmap(dfmatrix, crime, north_boundary, south_boundary, east_boundary, west_boundary)
+        heatmap = create_heatmap(pyramid, crime, north_boundary, south_boundary, east_boundary, west_boundary)
         heatmap.save(f"{crime.lower().replace(' ', '_')}_heatmap.html")
         print(f"Saved {crime} heatmap to {crime.lower().replace(' ', '_')}_heatmap.html")
 
@@ -127,10 +156,11 @@ def generate_wordcloud(dfmatrix, column_name):
     plt.show()
 
 # Function for plotting period of the day
-def plot_period_of_the_day():
+def plot_period_of_the_day(cube=None):
+    hours = as_cube(cube).series('hour').sum(axis=1)
     data = {
         'PERIOD_OF_THE_DAY': ['Night (12am - 5am)', 'Morning (5am - 12pm)', 'Afternoon (12pm - 6pm)', 'Night (6pm - 12am)'],
-        'Count': [201146, 71721, 105223, 201146]
+        'Count': [hours.loc[0:4].sum(), hours.loc[5:11].sum(), hours.loc[12:17].sum(), hours.loc[18:23].sum()]
     }
     df_period_of_the_day = pd.DataFrame(data)
     sns.set(style="whitegrid")
@@ -146,10 +176,11 @@ def plot_period_of_the_day():
     plt.show()
 
 # Function for plotting period of the month
-def plot_period_of_the_month():
+def plot_period_of_the_month(cube=None):
+    days = as_cube(cube).series('day').sum(axis=1)
     data = {
-        'PERIOD_OF_THE_MONTH': ['Beginning of the Month', 'End of the Month', 'Middle of the Month'],
-        'Count': [127758, 126699, 123633]
+        'PERIOD_OF_THE_MONTH': ['Beginning of the Month', 'Middle of the Month', 'End of the Month'],
+        'Count': [days.loc[1:10].sum(), days.loc[11:20].sum(), days.loc[21:31].sum()]
     }
     df_period_of_the_month = pd.DataFrame(data)
     sns.set(style="whitegrid")
@@ -165,10 +196,11 @@ def plot_period_of_the_month():
     plt.show()
 
 # Function for plotting period of the week
-def plot_period_of_the_week():
+def plot_period_of_the_week(cube=None):
+    days = as_cube(cube).series('dow').sum(axis=1)
     data = {
         'PERIOD_OF_THE_WEEK': ['Weekday', 'Weekend'],
-        'Count': [200000, 80000]
+        'Count': [days.loc[2:6].sum(), days.loc[[1, 7]].sum()]
     }
     df_period_of_the_week = pd.DataFrame(data)
     sns.set(style="whitegrid")
@@ -183,10 +215,12 @@ def plot_period_of_the_week():
     plt.show()
 
 # Function for plotting year categorization
-def plot_year_categorization():
+def plot_year_categorization(cube=None):
+    cube = as_cube(cube)
     data = {
         'YEAR_CATEGORY': ['Early 2010s (2014-2016)', 'Late 2010s (2017-2019)', 'Early 2020s (2020-2022)', '2023 and 2024'],
-        'Count': [97946, 111368, 109871, 58905]
+        'Count': [cube.total(years=(2014, 2016)), cube.total(years=(2017, 2019)),
+                  cube.total(years=(2020, 2022)), cube.total(years=(2023, 2024))]
     }
     df_year_category = pd.DataFrame(data)
     sns.set(style="whitegrid")
@@ -205,28 +239,15 @@ def plot_year_categorization():
     plt.show()
 
 # Function for plotting crimes visualization per season
-def plot_crimes_per_season():
-    monthly_counts = {
-        'January': 32820,
-        'February': 29567,
-        'March': 32382,
-        'April': 28742,
-        'May': 31593,
-        'June': 31628,
-        'July': 32523,
-        'August': 32406,
-        'September': 31678,
-        'October': 32740,
-        'November': 31661,
-        'December': 30350
-    }
+def plot_crimes_per_season(cube=None):
+    cube = as_cube(cube)
     seasons = {
-        'Winter': ['December', 'January', 'February'],
-        'Spring': ['March', 'April', 'May'],
-        'Summer': ['June', 'July', 'August'],
-        'Fall': ['September', 'October', 'November']
+        'Winter': [12, 1, 2],
+        'Spring': [3, 4, 5],
+        'Summer': [6, 7, 8],
+        'Fall': [9, 10, 11]
     }
-    season_counts = {season: sum(monthly_counts[month] for month in months) for season, months in seasons.items()}
+    season_counts = {season: cube.total(months=months) for season, months in seasons.items()}
     df_seasons = pd.DataFrame(list(season_counts.items()), columns=['Season', 'Count'])
     sns.set(style="whitegrid")
     plt.figure(figsize=(10, 6))
@@ -241,7 +262,9 @@ def plot_crimes_per_season():
 
 # Function for plotting total crime count by type
 def plot_total_crime_count_by_type(dfmatrix, crime_columns):
-    total_counts = dfmatrix[crime_columns].sum().reset_index()
+    # The cube names crime types in upper case; bars keep the caller's names ('Assault')
+    names = {str(column).upper(): column for column in crime_columns}
+    total_counts = as_cube(dfmatrix).series('year', crime_types=list(names)).sum().rename(names).reset_index()
     total_counts.columns = ['Crime Type', 'Total Count']
     total_counts = total_counts.sort_values(by='Total Count', ascending=False)
     sns.set(style="whitegrid")
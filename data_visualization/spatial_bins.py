@@ -0,0 +1,104 @@
+"""Multi-resolution spatial bins for the crime heatmaps.
+
+All incidents are binned once, for every crime type, into a square grid
+over the Toronto bounding box at the finest level. Each coarser level sums
+2 x 2 blocks of the level below, so the whole pyramid comes from a single
+pass over the data and can be saved and reused:
+
+    pyramid = BinPyramid.from_frame(dfmatrix)
+    lat, long, weight = pyramid.bins('ASSAULT', level=3)   # non-empty cells only
+"""
+import numpy as np
+
+from count_cube import CRIME_TYPES, crime_counts
+
+# Toronto boundaries
+NORTH_BOUNDARY = 43.8554
+SOUTH_BOUNDARY = 43.5810
+EAST_BOUNDARY = -79.1161
+WEST_BOUNDARY = -79.6393
+
+BASE_CELLS = 16  # cells per side at level 0
+MAX_LEVEL = 5    # 512 x 512 cells, roughly 60 m x 80 m
+
+
+class BinPyramid:
+    """Per crime type incident counts on grids that double in resolution at each level."""
+
+    def __init__(self, levels, bounds, base_cells=BASE_CELLS):
+        self.levels = levels
+        self.bounds = bounds  # (south, west, north, east)
+        self.base_cells = base_cells
+
+    @property
+    def max_level(self):
+        return len(self.levels) - 1
+
+    @classmethod
+    def from_frame(cls, frame, bounds=(SOUTH_BOUNDARY, WEST_BOUNDARY, NORTH_BOUNDARY, EAST_BOUNDARY),
+                   base_cells=BASE_CELLS, max_level=MAX_LEVEL):
+        """Bin every incident of dfmatrix or the incident store, weighted by its per-type counts."""
+        south, west, north, east = bounds
+        cells = base_cells * 2 ** max_level
+        lat = frame['LAT_WGS84'].to_numpy(dtype=np.float64)
+        long = frame['LONG_WGS84'].to_numpy(dtype=np.float64)
+        inside = (lat >= south) & (lat <= north) & (long >= west) & (long <= east)
+
+        # Row 0 is the northern edge so the arrays read like a map
+        rows = np.minimum(((north - lat[inside]) / (north - south) * cells).astype(np.int64), cells - 1)
+        cols = np.minimum(((long[inside] - west) / (east - west) * cells).astype(np.int64), cells - 1)
+        index = rows * cells + cols
+        counts = crime_counts(frame)[inside]
+
+        finest = np.empty((len(CRIME_TYPES), cells, cells), dtype=np.float32)
+        for i in range(len(CRIME_TYPES)):
+            finest[i] = np.bincount(index, weights=counts[:, i], minlength=cells * cells).reshape(cells, cells)
+
+        levels = [finest]
+        for _ in range(max_level):
+            finer = levels[0]
+            size = finer.shape[1] // 2
+            levels.insert(0, finer.reshape(len(CRIME_TYPES), size, 2, size, 2).sum(axis=(2, 4)))
+        return cls(levels, bounds, base_cells)
+
+    def grid(self, crime_type, level):
+        """Return the (rows, cols) count array of one crime type at a level."""
+        return self.levels[level][CRIME_TYPES.index(crime_type)]
+
+    def cell_centers(self, level):
+        """Return the latitude (north to south) and longitude (west to east) of the cell centers."""
+        south, west, north, east = self.bounds
+        cells = self.base_cells * 2 ** level
+        lats = north - (np.arange(cells) + 0.5) * (north - south) / cells
+        longs = west + (np.arange(cells) + 0.5) * (east - west) / cells
+        return lats, longs
+
+    def bins(self, crime_type, level):
+        """Return (lat, long, weight) float32 arrays for the non-empty cells of a level."""
+        grid = self.grid(crime_type, level)
+        rows, cols = np.nonzero(grid)
+        lats, longs = self.cell_centers(level)
+        return lats[rows].astype(np.float32), longs[cols].astype(np.float32), grid[rows, cols]
+
+    def level_for(self, max_points):
+        """Return the finest level whose non-empty cells for any crime type stay under `max_points`."""
+        for level in range(self.max_level, -1, -1):
+            if np.count_nonzero(self.levels[level], axis=(1, 2)).max() <= max_points:
+                return level
+        return 0
+
+    def save(self, path):
+        np.savez_compressed(path, finest=self.levels[-1], bounds=np.asarray(self.bounds),
+                            base_cells=self.base_cells)
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved pyramid; coarser levels are rebuilt from the finest one."""
+        with np.load(path) as data:
+            levels = [data['finest']]
+            bounds = tuple(float(value) for value in data['bounds'])
+            base_cells = int(data['base_cells'])
+        while levels[0].shape[1] > base_cells:
+            size = levels[0].shape[1] // 2
+            levels.insert(0, levels[0].reshape(len(CRIME_TYPES), size, 2, size, 2).sum(axis=(2, 4)))
+        return cls(levels, bounds, base_cells)
@@ -0,0 +1,47 @@
+"""Call the plots on a small dfmatrix without a display.
+
+    python -m pytest data_visualization
+"""
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_visualizations
+from data_visualizations import plot_total_crime_count_by_type
+
+CRIMES = ['Assault', 'Auto Theft', 'Break and Enter', 'Homicide', 'Robbery', 'Theft Over']
+
+
+@pytest.fixture
+def dfmatrix():
+    rng = np.random.default_rng(0)
+    n = 200
+    dates = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 3 * 365, n), unit='D')
+    frame = pd.DataFrame({
+        'OCC_YEAR': dates.year, 'OCC_MONTH_NUM': dates.month, 'OCC_DAY': dates.day,
+        'OCC_DOW_NUM': (dates.dayofweek + 1) % 7 + 1, 'OCC_HOUR': rng.integers(0, 24, n),
+    })
+    crime = rng.integers(0, len(CRIMES), n)
+    for i, name in enumerate(CRIMES):
+        frame[name] = (crime == i).astype(np.int64)
+    return frame
+
+
+@pytest.fixture(autouse=True)
+def no_show(monkeypatch):
+    monkeypatch.setattr(data_visualizations.plt, 'show', lambda: None)
+    yield
+    plt.close('all')
+
+
+def test_total_crime_count_by_type_takes_dfmatrix_columns(dfmatrix):
+    plot_total_crime_count_by_type(dfmatrix, CRIMES[:3])
+
+    bars = {label.get_text(): patch.get_width()
+            for label, patch in zip(plt.gca().get_yticklabels(), plt.gca().patches)}
+    assert bars == {crime: dfmatrix[crime].sum() for crime in CRIMES[:3]}
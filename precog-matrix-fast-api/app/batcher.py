@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import os
+from collections import Counter, deque
+
+import numpy as np
+
+from app.concurrency import Overloaded
+from app.metrics import BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "0") == "1"
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", 64))
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", 2))
+MICROBATCH_MAX_QUEUE = int(os.getenv("MICROBATCH_MAX_QUEUE", 1024))
+
+
+class MicroBatcher:
+    """Collect concurrent single-row predictions and score them as one batch.
+
+    The first request to arrive opens a batch; it is flushed when it holds
+    `max_size` rows or `max_wait_ms` has passed, whichever comes first. Rows
+    are scored with `score(bundle, lat, lon, year, month, day, hour)` on the
+    given inference pool, one call per model version present in the batch.
+    """
+
+    def __init__(self, score, pool, max_size=MICROBATCH_MAX_SIZE, max_wait_ms=MICROBATCH_MAX_WAIT_MS,
+                 max_queue=MICROBATCH_MAX_QUEUE):
+        self.score = score
+        self.pool = pool
+        self.max_size = max_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.batch_sizes = Counter()
+        self._pending = deque()
+        self._arrived = None
+        self._full = None
+        self._task = None
+        self._flushing = set()
+
+    def start(self):
+        self._arrived = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, bundle, lat, lon, year, month, day, hour):
+        """Queue one row and return its probability vector once its batch is scored."""
+        if len(self._pending) >= self.max_queue:
+            raise Overloaded("Too many requests in queue, try again later.")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((bundle, (lat, lon, year, month, day, hour), future))
+        self._arrived.set()
+        if len(self._pending) >= self.max_size:
+            self._full.set()
+        return await future
+
+    async def _collect(self):
+        await self._arrived.wait()
+        if len(self._pending) < self.max_size:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.max_wait)
+            except asyncio.TimeoutError:
+                pass
+
+        batch = [self._pending.popleft() for _ in range(min(self.max_size, len(self._pending)))]
+        if len(self._pending) < self.max_size:
+            self._full.clear()
+        if not self._pending:
+            self._arrived.clear()
+        return batch
+
+    async def _flush(self, batch):
+        self.batch_sizes[len(batch)] += 1
+        BATCH_SIZE.observe(len(batch))
+        groups = {}
+        for item in batch:
+            groups.setdefault(item[0].version, []).append(item)
+
+        for items in groups.values():
+            bundle = items[0][0]
+            columns = list(zip(*(row for _, row, _ in items)))
+            try:
+                probabilities = await self.pool.run(self.score, bundle, *columns)
+            except Exception as e:
+                for _, _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future), row in zip(items, probabilities):
+                if not future.done():
+                    future.set_result(row[np.newaxis, :])
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Don't hold up collecting the next batch while this one is scored
+            task = asyncio.get_running_loop().create_task(self._flush(batch))
+            self._flushing.add(task)
+            task.add_done_callback(self._flushing.discard)
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def stats(self):
+        batches = sum(self.batch_sizes.values())
+        rows = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "batches": batches,
+            "rows": rows,
+            "mean_batch_size": rows / batches if batches else 0.0,
+            "max_batch_size": max(self.batch_sizes, default=0),
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "max_size": self.max_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
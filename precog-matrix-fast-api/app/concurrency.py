@@ -0,0 +1,63 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+PREDICT_WORKERS = int(os.getenv("PREDICT_WORKERS", os.cpu_count() or 1))
+PREDICT_MAX_QUEUE = int(os.getenv("PREDICT_MAX_QUEUE", 64))
+GEOCODE_CONCURRENCY = int(os.getenv("GEOCODE_CONCURRENCY", 16))
+GEOCODE_MAX_QUEUE = int(os.getenv("GEOCODE_MAX_QUEUE", 256))
+
+
+class Overloaded(Exception):
+    """Raised when a limiter's queue is full and the caller should back off."""
+
+
+class Limiter:
+    """Async concurrency limit that rejects instead of queueing without bound.
+
+    At most `concurrency` holders run at once and at most `max_waiting` wait
+    for a slot; anyone beyond that gets Overloaded straight away.
+    """
+
+    def __init__(self, concurrency, max_waiting):
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self):
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            raise Overloaded("Too many requests in queue, try again later.")
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.active -= 1
+        self._semaphore.release()
+
+
+class InferencePool:
+    """Dedicated, sized thread pool for CPU-bound feature building and inference.
+
+    NumPy and LightGBM release the GIL for the heavy parts, so threads give
+    real parallelism without copying the model into other processes.
+    """
+
+    def __init__(self, workers=PREDICT_WORKERS, max_queue=PREDICT_MAX_QUEUE):
+        self.workers = workers
+        self.limiter = Limiter(workers, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inference')
+
+    async def run(self, func, *args):
+        async with self.limiter:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
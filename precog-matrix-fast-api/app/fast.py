@@ -1,16 +1,37 @@
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Query, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from app.predict import main as predict_main
-from app.preproc import preproc, load_data, load_scaler
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from app.batcher import MICROBATCH_ENABLED, MicroBatcher
+from app.concurrency import GEOCODE_CONCURRENCY, GEOCODE_MAX_QUEUE, InferencePool, Limiter, Overloaded
+from app.predict import CLASS_NAMES, predict
+from app.features import encode_features, hourly_calendar, model_input
+from app.preproc import LAT_BOUNDS, LONG_BOUNDS, check_bounds, in_bounds
+from app.geocache import GeoCache
+from app.grid import GridCache, grid_shape
+from app.incident_store import INCIDENT_STORE_PATH, IncidentStore
+from app.metrics import (GEOCODE_SECONDS, METRICS_ENABLED, STAGE_SECONDS, MetricsMiddleware, ServiceCollector,
+                         latest_metrics, log_sampled, register_collector, timed)
+from app.nearby import NEARBY_MAX_RADIUS, NEARBY_MAX_RESULTS, NearbyIndex, crime_type_bits, parse_window
+from app.neighbourhoods import NEIGHBOURHOODS_PATH, NeighbourhoodIndex
+from app.registry import registry
+from app.resultcache import RESULT_CACHE_ENABLED, ResultCache
 from geopy.geocoders import GoogleV3
-from datetime import datetime
+from prometheus_client import CONTENT_TYPE_LATEST
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import json
+import httpx
+import numpy as np
 import os
 import logging
+import time
 
 app = FastAPI()
 
 # Setup logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
 
 app.add_middleware(
@@ -20,42 +41,199 @@ app.add_middleware(
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"]  # Allows all headers
 )
+app.add_middleware(MetricsMiddleware)
 
-# Simple in-memory cache for geocoding results
-geocode_cache = {}
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 10000))
+FORECAST_MAX_DAYS = int(os.getenv("FORECAST_MAX_DAYS", 30))
+FORECAST_CHUNK_HOURS = int(os.getenv("FORECAST_CHUNK_HOURS", 24))
+MAX_ASSIGN_POINTS = int(os.getenv("MAX_ASSIGN_POINTS", 1000000))
 
-def geocode_address(address):
-    if address in geocode_cache:
-        return geocode_cache[address]
+@app.on_event("startup")
+def load_model_registry():
+    # Load the model and scaler once per process instead of once per request;
+    # workers forked by app.serve inherit the parent's copy instead
+    if registry.version is None:
+        registry.load()
 
+    watch_interval = os.getenv("MODEL_WATCH_INTERVAL")
+    if watch_interval:
+        registry.watch(float(watch_interval))
+
+@app.on_event("shutdown")
+def stop_model_registry():
+    registry.stop()
+
+# CPU-bound preprocessing and predict_proba run here, off the event loop
+inference_pool = InferencePool()
+
+@app.on_event("shutdown")
+def stop_inference_pool():
+    inference_pool.shutdown()
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc):
+    return JSONResponse(status_code=429, content={"error": str(exc)}, headers={"Retry-After": "1"})
+
+def google_geocode(address):
     google_api_key = os.getenv("GOOGLE_API_KEY")
-    logger.debug(f"Google API Key: {GOOGLE_API_KEY}")
 
     if not google_api_key:
         raise ValueError("Google API Key is not set.")
 
-    geolocator = GoogleV3(api_key=GOOGLE_API_KEY)
-    logger.debug(f"Geolocator: {geolocator}")
+    geolocator = GoogleV3(api_key=google_api_key)
 
     try:
         location = geolocator.geocode(address)
-        logger.debug(f"Geocode result: {location}")
-
-        if location:
-            geocode_cache[address] = (location.latitude, location.longitude)
-            return location.latitude, location.longitude
-        else:
-            raise ValueError("Could not geocode the provided address.")
+        log_sampled(logger, logging.DEBUG, "Geocode result for %r: %s", address, location)
     except Exception as e:
         logger.error(f"Error during geocoding: {e}")
         raise ValueError(f"Error during geocoding: {e}")
 
+    if location:
+        return location.latitude, location.longitude
+    else:
+        raise ValueError("Could not geocode the provided address.")
+
+GOOGLE_GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+# Pooled async HTTP client for the Geocoding API, opened on startup
+http_client = None
+geocode_limiter = Limiter(GEOCODE_CONCURRENCY, GEOCODE_MAX_QUEUE)
+
+async def google_geocode_async(address):
+    google_api_key = os.getenv("GOOGLE_API_KEY")
+
+    if not google_api_key:
+        raise ValueError("Google API Key is not set.")
+
+    async with geocode_limiter:
+        try:
+            response = await http_client.get(GOOGLE_GEOCODE_URL, params={"address": address, "key": google_api_key})
+            response.raise_for_status()
+            payload = response.json()
+        except Exception as e:
+            logger.error(f"Error during geocoding: {e}")
+            raise ValueError(f"Error during geocoding: {e}")
+
+    if payload.get("status") == "OK":
+        location = payload["results"][0]["geometry"]["location"]
+        log_sampled(logger, logging.DEBUG, "Geocode result for %r: %s", address, location)
+        return location["lat"], location["lng"]
+    elif payload.get("status") == "ZERO_RESULTS":
+        raise ValueError("Could not geocode the provided address.")
+    else:
+        raise ValueError(f"Error during geocoding: {payload.get('status')} {payload.get('error_message', '')}".strip())
+
+# Persistent geocoding cache shared by all workers, opened on startup
+geocode_cache = None
+
+@app.on_event("startup")
+def open_geocode_cache():
+    global geocode_cache, http_client
+    http_client = httpx.AsyncClient(timeout=10)
+    geocode_cache = GeoCache(google_geocode, async_geocoder=google_geocode_async)
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await http_client.aclose()
+
+async def geocode_address(address):
+    start = time.perf_counter()
+    result, hit = await geocode_cache.ageocode_status(address)
+    if METRICS_ENABLED:
+        GEOCODE_SECONDS.labels("hit" if hit else "miss").observe(time.perf_counter() - start)
+    return result
+
+def score(bundle, lat, lon, year, month, day, hour):
+    """Encode and score rows with one model snapshot; runs on the inference pool."""
+    # Scaling is folded into the encoder's single pass, so it is timed with it
+    with timed(STAGE_SECONDS, "features"):
+        features = encode_features(lat, lon, year, month, day, hour, params=bundle.feature_params)
+    with timed(STAGE_SECONDS, "inference"):
+        return predict(model_input(features, bundle.model), bundle.model)
+
+# Optional server-side batching of concurrent single-row predictions
+batcher = MicroBatcher(score, inference_pool) if MICROBATCH_ENABLED else None
+
+@app.on_event("startup")
+async def start_batcher():
+    if batcher is not None:
+        batcher.start()
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    if batcher is not None:
+        await batcher.stop()
+
+# Neighbourhood polygons are optional; /predict only attaches them when the boundary file is present
+neighbourhood_index = None
+
+@app.on_event("startup")
+def load_neighbourhoods():
+    global neighbourhood_index
+    if neighbourhood_index is not None:
+        return
+    if os.path.exists(NEIGHBOURHOODS_PATH):
+        neighbourhood_index = NeighbourhoodIndex.load()
+        logger.info(f"Loaded {len(neighbourhood_index.names)} neighbourhoods from {NEIGHBOURHOODS_PATH}")
+    else:
+        logger.info(f"No neighbourhood boundaries at {NEIGHBOURHOODS_PATH}")
+
+# Historical incidents for /nearby, indexed once when the incident store has data
+nearby_index = None
+
+@app.on_event("startup")
+def load_nearby_index():
+    global nearby_index
+    if nearby_index is not None:
+        return
+    store = IncidentStore(INCIDENT_STORE_PATH)
+    if store.partitions():
+        nearby_index = NearbyIndex.from_store(store)
+        logger.info(f"Indexed {len(nearby_index)} incidents from {INCIDENT_STORE_PATH}")
+    else:
+        logger.info(f"No incident store at {INCIDENT_STORE_PATH}")
+
 @app.get("/")
 def index():
     return {"greeting": "PreCog Matrix"}
 
+@app.post("/admin/reload")
+def reload_model(x_admin_token: str = Header(None)):
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token or x_admin_token != admin_token:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    previous_version = registry.version
+    bundle = registry.load()
+    return {"previous_version": previous_version, "model_version": bundle.version}
+
+@app.get("/batcher/stats")
+def batcher_stats():
+    if batcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **batcher.stats()}
+
+# Optional cache of predictions by location cell and hour, in front of encoding and the model
+result_cache = ResultCache() if RESULT_CACHE_ENABLED else None
+if result_cache is not None:
+    registry.listeners.append(lambda bundle: result_cache.set_version(bundle.version))
+
+@app.get("/cache/stats")
+def result_cache_stats():
+    if result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **result_cache.stats()}
+
+# Expose geocode cache, model version, batcher and result cache state on /metrics
+register_collector(ServiceCollector(registry, lambda: geocode_cache, lambda: batcher, lambda: result_cache))
+
+@app.get("/metrics")
+def metrics():
+    return Response(content=latest_metrics(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/predict")
-def predict_query(address: str, crime_date: str):
+async def predict_query(address: str, crime_date: str):
     try:
         if not address:
             return {"error": "You must inform one address to predict"}
@@ -63,18 +241,267 @@ def predict_query(address: str, crime_date: str):
         crime_date = datetime.fromisoformat(crime_date)
         year, month, day, hour = crime_date.year, crime_date.month, crime_date.day, crime_date.hour
 
-        lat, lon = geocode_address(address + ', Toronto')
+        lat, lon = await geocode_address(address + ', Toronto')
+
+        # Take one snapshot so a concurrent reload can't mix model and scaler
+        bundle = registry.get()
+        check_bounds(lat, lon)
+        prediction = None
+        score_lat, score_lon = lat, lon
+        if result_cache is not None:
+            keys, found, score_lat, score_lon = result_cache.lookup(bundle, lat, lon, year, month, day, hour)
+            score_lat, score_lon = float(score_lat[0]), float(score_lon[0])
+            if found[0] is not None:
+                prediction = found[0][None, :]
 
-        model_path = 'models/crime_prediction_lightgbm_model.joblib'
-        df = load_data(lat, lon, year, month, day, hour)
-        scaler = load_scaler('models/scaler.joblib')
-        df_processed = preproc(df, scaler)
-        prediction = predict_main(model_path, df_processed, ["AUTO THEFT", "ASSAULT", "ROBBERY", "THEFT OVER", "BREAK AND ENTER", "HOMICIDE"])
+        if prediction is None:
+            if batcher is not None:
+                prediction = await batcher.submit(bundle, score_lat, score_lon, year, month, day, hour)
+            else:
+                prediction = await inference_pool.run(score, bundle, score_lat, score_lon, year, month, day, hour)
+            if result_cache is not None:
+                result_cache.store(bundle, keys, prediction)
 
-        return {"prediction": prediction.tolist()}
+        neighbourhood = None
+        if neighbourhood_index is not None:
+            with timed(STAGE_SECONDS, "neighbourhood"):
+                neighbourhood = neighbourhood_index.lookup(lat, lon)
+
+        with timed(STAGE_SECONDS, "serialization"):
+            content = {"prediction": prediction.tolist(), "model_version": bundle.version}
+            if neighbourhood_index is not None:
+                content["neighbourhood"] = neighbourhood
+            return JSONResponse(content)
+    except Overloaded:
+        raise
     except ValueError as e:
         logger.error(f"Error occurred: {e}")
         return {"error": str(e)}
     except Exception as e:
         logger.error(f"Error occurred: {e}")
         return {"error": str(e)}
+
+def score_hours(bundle, lat, lon, start, hours):
+    """Score `hours` consecutive hours at one location; runs on the inference pool."""
+    year, month, day, hour = hourly_calendar(start, hours)
+    return score(bundle, np.full(hours, lat), np.full(hours, lon), year, month, day, hour)
+
+@app.get("/forecast")
+async def forecast(address: str, start: Optional[str] = None, days: int = 7):
+    """Stream hourly probabilities for one address as NDJSON.
+
+    The first line describes the location and model; each following line is
+    {"time": ..., "prediction": [...]} for one hour, produced chunk by chunk.
+    """
+    try:
+        if not 1 <= days <= FORECAST_MAX_DAYS:
+            raise ValueError(f"days must be between 1 and {FORECAST_MAX_DAYS}")
+        start = datetime.fromisoformat(start) if start else datetime.now()
+        start = start.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+
+        lat, lon = await geocode_address(address + ', Toronto')
+        check_bounds(lat, lon)
+    except Overloaded:
+        raise
+    except Exception as e:
+        logger.error(f"Error occurred: {e}")
+        return {"error": str(e)}
+
+    bundle = registry.get()
+    total_hours = days * 24
+
+    async def lines():
+        yield json.dumps({"address": address, "lat": lat, "lon": lon, "start": start.isoformat(),
+                          "hours": total_hours, "classes": CLASS_NAMES, "model_version": bundle.version}) + "\n"
+        for offset in range(0, total_hours, FORECAST_CHUNK_HOURS):
+            chunk_start = start + timedelta(hours=offset)
+            hours = min(FORECAST_CHUNK_HOURS, total_hours - offset)
+            probabilities = await inference_pool.run(score_hours, bundle, lat, lon, chunk_start, hours)
+            yield "".join(
+                json.dumps({"time": (chunk_start + timedelta(hours=i)).isoformat(), "prediction": row}) + "\n"
+                for i, row in enumerate(probabilities.tolist())
+            )
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+class BatchItem(BaseModel):
+    address: Optional[str] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    crime_date: str
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+
+@app.post("/predict/batch")
+async def predict_batch(request: BatchRequest):
+    if len(request.items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} items per batch")
+
+    bundle = registry.get()
+    results = [None] * len(request.items)
+    rows = []  # (result index, lat, lon, datetime) for the rows that can be scored
+
+    # Geocode each distinct address once, a limited number at a time
+    addresses = list({item.address for item in request.items
+                      if item.address and (item.lat is None or item.lon is None)})
+    locations = {}
+    for start in range(0, len(addresses), GEOCODE_CONCURRENCY):
+        chunk = addresses[start:start + GEOCODE_CONCURRENCY]
+        found = await asyncio.gather(*(geocode_address(a + ', Toronto') for a in chunk), return_exceptions=True)
+        locations.update(zip(chunk, found))
+
+    for i, item in enumerate(request.items):
+        try:
+            crime_date = datetime.fromisoformat(item.crime_date)
+            if item.lat is not None and item.lon is not None:
+                lat, lon = item.lat, item.lon
+            elif item.address:
+                location = locations[item.address]
+                if isinstance(location, Exception):
+                    raise location
+                lat, lon = location
+            else:
+                raise ValueError("Each item needs an address or lat/lon")
+            rows.append((i, lat, lon, crime_date))
+        except Exception as e:
+            results[i] = {"error": str(e)}
+
+    if rows:
+        index, lats, lons, dates = zip(*rows)
+        mask = in_bounds(lats, lons)
+        for i, lat, lon, ok in zip(index, lats, lons, mask):
+            if not ok:
+                results[i] = {"error": f"Location ({lat}, {lon}) is out of bounds for Toronto."}
+
+        valid = np.flatnonzero(mask)
+        calendar = [[dates[j].year for j in valid], [dates[j].month for j in valid],
+                    [dates[j].day for j in valid], [dates[j].hour for j in valid]]
+        score_lats, score_lons = [lats[j] for j in valid], [lons[j] for j in valid]
+        if result_cache is not None and len(valid):
+            keys, found, score_lats, score_lons = result_cache.lookup(bundle, score_lats, score_lons, *calendar)
+            for j, cached in zip(valid, found):
+                if cached is not None:
+                    results[index[j]] = {"prediction": cached.tolist()}
+            missing = [k for k, cached in enumerate(found) if cached is None]
+            valid, keys = valid[missing], [keys[k] for k in missing]
+            score_lats, score_lons = score_lats[missing], score_lons[missing]
+            calendar = [[column[k] for k in missing] for column in calendar]
+
+        if len(valid):
+            # One feature matrix, one scaler pass and one predict_proba for the whole batch
+            probabilities = await inference_pool.run(score, bundle, score_lats, score_lons, *calendar)
+            if result_cache is not None:
+                result_cache.store(bundle, keys, probabilities)
+            for j, row in zip(valid, probabilities.tolist()):
+                results[index[j]] = {"prediction": row}
+
+    with timed(STAGE_SECONDS, "serialization"):
+        return JSONResponse({
+            "classes": CLASS_NAMES,
+            "model_version": bundle.version,
+            "results": results
+        })
+
+class AssignRequest(BaseModel):
+    lat: List[float]
+    lon: List[float]
+
+@app.post("/neighbourhoods/assign")
+async def assign_neighbourhoods(request: AssignRequest):
+    """Assign each point to a neighbourhood in one vectorized pass.
+
+    Returns the neighbourhood list once and, per point, its position in that
+    list (-1 when the point falls in none).
+    """
+    if neighbourhood_index is None:
+        raise HTTPException(status_code=503, detail="Neighbourhood boundaries are not loaded")
+    if len(request.lat) != len(request.lon):
+        raise HTTPException(status_code=400, detail="lat and lon must have the same length")
+    if len(request.lat) > MAX_ASSIGN_POINTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_ASSIGN_POINTS} points per request")
+
+    assigned = await inference_pool.run(neighbourhood_index.locate, request.lat, request.lon)
+    return {
+        "neighbourhoods": [{"id": i, "name": name} for i, name in zip(neighbourhood_index.ids, neighbourhood_index.names)],
+        "index": assigned.tolist(),
+    }
+
+@app.get("/nearby")
+async def nearby(lat: Optional[float] = None, lon: Optional[float] = None, address: Optional[str] = None,
+                 mode: str = "radius", radius: float = 500, k: int = 10, limit: int = 100,
+                 crime_type: Optional[List[str]] = Query(None), hours: Optional[str] = None,
+                 dows: Optional[str] = None):
+    """Historical incidents around a point (lat/lon) or an address.
+
+    mode=radius returns the incidents within `radius` metres, nearest first
+    (at most `limit`, with the full count); mode=knn the `k` nearest within
+    `radius`; mode=count only the count. crime_type may be repeated; hours
+    (0-23) and dows (1=Sunday ... 7=Saturday) take windows like 22-3 or 1,7.
+    """
+    if nearby_index is None:
+        raise HTTPException(status_code=503, detail="Incident store is not loaded")
+    if mode not in ("radius", "knn", "count"):
+        raise HTTPException(status_code=400, detail="mode must be radius, knn or count")
+    if not 0 < radius <= NEARBY_MAX_RADIUS:
+        raise HTTPException(status_code=400, detail=f"radius must be between 0 and {NEARBY_MAX_RADIUS} metres")
+    if not (0 < limit <= NEARBY_MAX_RESULTS and 0 < k <= NEARBY_MAX_RESULTS):
+        raise HTTPException(status_code=400, detail=f"limit and k must be between 1 and {NEARBY_MAX_RESULTS}")
+
+    try:
+        crime_type_bits(crime_type or [])
+        hours_window = parse_window(hours, 0, 23) if hours else None
+        dows_window = parse_window(dows, 1, 7) if dows else None
+        if address:
+            lat, lon = await geocode_address(address + ', Toronto')
+        elif lat is None or lon is None:
+            raise ValueError("Pass lat and lon, or an address.")
+        check_bounds(lat, lon)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    result = await inference_pool.run(nearby_index.query, mode, lat, lon, radius, k, limit,
+                                      crime_type, hours_window, dows_window)
+    return {"mode": mode, "center": {"lat": lat, "lon": lon}, "radius": radius, **result}
+
+grid_cache = GridCache()
+
+@app.get("/grid")
+async def risk_grid(crime_date: str, level: int = 0, format: str = "json", dtype: str = "float32"):
+    """Per-class probability rasters over the Toronto bounding box for one hour.
+
+    Rasters are ordered (class, row, col) with row 0 at the north edge. The
+    binary format returns the raw array with its layout in the headers;
+    dtype=uint8 scales probabilities to 0-255.
+    """
+    try:
+        crime_date = datetime.fromisoformat(crime_date)
+        rows, cols = grid_shape(level)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if format not in ("json", "binary") or dtype not in ("float32", "uint8"):
+        raise HTTPException(status_code=400, detail="format must be json or binary, dtype float32 or uint8")
+
+    bundle = registry.get()
+    raster = await inference_pool.run(grid_cache.get, bundle, crime_date.year, crime_date.month,
+                                      crime_date.day, crime_date.hour, level)
+    if dtype == "uint8":
+        raster = np.rint(raster * 255).astype(np.uint8)
+
+    layout = {
+        "classes": CLASS_NAMES,
+        "shape": [len(CLASS_NAMES), rows, cols],
+        "bounds": {"south": LAT_BOUNDS[0], "north": LAT_BOUNDS[1], "west": LONG_BOUNDS[0], "east": LONG_BOUNDS[1]},
+        "level": level,
+        "dtype": dtype,
+        "model_version": bundle.version,
+    }
+    if format == "binary":
+        headers = {
+            "X-Grid-Shape": ",".join(map(str, layout["shape"])),
+            "X-Grid-Bounds": f"{LAT_BOUNDS[0]},{LONG_BOUNDS[0]},{LAT_BOUNDS[1]},{LONG_BOUNDS[1]}",
+            "X-Grid-Dtype": dtype,
+            "X-Model-Version": bundle.version,
+        }
+        return Response(content=raster.tobytes(), media_type="application/octet-stream", headers=headers)
+    return {**layout, "values": raster.tolist()}
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+from app.preproc import load_data_batch, preproc
+
+# Columns in the order scaler.transform expects them
+FEATURE_COLUMNS = ['LAT_WGS84', 'LONG_WGS84', 'OCC_YEAR', 'MONTH_SIN', 'MONTH_COS',
+                   'HOUR_SIN', 'HOUR_COS', 'OCC_DAY_SIN', 'OCC_DAY_COS',
+                   'OCC_DOY_SIN', 'OCC_DOY_COS', 'OCC_DOW_SIN', 'OCC_DOW_COS']
+
+# Columns in the order preproc() hands them to the model
+MODEL_COLUMNS = ['LAT_WGS84', 'LONG_WGS84', 'OCC_YEAR',
+                 'HOUR_SIN', 'HOUR_COS', 'OCC_DAY_SIN', 'OCC_DAY_COS',
+                 'MONTH_SIN', 'MONTH_COS', 'OCC_DOW_SIN', 'OCC_DOW_COS',
+                 'OCC_DOY_SIN', 'OCC_DOY_COS']
+
+# Cycle length of each calendar feature, as in add_trigonometric_features
+CYCLE_LENGTHS = {'HOUR': 24, 'OCC_DAY': 31, 'MONTH': 12, 'OCC_DOW': 7, 'OCC_DOY': 365}
+# Inclusive range of the calendar values behind each cyclic feature
+CYCLE_RANGES = {'HOUR': (0, 23), 'OCC_DAY': (1, 31), 'MONTH': (1, 12), 'OCC_DOW': (1, 7), 'OCC_DOY': (1, 366)}
+
+
+def calendar_fields(year, month, day):
+    """Return (OCC_DOW, OCC_DOY) arrays with Sunday=1 ... Saturday=7."""
+    year = np.asarray(year, dtype=np.int64)
+    month = np.asarray(month, dtype=np.int64)
+    day = np.asarray(day, dtype=np.int64)
+
+    first_of_month = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    dates = first_of_month.astype('datetime64[D]') + (day - 1)
+    if np.any((month < 1) | (month > 12) | (day < 1) |
+              (dates.astype('datetime64[M]') != first_of_month)):
+        raise ValueError("Invalid date in input.")
+
+    days = dates.astype(np.int64)  # days since 1970-01-01, a Thursday
+    first_of_year = ((year - 1970) * 12).astype('datetime64[M]').astype('datetime64[D]')
+    dow = (days + 4) % 7 + 1
+    doy = (dates - first_of_year).astype(np.int64) + 1
+    return dow, doy
+
+
+def hourly_calendar(start, hours):
+    """Return (year, month, day, hour) arrays for `hours` consecutive hours from `start`."""
+    times = np.datetime64(start, 'h') + np.arange(hours)
+    dates = times.astype('datetime64[D]')
+    months = times.astype('datetime64[M]')
+    year = months.astype('datetime64[Y]').astype(np.int64) + 1970
+    month = months.astype(np.int64) % 12 + 1
+    day = (dates - months.astype('datetime64[D]')).astype(np.int64) + 1
+    hour = (times - dates.astype('datetime64[h]')).astype(np.int64)
+    return year, month, day, hour
+
+
+def cyclic_feature(column, values):
+    """Return the sine or cosine feature `column` (e.g. 'HOUR_SIN') of the calendar values."""
+    base, func = column.rsplit('_', 1)
+    angle = 2 * np.pi * values / CYCLE_LENGTHS[base]
+    return np.sin(angle) if func == 'SIN' else np.cos(angle)
+
+
+def feature_values():
+    """Return, per MODEL_COLUMNS feature, every unscaled value it can take, or None if it is not cyclic."""
+    values = []
+    for column in MODEL_COLUMNS:
+        base = column.rsplit('_', 1)[0]
+        if base in CYCLE_RANGES:
+            first, last = CYCLE_RANGES[base]
+            values.append(np.unique(cyclic_feature(column, np.arange(first, last + 1, dtype=np.int64))))
+        else:
+            values.append(None)
+    return values
+
+
+def scaler_params(scaler):
+    """Return per-feature (mean, scale) arrays ordered like MODEL_COLUMNS."""
+    names = list(getattr(scaler, 'feature_names_in_', FEATURE_COLUMNS))
+    n = len(names)
+    mean = scaler.mean_ if getattr(scaler, 'with_mean', True) and scaler.mean_ is not None else np.zeros(n)
+    scale = scaler.scale_ if getattr(scaler, 'with_std', True) and scaler.scale_ is not None else np.ones(n)
+    order = [names.index(column) for column in MODEL_COLUMNS]
+    return np.asarray(mean, dtype=np.float64)[order], np.asarray(scale, dtype=np.float64)[order]
+
+
+def encode_features(lat, long, year, month, day, hour, scaler=None, params=None):
+    """Build the scaled model input for one or many rows without pandas.
+
+    Produces the same values, bit for bit, as load_data_batch followed by
+    preproc, as an (N, 13) float64 array in MODEL_COLUMNS order. Scaling is
+    applied column by column while the matrix is filled; pass `params` from
+    scaler_params() to skip the lookup on the hot path.
+    """
+    lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+    long = np.atleast_1d(np.asarray(long, dtype=np.float64))
+    year = np.atleast_1d(np.asarray(year, dtype=np.int64))
+    month = np.atleast_1d(np.asarray(month, dtype=np.int64))
+    day = np.atleast_1d(np.asarray(day, dtype=np.int64))
+    hour = np.atleast_1d(np.asarray(hour, dtype=np.int64))
+    dow, doy = calendar_fields(year, month, day)
+
+    if params is None and scaler is not None:
+        params = scaler_params(scaler)
+
+    raw = {'LAT_WGS84': lat, 'LONG_WGS84': long, 'OCC_YEAR': year}
+    cyclic = {'HOUR': hour, 'OCC_DAY': day, 'MONTH': month, 'OCC_DOW': dow, 'OCC_DOY': doy}
+
+    out = np.empty((len(lat), len(MODEL_COLUMNS)), dtype=np.float64)
+    for j, column in enumerate(MODEL_COLUMNS):
+        if column in raw:
+            values = raw[column]
+        else:
+            values = cyclic_feature(column, cyclic[column.rsplit('_', 1)[0]])
+        if params is not None:
+            out[:, j] = (values - params[0][j]) / params[1][j]
+        else:
+            out[:, j] = values
+    return out
+
+
+def to_frame(features):
+    """Wrap an encoded matrix with the column names preproc() gives the model."""
+    return pd.DataFrame(features, columns=MODEL_COLUMNS, copy=False)
+
+
+def model_input(features, model):
+    """Pass the matrix straight to engines that take arrays, else wrap it for LightGBM."""
+    return features if getattr(model, 'accepts_arrays', False) else to_frame(features)
+
+
+def matches_pandas_path(scaler, lat, long, year, month, day, hour):
+    """Check encode_features against load_data_batch + preproc for exact equality."""
+    expected = preproc(load_data_batch(lat, long, year, month, day, hour), scaler)
+    actual = encode_features(lat, long, year, month, day, hour, scaler=scaler)
+    return (list(expected.columns) == MODEL_COLUMNS and
+            np.array_equal(expected.to_numpy(dtype=np.float64), actual))
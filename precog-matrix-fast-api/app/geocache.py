@@ -0,0 +1,267 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", 'geocode_cache.sqlite3')
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", 100000))
+GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", 30 * 24 * 3600))  # seconds
+# Rows allowed past max_entries before the least recently used are evicted
+EVICTION_SLACK = 0.1
+# In-memory hits whose access time is written to SQLite in one statement
+TOUCH_BATCH = 256
+
+# Spellings that refer to the same place, mapped to one form
+ABBREVIATIONS = {
+    'street': 'st', 'avenue': 'ave', 'road': 'rd', 'drive': 'dr', 'boulevard': 'blvd',
+    'crescent': 'cres', 'court': 'crt', 'place': 'pl', 'square': 'sq', 'lane': 'ln',
+    'west': 'w', 'east': 'e', 'north': 'n', 'south': 's',
+    'ontario': 'on', 'canada': '',
+}
+
+
+class LookupAbandoned(Exception):
+    """Handed to the waiters of a lookup whose leader was cancelled; they retry it themselves."""
+
+
+def normalize_address(address):
+    """Reduce an address to a canonical key so near-identical strings share an entry."""
+    address = unicodedata.normalize('NFKC', address).lower()
+    words = re.sub(r'[^\w\s]', ' ', address).split()
+    return ' '.join(w for w in (ABBREVIATIONS.get(word, word) for word in words) if w)
+
+
+class GeoCache:
+    """Bounded geocode cache backed by SQLite, shared by every worker on the host.
+
+    A small in-process LRU sits in front of the database. Entries expire after
+    `ttl` seconds. Once the table grows more than EVICTION_SLACK past
+    `max_entries`, the least recently used rows are evicted in one batch;
+    hits served from memory refresh their access time in SQLite TOUCH_BATCH
+    at a time, and before every eviction this process runs. Concurrent
+    lookups of the same address in this process wait on a single call to
+    `geocoder` (or the coroutine `async_geocoder` when using `ageocode`)
+    instead of each calling it; `ageocode` runs its SQLite reads and writes
+    in a worker thread so the event loop never waits on the database.
+    """
+
+    def __init__(self, geocoder, path=GEOCODE_CACHE_PATH, max_entries=GEOCODE_CACHE_SIZE,
+                 ttl=GEOCODE_CACHE_TTL, memory_entries=1024, async_geocoder=None):
+        self.geocoder = geocoder
+        self.async_geocoder = async_geocoder
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._touched = {}
+        self._writes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._execute("CREATE TABLE IF NOT EXISTS geocode ("
+                      "key TEXT PRIMARY KEY, lat REAL, lon REAL, created REAL, accessed REAL)")
+        self._execute("CREATE INDEX IF NOT EXISTS geocode_accessed ON geocode (accessed)")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql, params=()):
+        return self._connection().execute(sql, params)
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _cached(self, key, now):
+        """Return (lat, lon) for a key from the in-process LRU, or None."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if now - entry[2] > self.ttl:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self._touched[key] = now
+            return entry[0], entry[1]
+
+    def _touches_due(self):
+        return len(self._touched) >= TOUCH_BATCH
+
+    def _flush_touches(self):
+        """Write the access times of the in-memory hits to SQLite."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            self._connection().executemany("UPDATE geocode SET accessed = ? WHERE key = ?",
+                                           [(accessed, key) for key, accessed in touched.items()])
+
+    def _load(self, key, now):
+        row = self._execute("SELECT lat, lon, created FROM geocode WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if now - row[2] > self.ttl:
+            self._execute("DELETE FROM geocode WHERE key = ?", (key,))
+            return None
+        self._execute("UPDATE geocode SET accessed = ? WHERE key = ?", (now, key))
+        self._remember(key, row)
+        return row[0], row[1]
+
+    def _write(self, key, lat, lon, now):
+        self._execute("INSERT OR REPLACE INTO geocode (key, lat, lon, created, accessed) "
+                      "VALUES (?, ?, ?, ?, ?)", (key, lat, lon, now, now))
+        with self._lock:
+            self._writes += 1
+            due = self._writes >= max(1, int(self.max_entries * EVICTION_SLACK))
+            if due:
+                self._writes = 0
+        if due:
+            self._evict()
+
+    def _evict(self):
+        (count,) = self._execute("SELECT COUNT(*) FROM geocode").fetchone()
+        if count > self.max_entries * (1 + EVICTION_SLACK):
+            self._flush_touches()
+            self._execute("DELETE FROM geocode WHERE key IN (SELECT key FROM geocode "
+                          "ORDER BY accessed LIMIT ?)", (count - self.max_entries,))
+
+    def lookup(self, key):
+        """Return cached (lat, lon) for a normalized key, or None."""
+        now = time.time()
+        cached = self._cached(key, now)
+        if cached is None:
+            return self._load(key, now)
+        if self._touches_due():
+            self._flush_touches()
+        return cached
+
+    async def alookup(self, key):
+        """Async variant of lookup() that reads SQLite in a worker thread."""
+        now = time.time()
+        cached = self._cached(key, now)
+        if cached is None:
+            return await asyncio.to_thread(self._load, key, now)
+        if self._touches_due():
+            await asyncio.to_thread(self._flush_touches)
+        return cached
+
+    def store(self, key, lat, lon):
+        now = time.time()
+        self._remember(key, (lat, lon, now))
+        self._write(key, lat, lon, now)
+
+    def _claim(self, key):
+        """Return (future, leader) for a key, registering a new in-flight lookup if none."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _settle(self, key, future, result=None, error=None):
+        """Remember a result in memory and hand the outcome to the waiters."""
+        if error is None:
+            self._remember(key, (*result, time.time()))
+        with self._lock:
+            del self._inflight[key]
+        if not future.done():
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def geocode(self, address):
+        """Return (lat, lon) for an address, calling the geocoder at most once per key."""
+        key = normalize_address(address)
+        while True:
+            cached = self.lookup(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+
+            future, leader = self._claim(key)
+            if not leader:
+                try:
+                    result = future.result()
+                except LookupAbandoned:
+                    continue
+                self.hits += 1
+                return result
+
+            self.misses += 1
+            try:
+                result = tuple(self.geocoder(address))
+            except Exception as e:
+                self._settle(key, future, error=e)
+                raise
+            try:
+                self._write(key, *result, time.time())
+            finally:
+                self._settle(key, future, result)
+            return result
+
+    async def ageocode(self, address):
+        """Async variant of geocode() that awaits `async_geocoder` on a miss."""
+        result, _ = await self.ageocode_status(address)
+        return result
+
+    async def ageocode_status(self, address):
+        """Like ageocode() but return ((lat, lon), hit) where hit means no geocoder call was made.
+
+        A waiter that is cancelled leaves the shared lookup running for the
+        others; if the leader is cancelled, its waiters retry the lookup.
+        """
+        key = normalize_address(address)
+        while True:
+            cached = await self.alookup(key)
+            if cached is not None:
+                self.hits += 1
+                return cached, True
+
+            future, leader = self._claim(key)
+            if not leader:
+                try:
+                    result = await asyncio.shield(asyncio.wrap_future(future))
+                except LookupAbandoned:
+                    continue
+                self.hits += 1
+                return result, True
+
+            self.misses += 1
+            try:
+                result = tuple(await self.async_geocoder(address))
+            except Exception as e:
+                self._settle(key, future, error=e)
+                raise
+            except BaseException:
+                self._settle(key, future, error=LookupAbandoned())
+                raise
+            try:
+                await asyncio.to_thread(self._write, key, *result, time.time())
+            finally:
+                self._settle(key, future, result)
+            return result, False
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+        self._execute("DELETE FROM geocode")
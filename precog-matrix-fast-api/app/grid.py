@@ -0,0 +1,88 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+from app.features import encode_features, model_input
+from app.predict import predict
+from app.preproc import LAT_BOUNDS, LONG_BOUNDS
+
+GRID_BASE_CELLS = int(os.getenv("GRID_BASE_CELLS", 32))  # cells per side at level 0
+GRID_MAX_LEVEL = int(os.getenv("GRID_MAX_LEVEL", 3))
+GRID_CACHE_SIZE = int(os.getenv("GRID_CACHE_SIZE", 64))
+
+
+def grid_shape(level):
+    """Return (rows, cols) of the raster at a zoom level; each level doubles both."""
+    if not 0 <= level <= GRID_MAX_LEVEL:
+        raise ValueError(f"Level must be between 0 and {GRID_MAX_LEVEL}.")
+    cells = GRID_BASE_CELLS * 2 ** level
+    return cells, cells
+
+
+def cell_centers(level):
+    """Return the latitude (north to south) and longitude (west to east) of the cell centers."""
+    rows, cols = grid_shape(level)
+    lat_step = (LAT_BOUNDS[1] - LAT_BOUNDS[0]) / rows
+    long_step = (LONG_BOUNDS[1] - LONG_BOUNDS[0]) / cols
+    lats = LAT_BOUNDS[1] - (np.arange(rows) + 0.5) * lat_step
+    longs = LONG_BOUNDS[0] + (np.arange(cols) + 0.5) * long_step
+    return lats, longs
+
+
+def compute_grid(bundle, year, month, day, hour, level):
+    """Score every cell of a level in one pass; returns float32 (classes, rows, cols)."""
+    lats, longs = cell_centers(level)
+    lat, lon = np.meshgrid(lats, longs, indexing='ij')
+    n = lat.size
+    features = encode_features(lat.ravel(), lon.ravel(), np.full(n, year), np.full(n, month),
+                               np.full(n, day), np.full(n, hour), params=bundle.feature_params)
+    probabilities = predict(model_input(features, bundle.model), bundle.model)
+    return np.ascontiguousarray(
+        probabilities.astype(np.float32).T.reshape(-1, len(lats), len(longs)))
+
+
+class GridCache:
+    """LRU of computed rasters keyed by (model version, hour bucket, level).
+
+    Requests that miss on the same key while it is being computed wait for
+    that one computation instead of each scoring the whole grid.
+    """
+
+    def __init__(self, max_entries=GRID_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def get(self, bundle, year, month, day, hour, level):
+        key = (bundle.version, year, month, day, hour, level)
+        with self._lock:
+            raster = self._entries.get(key)
+            if raster is not None:
+                self._entries.move_to_end(key)
+                return raster
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            raster = compute_grid(bundle, year, month, day, hour, level)
+            raster.flags.writeable = False
+        except Exception as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._entries[key] = raster
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            del self._inflight[key]
+        future.set_result(raster)
+        return raster
@@ -0,0 +1,184 @@
+"""Partitioned, memory-mapped store of cleaned incidents.
+
+The cleaned matrix is written as one uncompressed Arrow IPC file per month
+under hive-style directories (`OCC_YEAR=2023/OCC_MONTH=5/part.arrow`), so a
+query opens only the partitions it needs and reads the projected columns
+straight from the page cache without copying them:
+
+    store = IncidentStore('raw_data/incidents')
+    assaults = store.query(['LAT_WGS84', 'LONG_WGS84'], years=(2022, 2023),
+                           crime_types=['ASSAULT'], bbox=(43.64, -79.40, 43.67, -79.37))
+"""
+import argparse
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+INCIDENT_STORE_PATH = os.getenv("INCIDENT_STORE_PATH", 'raw_data/incidents')
+
+CRIME_TYPES = ["ASSAULT", "AUTO THEFT", "BREAK AND ENTER", "HOMICIDE", "ROBBERY", "THEFT OVER"]
+
+# Column name in the store -> (column in dfmatrix, dtype)
+SCHEMA = {
+    'EVENT_UNIQUE_ID': ('EVENT_UNIQUE_ID', pa.string()),
+    'LAT_WGS84': ('LAT_WGS84', pa.float32()),
+    'LONG_WGS84': ('LONG_WGS84', pa.float32()),
+    'OCC_YEAR': ('OCC_YEAR', pa.int16()),
+    'OCC_MONTH': ('OCC_MONTH_NUM', pa.int8()),
+    'OCC_DAY': ('OCC_DAY', pa.int8()),
+    'OCC_HOUR': ('OCC_HOUR', pa.int8()),
+    'OCC_DOW': ('OCC_DOW_NUM', pa.int8()),  # Sunday = 1 ... Saturday = 7
+    'OCC_DOY': ('OCC_DOY', pa.int16()),
+}
+STORE_SCHEMA = pa.schema(
+    [(name, dtype) for name, (_, dtype) in SCHEMA.items()]
+    + [('MCI_CATEGORY', pa.dictionary(pa.int8(), pa.string()))]
+    + [(crime, pa.int8()) for crime in CRIME_TYPES])
+PARTITION_PATTERN = re.compile(r'OCC_YEAR=(\d+)/OCC_MONTH=(\d+)$')
+PART_FILE = 'part.arrow'
+
+
+def to_table(dfmatrix):
+    """Convert a cleaned `dfmatrix` to the store schema.
+
+    Crime counts become int8 columns named as in CRIME_TYPES, and
+    MCI_CATEGORY holds the event's main crime type as a dictionary column.
+    """
+    columns = {name: pa.array(dfmatrix[source].to_numpy(), type=dtype)
+               for name, (source, dtype) in SCHEMA.items()}
+
+    by_upper = {str(column).upper(): column for column in dfmatrix.columns}
+    counts = np.zeros((len(dfmatrix), len(CRIME_TYPES)), dtype=np.int8)
+    for i, crime in enumerate(CRIME_TYPES):
+        if crime in by_upper:
+            counts[:, i] = dfmatrix[by_upper[crime]].to_numpy()
+    main = pd.Categorical.from_codes(counts.argmax(axis=1), categories=CRIME_TYPES)
+    columns['MCI_CATEGORY'] = pa.DictionaryArray.from_arrays(
+        pa.array(main.codes, type=pa.int8()), pa.array(CRIME_TYPES))
+    for i, crime in enumerate(CRIME_TYPES):
+        columns[crime] = pa.array(counts[:, i])
+    return pa.table(columns, schema=STORE_SCHEMA)
+
+
+def partition_path(root, year, month):
+    return os.path.join(root, f'OCC_YEAR={year}', f'OCC_MONTH={month}', PART_FILE)
+
+
+def write_partition(path, table):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def write_store(dfmatrix, root=INCIDENT_STORE_PATH, append=False):
+    """Write the matrix partitioned by year and month; return the partitions written.
+
+    Partitions present in `dfmatrix` are replaced, or extended with the new
+    rows when `append` is true. Other partitions are left untouched, so a
+    monthly release only rewrites the months it contains.
+    """
+    table = to_table(dfmatrix)
+    keys = pd.DataFrame({'year': dfmatrix['OCC_YEAR'].to_numpy(), 'month': dfmatrix['OCC_MONTH_NUM'].to_numpy()})
+    written = []
+    for (year, month), rows in keys.groupby(['year', 'month']).indices.items():
+        path = partition_path(root, int(year), int(month))
+        part = table.take(pa.array(rows))
+        if append and os.path.exists(path):
+            part = pa.concat_tables([read_partition(path), part])
+        write_partition(path, part.combine_chunks())
+        written.append((int(year), int(month)))
+    return written
+
+
+def read_partition(path):
+    """Open a partition through a memory map; columns reference the mapped file."""
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+class IncidentStore:
+    """Query interface over a partitioned incident directory."""
+
+    def __init__(self, root=INCIDENT_STORE_PATH):
+        self.root = root
+
+    def partitions(self, years=None, months=None):
+        """Return [(year, month, path)] sorted by time, pruned by inclusive `years` range and `months`."""
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for directory, _, files in os.walk(self.root):
+            match = PARTITION_PATTERN.search(os.path.relpath(directory, self.root).replace(os.sep, '/'))
+            if match is None or PART_FILE not in files:
+                continue
+            year, month = int(match.group(1)), int(match.group(2))
+            if years is not None and not years[0] <= year <= years[1]:
+                continue
+            if months is not None and month not in months:
+                continue
+            found.append((year, month, os.path.join(directory, PART_FILE)))
+        return sorted(found)
+
+    def scan(self, columns=None, years=None, months=None, crime_types=None, bbox=None):
+        """Return a pyarrow Table of the matching incidents.
+
+        `columns` projects the result, `years` is an inclusive (first, last)
+        range and `months` a collection of month numbers, both resolved from
+        the directory names before any file is opened. `crime_types` keeps
+        events with at least one incident of those types and `bbox` is
+        (south, west, north, east).
+        """
+        tables = []
+        for _, _, path in self.partitions(years, months):
+            table = read_partition(path)
+            mask = None
+            if crime_types:
+                mask = pc.greater(table[crime_types[0]], 0)
+                for crime in crime_types[1:]:
+                    mask = pc.or_(mask, pc.greater(table[crime], 0))
+            if bbox is not None:
+                south, west, north, east = bbox
+                lat, long = table['LAT_WGS84'], table['LONG_WGS84']
+                inside = pc.and_(pc.and_(pc.greater_equal(lat, south), pc.less_equal(lat, north)),
+                                 pc.and_(pc.greater_equal(long, west), pc.less_equal(long, east)))
+                mask = inside if mask is None else pc.and_(mask, inside)
+            if columns is not None:
+                table = table.select(columns)
+            if mask is not None:
+                table = table.filter(mask)
+            tables.append(table)
+
+        if not tables:
+            return self.empty(columns)
+        return pa.concat_tables(tables)
+
+    def query(self, columns=None, **filters):
+        """Like scan() but return a pandas DataFrame."""
+        return self.scan(columns, **filters).to_pandas()
+
+    def empty(self, columns=None):
+        schema = STORE_SCHEMA
+        if columns is not None:
+            schema = pa.schema([schema.field(column) for column in columns])
+        return schema.empty_table()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a cleaned matrix into the partitioned incident store.")
+    parser.add_argument('matrix', help='Parquet file written by data_cleaning.py')
+    parser.add_argument('--root', default=INCIDENT_STORE_PATH)
+    parser.add_argument('--append', action='store_true', help='add rows to existing partitions instead of replacing them')
+    args = parser.parse_args()
+
+    written = write_store(pd.read_parquet(args.matrix), args.root, args.append)
+    print(f"Wrote {len(written)} partitions to {args.root}")
+
+
+if __name__ == '__main__':
+    main()
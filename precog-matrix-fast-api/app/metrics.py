@@ -0,0 +1,139 @@
+import os
+import random
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.01))
+# Set by app.serve so every forked worker writes its samples where /metrics can merge them
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Buckets from 50us to 5s, to cover both cache hits and network geocodes
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+STAGE_SECONDS = Histogram('precog_stage_seconds', 'Time spent in each request stage',
+                          ['stage'], buckets=LATENCY_BUCKETS)
+GEOCODE_SECONDS = Histogram('precog_geocode_seconds', 'Geocoding time by cache outcome',
+                            ['cache'], buckets=LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram('precog_request_seconds', 'End-to-end request time',
+                            ['path'], buckets=LATENCY_BUCKETS)
+REQUESTS = Counter('precog_requests', 'Requests by path and status', ['path', 'status'])
+IN_FLIGHT = Gauge('precog_requests_in_flight', 'Requests currently being served', multiprocess_mode='livesum')
+BATCH_SIZE = Histogram('precog_microbatch_size', 'Rows per micro-batch flush',
+                       buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+
+class timed:
+    """Context manager observing the elapsed time of a block into a histogram child."""
+
+    __slots__ = ('child', 'start')
+
+    def __init__(self, histogram, *labels):
+        self.child = histogram.labels(*labels) if METRICS_ENABLED else None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.child is not None:
+            self.child.observe(time.perf_counter() - self.start)
+
+
+def log_sampled(logger, level, msg, *args):
+    """Log only a LOG_SAMPLE_RATE fraction of calls; formatting is skipped for the rest."""
+    if random.random() < LOG_SAMPLE_RATE and logger.isEnabledFor(level):
+        logger.log(level, msg, *args)
+
+
+class ServiceCollector:
+    """Read cache, model and batcher state at scrape time instead of on the hot path."""
+
+    def __init__(self, registry, get_geocode_cache, get_batcher=lambda: None, get_result_cache=lambda: None):
+        self.registry = registry
+        self.get_geocode_cache = get_geocode_cache
+        self.get_batcher = get_batcher
+        self.get_result_cache = get_result_cache
+
+    def collect(self):
+        version = GaugeMetricFamily('precog_model_info', 'Model version being served', labels=['version'])
+        version.add_metric([self.registry.version or ''], 1)
+        yield version
+
+        cache = self.get_geocode_cache()
+        if cache is not None:
+            lookups = CounterMetricFamily('precog_geocode_cache_lookups', 'Geocode cache lookups',
+                                          labels=['result'])
+            lookups.add_metric(['hit'], cache.hits)
+            lookups.add_metric(['miss'], cache.misses)
+            yield lookups
+            total = cache.hits + cache.misses
+            yield GaugeMetricFamily('precog_geocode_cache_hit_ratio', 'Geocode cache hit ratio',
+                                    value=cache.hits / total if total else 0.0)
+
+        batcher = self.get_batcher()
+        if batcher is not None:
+            yield GaugeMetricFamily('precog_microbatch_pending', 'Rows waiting for a micro-batch',
+                                    value=batcher.pending)
+
+        result_cache = self.get_result_cache()
+        if result_cache is not None:
+            lookups = CounterMetricFamily('precog_result_cache_lookups', 'Prediction result cache lookups',
+                                          labels=['result'])
+            lookups.add_metric(['hit'], result_cache.hits)
+            lookups.add_metric(['miss'], result_cache.misses)
+            yield lookups
+            yield GaugeMetricFamily('precog_result_cache_entries', 'Predictions held in the result cache',
+                                    value=len(result_cache))
+
+
+service_collectors = []
+
+
+def register_collector(collector):
+    service_collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+def latest_metrics():
+    """Render all metrics; across workers in multiprocess mode, plus this worker's service state."""
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in service_collectors:
+        registry.register(collector)
+    return generate_latest(registry)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware counting in-flight requests and timing each one."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            IN_FLIGHT.dec()
+            route = scope.get('route')
+            label = getattr(route, 'path', None) or 'unmatched'
+            REQUEST_SECONDS.labels(label).observe(time.perf_counter() - start)
+            REQUESTS.labels(label, str(status[0])).inc()
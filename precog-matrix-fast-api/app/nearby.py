@@ -0,0 +1,174 @@
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from app.incident_store import CRIME_TYPES, INCIDENT_STORE_PATH, IncidentStore
+from app.preproc import LAT_BOUNDS, LONG_BOUNDS
+
+NEARBY_MAX_RADIUS = float(os.getenv("NEARBY_MAX_RADIUS", 5000))  # metres
+NEARBY_MAX_RESULTS = int(os.getenv("NEARBY_MAX_RESULTS", 1000))  # incidents returned per request
+
+EARTH_RADIUS = 6371008.8  # metres
+# Equirectangular projection about the middle of the city: distances are off
+# by under 0.3% anywhere inside the bounds, well below geocoding error
+ORIGIN_LAT = (LAT_BOUNDS[0] + LAT_BOUNDS[1]) / 2
+ORIGIN_LONG = (LONG_BOUNDS[0] + LONG_BOUNDS[1]) / 2
+
+STORE_COLUMNS = ['EVENT_UNIQUE_ID', 'LAT_WGS84', 'LONG_WGS84', 'OCC_YEAR', 'OCC_MONTH', 'OCC_DAY',
+                 'OCC_HOUR', 'OCC_DOW', 'MCI_CATEGORY'] + CRIME_TYPES
+
+
+def project(lat, long):
+    """Return (N, 2) planar coordinates in metres east and north of the city center."""
+    lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+    long = np.atleast_1d(np.asarray(long, dtype=np.float64))
+    x = np.radians(long - ORIGIN_LONG) * np.cos(np.radians(ORIGIN_LAT)) * EARTH_RADIUS
+    y = np.radians(lat - ORIGIN_LAT) * EARTH_RADIUS
+    return np.column_stack([x, y])
+
+
+def parse_window(text, first, last):
+    """Return a boolean lookup over first..last for a window like '22-3' (wrapping), '5' or '1,7'."""
+    table = np.zeros(last + 1, dtype=bool)
+    for part in text.split(','):
+        start, _, end = part.strip().partition('-')
+        start, end = int(start), int(end or start)
+        if not (first <= start <= last and first <= end <= last):
+            raise ValueError(f"Window '{text}' must stay within {first}-{last}.")
+        if start <= end:
+            table[start:end + 1] = True
+        else:
+            table[start:] = True
+            table[first:end + 1] = True
+    return table
+
+
+def crime_type_bits(crime_types):
+    """Return the bitmask of the given crime types in CRIME_TYPES order."""
+    bits = 0
+    for crime in crime_types:
+        if crime.upper() not in CRIME_TYPES:
+            raise ValueError(f"Unknown crime type: {crime}")
+        bits |= 1 << CRIME_TYPES.index(crime.upper())
+    return bits
+
+
+class NearbyIndex:
+    """KD-tree of historical incidents over projected coordinates, with compact filter columns.
+
+    Each incident keeps only small integer columns next to the tree: its
+    calendar fields and a bitmask of the crime types in the event, so crime
+    type, hour and day-of-week filters are a few array lookups over the
+    candidates the tree returns instead of a scan of every incident.
+    """
+
+    def __init__(self, lat, long, year, month, day, hour, dow, types, category, event_id):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.long = np.asarray(long, dtype=np.float64)
+        self.tree = cKDTree(project(self.lat, self.long))
+        self.year = np.asarray(year, dtype=np.int16)
+        self.month = np.asarray(month, dtype=np.int8)
+        self.day = np.asarray(day, dtype=np.int8)
+        self.hour = np.asarray(hour, dtype=np.int8)
+        self.dow = np.asarray(dow, dtype=np.int8)  # Sunday = 1 ... Saturday = 7
+        self.types = np.asarray(types, dtype=np.uint8)
+        self.category = np.asarray(category, dtype=np.int8)  # main crime type, index into CRIME_TYPES
+        self.event_id = np.asarray(event_id, dtype=np.bytes_)
+
+    @classmethod
+    def from_store(cls, store):
+        table = store.scan(STORE_COLUMNS)
+        types = np.zeros(table.num_rows, dtype=np.uint8)
+        for bit, crime in enumerate(CRIME_TYPES):
+            types |= (table[crime].to_numpy() > 0).astype(np.uint8) << bit
+        category = table['MCI_CATEGORY'].combine_chunks()
+        codes = np.asarray([CRIME_TYPES.index(name) for name in category.dictionary.to_pylist()], dtype=np.int8)
+        return cls(table['LAT_WGS84'].to_numpy(), table['LONG_WGS84'].to_numpy(), table['OCC_YEAR'].to_numpy(),
+                   table['OCC_MONTH'].to_numpy(), table['OCC_DAY'].to_numpy(), table['OCC_HOUR'].to_numpy(),
+                   table['OCC_DOW'].to_numpy(), types, codes[category.indices.to_numpy(zero_copy_only=False)],
+                   table['EVENT_UNIQUE_ID'].to_numpy(zero_copy_only=False).astype(np.bytes_))
+
+    @classmethod
+    def load(cls, root=INCIDENT_STORE_PATH):
+        return cls.from_store(IncidentStore(root))
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _keep(self, indices, crime_types=None, hours=None, dows=None):
+        """Mask of the candidates passing the filters; `hours` and `dows` are parse_window tables."""
+        keep = np.ones(len(indices), dtype=bool)
+        if crime_types:
+            keep &= (self.types[indices] & crime_type_bits(crime_types)) != 0
+        if hours is not None:
+            keep &= hours[self.hour[indices]]
+        if dows is not None:
+            keep &= dows[self.dow[indices]]
+        return keep
+
+    @staticmethod
+    def _filtered(crime_types=None, hours=None, dows=None):
+        return bool(crime_types) or hours is not None or dows is not None
+
+    def _by_distance(self, point, indices):
+        distances = np.hypot(*(self.tree.data[indices] - point).T)
+        order = np.argsort(distances, kind='stable')
+        return indices[order], distances[order]
+
+    def within(self, lat, long, radius, **filters):
+        """Return (indices, distances) of the matching incidents within `radius` metres, nearest first."""
+        point = project(lat, long)[0]
+        indices = np.asarray(self.tree.query_ball_point(point, radius), dtype=np.intp)
+        return self._by_distance(point, indices[self._keep(indices, **filters)])
+
+    def count(self, lat, long, radius, **filters):
+        point = project(lat, long)[0]
+        if not self._filtered(**filters):
+            return int(self.tree.query_ball_point(point, radius, return_length=True))
+        indices = np.asarray(self.tree.query_ball_point(point, radius), dtype=np.intp)
+        return int(self._keep(indices, **filters).sum())
+
+    def nearest(self, lat, long, k, radius=np.inf, **filters):
+        """Return (indices, distances) of the `k` nearest matching incidents within `radius` metres.
+
+        With filters the tree is asked for 4x more neighbours at a time until
+        `k` of them match or the radius is exhausted.
+        """
+        point = project(lat, long)[0]
+        fetch = min(k, len(self))
+        while True:
+            distances, indices = self.tree.query(point, k=max(fetch, 1), distance_upper_bound=radius)
+            distances, indices = np.atleast_1d(distances), np.atleast_1d(indices)
+            found = indices < len(self)  # misses beyond the radius come back as len(self)
+            distances, indices = distances[found], indices[found]
+            keep = self._keep(indices, **filters)
+            if keep.sum() >= k or fetch >= len(self) or len(indices) < fetch:
+                return indices[keep][:k], distances[keep][:k]
+            fetch = min(fetch * 4, len(self))
+
+    def rows(self, indices, distances):
+        """Columnar payload of the given incidents."""
+        return {
+            "event_id": np.char.decode(self.event_id[indices]).tolist(),
+            "lat": self.lat[indices].tolist(),
+            "lon": self.long[indices].tolist(),
+            "distance": np.round(distances, 1).tolist(),
+            "year": self.year[indices].tolist(),
+            "month": self.month[indices].tolist(),
+            "day": self.day[indices].tolist(),
+            "hour": self.hour[indices].tolist(),
+            "dow": self.dow[indices].tolist(),
+            "mci_category": [CRIME_TYPES[code] for code in self.category[indices]],
+        }
+
+    def query(self, mode, lat, long, radius, k, limit, crime_types=None, hours=None, dows=None):
+        """Answer one /nearby request: 'radius' (up to `limit` incidents), 'knn' (`k` nearest) or 'count'."""
+        filters = dict(crime_types=crime_types, hours=hours, dows=dows)
+        if mode == 'count':
+            return {"count": self.count(lat, long, radius, **filters)}
+        if mode == 'knn':
+            indices, distances = self.nearest(lat, long, k, radius, **filters)
+        else:
+            indices, distances = self.within(lat, long, radius, **filters)
+        return {"count": len(indices), "incidents": self.rows(indices[:limit], distances[:limit])}
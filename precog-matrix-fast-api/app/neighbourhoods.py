@@ -0,0 +1,173 @@
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from app.preproc import LAT_BOUNDS, LONG_BOUNDS
+
+# City of Toronto "Neighbourhoods" GeoJSON (158 or 140 scheme) and the per-neighbourhood counts
+NEIGHBOURHOODS_PATH = os.getenv("NEIGHBOURHOODS_PATH", 'models/neighbourhoods.geojson')
+NEIGHBOURHOOD_COUNTS_PATH = os.getenv("NEIGHBOURHOOD_COUNTS_PATH", 'models/combined_neighbourhood_counts.csv')
+NEIGHBOURHOOD_NAME_FIELD = os.getenv("NEIGHBOURHOOD_NAME_FIELD", 'AREA_NAME')
+NEIGHBOURHOOD_ID_FIELD = os.getenv("NEIGHBOURHOOD_ID_FIELD", 'AREA_SHORT_CODE')
+NEIGHBOURHOOD_GRID_CELLS = int(os.getenv("NEIGHBOURHOOD_GRID_CELLS", 256))  # buckets per side
+
+# Cell states besides a polygon number
+OUTSIDE = -1
+BOUNDARY = -2
+
+POINT_CHUNK = 4096
+
+
+def read_polygons(path, name_field=NEIGHBOURHOOD_NAME_FIELD, id_field=NEIGHBOURHOOD_ID_FIELD):
+    """Return [(id, name, [ring arrays of (long, lat)])] from a GeoJSON FeatureCollection."""
+    with open(path) as f:
+        features = json.load(f)['features']
+
+    polygons = []
+    for number, feature in enumerate(features):
+        geometry = feature['geometry']
+        parts = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+        rings = [np.asarray(ring, dtype=np.float64)[:, :2] for part in parts for ring in part]
+        properties = feature.get('properties') or {}
+        name = str(properties.get(name_field, number))
+        polygons.append((str(properties.get(id_field, number)), name, rings))
+    return polygons
+
+
+def contains(rings, long, lat):
+    """Even-odd point-in-polygon test of many points against one polygon (holes included)."""
+    inside = np.zeros(len(long), dtype=bool)
+    for ring in rings:
+        x0, y0 = ring[:, 0], ring[:, 1]
+        x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+        for start in range(0, len(long), POINT_CHUNK):
+            px = long[start:start + POINT_CHUNK, None]
+            py = lat[start:start + POINT_CHUNK, None]
+            straddles = (y0 > py) != (y1 > py)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                crossing = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+            inside[start:start + POINT_CHUNK] ^= (np.count_nonzero(straddles & (px < crossing), axis=1) % 2).astype(bool)
+    return inside
+
+
+def base_name(name):
+    """Drop the '(129)' style number the 140-neighbourhood names carry."""
+    return re.sub(r'\s*\(\d+\)$', '', name)
+
+
+def read_base_rates(path):
+    """Map neighbourhood name -> per-scheme incident counts and city share from combined_neighbourhood_counts.csv.
+
+    The 140-neighbourhood names carry a '(129)' style suffix; both schemes are
+    keyed by the bare name so one lookup returns both.
+    """
+    counts = pd.read_csv(path)
+    totals = counts[['NEIGHBOURHOOD_140', 'NEIGHBOURHOOD_158']].sum()
+    rates = {}
+    for row in counts.itertuples(index=False):
+        for scheme, value in (('140', row.NEIGHBOURHOOD_140), ('158', row.NEIGHBOURHOOD_158)):
+            if pd.notna(value):
+                rates.setdefault(base_name(row.NEIGHBOURHOOD), {})[scheme] = {
+                    "incidents": int(value),
+                    "share": float(value / totals[f'NEIGHBOURHOOD_{scheme}']),
+                }
+    return rates
+
+
+class NeighbourhoodIndex:
+    """Grid-bucketed polygon index over the Toronto bounding box.
+
+    Every bucket is either inside one neighbourhood, outside all of them, or
+    crossed by a boundary. Points in the first two kinds are resolved by a
+    table lookup; only boundary buckets run the point-in-polygon test, and
+    only against the polygons whose bounding box overlaps the bucket.
+    """
+
+    def __init__(self, polygons, base_rates=None, cells=NEIGHBOURHOOD_GRID_CELLS):
+        self.ids = [polygon_id for polygon_id, _, _ in polygons]
+        self.names = [name for _, name, _ in polygons]
+        self.rings = [rings for _, _, rings in polygons]
+        self.base_rates = base_rates or {}
+        self.cells = cells
+        self.lat_step = (LAT_BOUNDS[1] - LAT_BOUNDS[0]) / cells
+        self.long_step = (LONG_BOUNDS[1] - LONG_BOUNDS[0]) / cells
+        self._build()
+
+    @classmethod
+    def load(cls, path=NEIGHBOURHOODS_PATH, counts_path=NEIGHBOURHOOD_COUNTS_PATH):
+        base_rates = read_base_rates(counts_path) if os.path.exists(counts_path) else None
+        return cls(read_polygons(path), base_rates)
+
+    def _cell_index(self, lat, long):
+        rows = np.clip(np.floor((lat - LAT_BOUNDS[0]) / self.lat_step), 0, self.cells - 1).astype(np.int64)
+        cols = np.clip(np.floor((long - LONG_BOUNDS[0]) / self.long_step), 0, self.cells - 1).astype(np.int64)
+        return rows, cols
+
+    def _build(self):
+        # candidate[cell, polygon] is set where the polygon's bounding box overlaps the bucket
+        self.candidate = np.zeros((self.cells * self.cells, len(self.rings)), dtype=bool)
+        boundary = np.zeros((self.cells, self.cells), dtype=bool)
+        for number, rings in enumerate(self.rings):
+            points = np.concatenate(rings)
+            (r0, r1), (c0, c1) = self._cell_index(np.array([points[:, 1].min(), points[:, 1].max()]),
+                                                  np.array([points[:, 0].min(), points[:, 0].max()]))
+            self.candidate.reshape(self.cells, self.cells, -1)[r0:r1 + 1, c0:c1 + 1, number] = True
+
+            # Mark every bucket an edge's bounding box touches as a boundary bucket
+            starts = np.concatenate([ring[:-1] for ring in rings])
+            ends = np.concatenate([ring[1:] for ring in rings])
+            row_lo, col_lo = self._cell_index(np.minimum(starts[:, 1], ends[:, 1]), np.minimum(starts[:, 0], ends[:, 0]))
+            row_hi, col_hi = self._cell_index(np.maximum(starts[:, 1], ends[:, 1]), np.maximum(starts[:, 0], ends[:, 0]))
+            for dr in range(int((row_hi - row_lo).max(initial=0)) + 1):
+                for dc in range(int((col_hi - col_lo).max(initial=0)) + 1):
+                    within = (row_lo + dr <= row_hi) & (col_lo + dc <= col_hi)
+                    boundary[row_lo[within] + dr, col_lo[within] + dc] = True
+
+        # Buckets no edge touches lie wholly inside one polygon or outside all, so their center decides
+        interior = np.flatnonzero(~boundary.ravel())
+        rows, cols = np.divmod(interior, self.cells)
+        self.owner = np.full(self.cells * self.cells, BOUNDARY, dtype=np.int32)
+        self.owner[interior] = self._test(interior, LAT_BOUNDS[0] + (rows + 0.5) * self.lat_step,
+                                          LONG_BOUNDS[0] + (cols + 0.5) * self.long_step)
+
+    def _test(self, cells, lat, long):
+        """Point-in-polygon against the candidate polygons of each point's bucket."""
+        result = np.full(len(cells), OUTSIDE, dtype=np.int32)
+        candidates = self.candidate[cells]
+        for number in np.flatnonzero(candidates.any(axis=0)):
+            pending = np.flatnonzero(candidates[:, number] & (result == OUTSIDE))
+            if len(pending):
+                result[pending[contains(self.rings[number], long[pending], lat[pending])]] = number
+        return result
+
+    def locate(self, lat, long):
+        """Return the polygon number of each point, or OUTSIDE (-1)."""
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        long = np.atleast_1d(np.asarray(long, dtype=np.float64))
+        in_grid = ((LAT_BOUNDS[0] <= lat) & (lat < LAT_BOUNDS[1]) &
+                   (LONG_BOUNDS[0] <= long) & (long < LONG_BOUNDS[1]))
+
+        rows, cols = self._cell_index(lat, long)
+        cells = rows * self.cells + cols
+        result = np.where(in_grid, self.owner[cells], OUTSIDE).astype(np.int32)
+
+        # Chunked so the per-point candidate rows stay small for bulk assignment
+        pending = np.flatnonzero(result == BOUNDARY)
+        for start in range(0, len(pending), 16 * POINT_CHUNK):
+            chunk = pending[start:start + 16 * POINT_CHUNK]
+            result[chunk] = self._test(cells[chunk], lat[chunk], long[chunk])
+        return result
+
+    def describe(self, number):
+        """Return the id, name and base rates of a polygon number, or None for OUTSIDE."""
+        if number < 0:
+            return None
+        name = self.names[number]
+        return {"id": self.ids[number], "name": name, "base_rates": self.base_rates.get(base_name(name), {})}
+
+    def lookup(self, lat, long):
+        """Neighbourhood of a single point, as described by describe()."""
+        return self.describe(int(self.locate(lat, long)[0]))
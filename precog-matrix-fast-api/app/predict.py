@@ -8,6 +8,9 @@ import pandas as pd
     #terceir opasso: retornar o output (prob)
 
 model_path = 'models/crime_prediction_lightgbm_model.joblib'
+
+# Crime type of each predict_proba column (model class i -> CLASS_NAMES[i])
+CLASS_NAMES = ["AUTO THEFT", "ASSAULT", "ROBBERY", "THEFT OVER", "BREAK AND ENTER", "HOMICIDE"]
 #onehot_columns = ['Crime_A', 'Crime_B', 'Crime_C', 'Crime_D', 'Crime_E', 'Crime_F']  # Tem que ajustar, pq não sei os nomes
 
 
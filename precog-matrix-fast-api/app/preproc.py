@@ -7,35 +7,46 @@ import joblib
 LAT_BOUNDS = [43.5810, 43.8554]  # Limites aproximados de latitude para Toronto
 LONG_BOUNDS = [-79.639, -79.115]  # Limites aproximados de longitude para Toronto
 
-def load_data(lat, long, year, month, day, hour):
-    """Create a DataFrame from input data and check if within Toronto bounds."""
+def in_bounds(lat, long):
+    """Return a boolean mask of the points that fall within Toronto bounds."""
+    lat = np.asarray(lat, dtype=float)
+    long = np.asarray(long, dtype=float)
+    return ((LAT_BOUNDS[0] <= lat) & (lat <= LAT_BOUNDS[1]) &
+            (LONG_BOUNDS[0] <= long) & (long <= LONG_BOUNDS[1]))
+
+def check_bounds(lat, long):
+    """Raise ValueError if a single point is outside Toronto bounds."""
     if not (LAT_BOUNDS[0] <= lat <= LAT_BOUNDS[1]):
         raise ValueError(f"Latitude {lat} is out of bounds for Toronto.")
     if not (LONG_BOUNDS[0] <= long <= LONG_BOUNDS[1]):
         raise ValueError(f"Longitude {long} is out of bounds for Toronto.")
 
+def load_data(lat, long, year, month, day, hour):
+    """Create a DataFrame from input data and check if within Toronto bounds."""
+    check_bounds(lat, long)
+
+    return load_data_batch([lat], [long], [year], [month], [day], [hour])
+
+def load_data_batch(lat, long, year, month, day, hour):
+    """Create a DataFrame with one row per input point (bounds are not checked)."""
     data = {
-        'LAT_WGS84': [lat],
-        'LONG_WGS84': [long],
-        'OCC_YEAR': [year],
-        'MONTH': [month],
-        'OCC_DAY': [day],
-        'HOUR': [hour]
+        'LAT_WGS84': lat,
+        'LONG_WGS84': long,
+        'OCC_YEAR': year,
+        'MONTH': month,
+        'OCC_DAY': day,
+        'HOUR': hour
     }
     df = pd.DataFrame(data)
 
     # Rename columns temporarily to create OCC_DATE
     temp_df = df.rename(columns={'OCC_YEAR': 'year', 'MONTH': 'month', 'OCC_DAY': 'day'})
-    df['OCC_DATE'] = pd.to_datetime(temp_df[['year', 'month', 'day']])
+    occ_date = pd.to_datetime(temp_df[['year', 'month', 'day']])
 
     # Calculate DOW (day of the week) and DOY (day of the year)
-    df['OCC_DOW'] = df['OCC_DATE'].dt.dayofweek + 2  # Adjusting to Sunday=1, Saturday=7
-    df['OCC_DOY'] = df['OCC_DATE'].dt.dayofyear  # Day of year
-
-    # Map the days to correct values (Sunday=1, Saturday=7)
-    df['OCC_DOW'] = df['OCC_DOW'].apply(lambda x: 1 if x == 8 else x)
-
-    df.drop(columns=['OCC_DATE'], inplace=True)
+    # Adjusting to Sunday=1, Saturday=7 (pandas uses Monday=0, Sunday=6)
+    df['OCC_DOW'] = (occ_date.dt.dayofweek + 1) % 7 + 1
+    df['OCC_DOY'] = occ_date.dt.dayofyear  # Day of year
 
     return df
 
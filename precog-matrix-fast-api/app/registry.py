@@ -0,0 +1,182 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+
+from app.features import encode_features, matches_pandas_path, scaler_params, to_frame
+from app.predict import load_model
+from app.preproc import load_scaler
+from app.treeeval import AutoEngine, TreeEnsemble
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.getenv("MODEL_PATH", 'models/crime_prediction_lightgbm_model.joblib')
+SCALER_PATH = os.getenv("SCALER_PATH", 'models/scaler.joblib')
+# Checksums written by training.retrain next to the artifacts; skipped when absent
+MODEL_MANIFEST_PATH = os.getenv("MODEL_MANIFEST_PATH", os.path.join(os.path.dirname(MODEL_PATH), 'manifest.json'))
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", 'lightgbm')  # or 'arrays' / 'auto'
+ARRAY_ENGINE_MAX_ROWS = int(os.getenv("ARRAY_ENGINE_MAX_ROWS", 32))  # 'auto' switch-over point
+ENGINE_TOLERANCE = 1e-9
+
+# Everything a request needs to score, swapped as a single reference
+ModelBundle = namedtuple('ModelBundle', ['model', 'scaler', 'version', 'feature_params'])
+
+# Sample rows checked against the pandas preprocessing path on every load
+PARITY_ROWS = dict(lat=[43.6532, 43.7001, 43.5900], long=[-79.3832, -79.4163, -79.6300],
+                   year=[2024, 2016, 2023], month=[6, 2, 12], day=[9, 29, 31], hour=[6, 0, 23])
+
+
+def hash_files(*paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest
+
+
+def file_version(*paths):
+    """Return a short content hash identifying the given artifact files."""
+    return hash_files(*paths).hexdigest()[:12]
+
+
+def file_sha256(path):
+    return hash_files(path).hexdigest()
+
+
+def verify_manifest(manifest_path, model_path, scaler_path):
+    """Check the artifacts against their manifest checksums; return the manifest, or None if there is none.
+
+    A model and scaler copied in one after the other fail the check until
+    the manifest naming both is in place, so a half-published pair is never loaded.
+    """
+    if not manifest_path or not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    for name, path in (('model', model_path), ('scaler', scaler_path)):
+        if file_sha256(path) != manifest['files'][name]['sha256']:
+            raise ValueError(f"{path} does not match the {name} checksum in {manifest_path}.")
+    return manifest
+
+
+def build_engine(model, scaler, engine, verify=True):
+    """Return the object whose predict_proba serves requests for `engine`.
+
+    With `verify`, the array engine is checked against the model's
+    predict_proba, which runs LightGBM's OpenMP threads.
+    """
+    if engine == 'lightgbm':
+        return model
+    if engine not in ('arrays', 'auto'):
+        raise ValueError(f"Unknown inference engine: {engine}")
+
+    arrays = TreeEnsemble.from_model(model)
+    if verify:
+        sample = encode_features(**PARITY_ROWS, scaler=scaler)
+        difference = abs(arrays.predict_proba(sample) - model.predict_proba(to_frame(sample))).max()
+        if difference > ENGINE_TOLERANCE:
+            raise ValueError(f"Array engine differs from predict_proba by {difference}.")
+    if engine == 'auto':
+        return AutoEngine(model, arrays, ARRAY_ENGINE_MAX_ROWS)
+    return arrays
+
+
+class ModelRegistry:
+    """Hold the model and scaler in memory and swap them atomically on reload.
+
+    Requests call `get()` once and keep the returned bundle for their whole
+    lifetime, so a reload never mixes a new model with an old scaler and
+    in-flight requests finish on the version they started with. Callables in
+    `listeners` are called with every newly loaded bundle.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, scaler_path=SCALER_PATH, engine=INFERENCE_ENGINE,
+                 manifest_path=MODEL_MANIFEST_PATH):
+        self.model_path = model_path
+        self.scaler_path = scaler_path
+        self.manifest_path = manifest_path
+        self.manifest = None
+        self.engine = engine
+        self.listeners = []
+        self._bundle = None
+        self._mtimes = None
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def _artifact_mtimes(self):
+        return (os.path.getmtime(self.model_path), os.path.getmtime(self.scaler_path))
+
+    def load(self, verify_engine=True):
+        """Load both artifacts from disk and publish them as the current bundle.
+
+        `verify_engine=False` skips the array engine parity check, for a
+        parent process that forks workers and must not start OpenMP threads.
+        """
+        with self._lock:
+            mtimes = self._artifact_mtimes()
+            manifest = verify_manifest(self.manifest_path, self.model_path, self.scaler_path)
+            scaler = load_scaler(self.scaler_path)
+            if not matches_pandas_path(scaler, **PARITY_ROWS):
+                raise ValueError("NumPy feature encoder does not match preproc for this scaler.")
+            bundle = ModelBundle(
+                model=build_engine(load_model(self.model_path), scaler, self.engine, verify_engine),
+                scaler=scaler,
+                version=file_version(self.model_path, self.scaler_path),
+                feature_params=scaler_params(scaler),
+            )
+            if self._artifact_mtimes() != mtimes:
+                # Replaced between the checksum check and loading: the pair read may be mixed
+                raise ValueError("Model artifacts changed while loading.")
+            self._bundle = bundle
+            self._mtimes = mtimes
+            self.manifest = manifest
+        logger.info("Loaded model version %s", bundle.version)
+        for listener in self.listeners:
+            listener(bundle)
+        return bundle
+
+    def reload(self):
+        """Reload the artifacts if they changed on disk; return the current bundle."""
+        if self._bundle is None or self._artifact_mtimes() != self._mtimes:
+            return self.load()
+        return self._bundle
+
+    def get(self):
+        """Return the current bundle, loading it on first use."""
+        bundle = self._bundle
+        if bundle is None:
+            bundle = self.load()
+        return bundle
+
+    @property
+    def version(self):
+        return self._bundle.version if self._bundle is not None else None
+
+    def watch(self, interval):
+        """Poll the artifact files every `interval` seconds and reload on change."""
+        if self._watcher is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception as e:
+                    # Keep serving the previous version on a half-written file
+                    logger.error(f"Model reload failed: {e}")
+
+        self._watcher = threading.Thread(target=run, name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+
+registry = ModelRegistry()
@@ -0,0 +1,102 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "0") == "1"
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 100000))
+RESULT_CACHE_PRECISION = float(os.getenv("RESULT_CACHE_PRECISION", 0.001))  # degrees; 0 keys on exact coordinates
+
+
+class ResultCache:
+    """LRU of predictions keyed by (model version, location cell, year, month, day, hour).
+
+    The model only sees coordinates and calendar fields, so a key always maps
+    to the same probabilities. With a non-zero `precision` locations are
+    snapped to the center of a `precision`-degree cell and scored there, so
+    every point in a cell shares one entry. The cache holds the entries of
+    one model version, the one the registry last loaded (`set_version`);
+    requests still scoring with another version's bundle during a reload
+    bypass it instead of clearing it.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, precision=RESULT_CACHE_PRECISION):
+        self.max_entries = max_entries
+        self.precision = precision
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def snap(self, lat, lon):
+        """Return the cell of each location and the coordinates it is scored at."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        if not self.precision:
+            return lat, lon, lat, lon
+        lat_cell = np.floor(lat / self.precision).astype(np.int64)
+        lon_cell = np.floor(lon / self.precision).astype(np.int64)
+        return lat_cell, lon_cell, (lat_cell + 0.5) * self.precision, (lon_cell + 0.5) * self.precision
+
+    def set_version(self, version):
+        """Switch to the version the registry just loaded, dropping the previous version's entries."""
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+
+    def lookup(self, bundle, lat, lon, year, month, day, hour):
+        """Look up rows; return (keys, cached predictions or None per row, snapped lat, snapped lon)."""
+        lat_cell, lon_cell, lat, lon = self.snap(np.atleast_1d(lat), np.atleast_1d(lon))
+        keys = list(zip(lat_cell.tolist(), lon_cell.tolist(), np.atleast_1d(year).tolist(),
+                        np.atleast_1d(month).tolist(), np.atleast_1d(day).tolist(), np.atleast_1d(hour).tolist()))
+        found = []
+        with self._lock:
+            if self.version is None:
+                self.version = bundle.version
+            if bundle.version != self.version:
+                self.misses += len(keys)
+                return keys, [None] * len(keys), lat, lon
+            for key in keys:
+                prediction = self._entries.get(key)
+                if prediction is not None:
+                    self._entries.move_to_end(key)
+                found.append(prediction)
+            hits = sum(prediction is not None for prediction in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return keys, found, lat, lon
+
+    def store(self, bundle, keys, predictions):
+        """Remember one prediction row per key, unless the model changed since it was scored."""
+        predictions = np.array(predictions, dtype=np.float64, ndmin=2)
+        predictions.flags.writeable = False
+        with self._lock:
+            if bundle.version != self.version:
+                return
+            for key, row in zip(keys, predictions):
+                self._entries[key] = row
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "precision": self.precision,
+            "model_version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,192 @@
+"""Pre-fork production server.
+
+The parent process imports the app and loads the model, scaler,
+neighbourhood index and nearby-incident index once, then forks
+SERVE_WORKERS uvicorn workers that accept on one shared socket. Workers
+inherit those objects copy-on-write, so their memory stays shared instead of
+being loaded again per worker:
+
+    SERVE_WORKERS=4 PORT=8000 python -m app.serve
+
+LightGBM's OpenMP runtime does not survive a fork once its threads have
+started, so the parent never calls predict_proba: the inference engine parity
+check runs in a short-lived forked child before the workers start.
+
+Metrics from all workers are merged through prometheus_client's
+multiprocess mode. A worker that dies is replaced after a delay that doubles
+with each recent crash, and if more than SERVE_MAX_CRASHES workers die within
+SERVE_CRASH_WINDOW seconds the server shuts down instead of crash-looping.
+"""
+import gc
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from collections import deque
+
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("PORT", 8000))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", os.cpu_count() or 1))
+SERVE_RESPAWN_DELAY = float(os.getenv("SERVE_RESPAWN_DELAY", 0.5))  # seconds, after the first recent crash
+SERVE_RESPAWN_MAX_DELAY = float(os.getenv("SERVE_RESPAWN_MAX_DELAY", 30))
+SERVE_MAX_CRASHES = int(os.getenv("SERVE_MAX_CRASHES", 10))
+SERVE_CRASH_WINDOW = float(os.getenv("SERVE_CRASH_WINDOW", 60))  # seconds
+
+logger = logging.getLogger(__name__)
+
+
+def configure_environment(workers):
+    """Set what the app reads at import time; must run before app.fast is imported.
+
+    Return the metrics directory created for this run, or None if one was configured.
+    """
+    # Split the cores between workers rather than giving each a full-size inference pool
+    os.environ.setdefault("PREDICT_WORKERS", str(max(1, (os.cpu_count() or 1) // workers)))
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="precog-metrics-")
+        return os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    return None
+
+
+def preload():
+    """Import the app and load everything that can be shared before forking."""
+    import app.fast as fast
+
+    fast.registry.load(verify_engine=False)
+    fast.load_neighbourhoods()
+    fast.load_nearby_index()
+    return fast.app
+
+
+def check_engine():
+    """Load the model with the engine parity check in a forked child; return whether it passed."""
+    import app.fast as fast
+
+    if fast.registry.engine == 'lightgbm':
+        return True
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            fast.registry.load()
+            code = 0
+        except Exception:
+            logger.exception("Inference engine check failed")
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status) == 0
+
+
+def listen(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def respawn_delay(crashes, delay=SERVE_RESPAWN_DELAY, max_delay=SERVE_RESPAWN_MAX_DELAY):
+    """Seconds to wait before replacing a worker, doubling with each crash in the window."""
+    return min(delay * 2 ** max(crashes - 1, 0), max_delay)
+
+
+def run_worker(app, sock):
+    import uvicorn
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    server = uvicorn.Server(uvicorn.Config(app, log_level=os.getenv("LOG_LEVEL", "info").lower()))
+    server.run(sockets=[sock])
+
+
+def main():
+    workers = SERVE_WORKERS
+    metrics_dir = configure_environment(workers)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    try:
+        serve(workers)
+    finally:
+        if metrics_dir is not None:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def serve(workers):
+    app = preload()
+    if not check_engine():
+        sys.exit(1)
+    sock = listen(SERVE_HOST, SERVE_PORT)
+
+    from prometheus_client import multiprocess
+
+    # Keep the collector from touching (and so copying) the preloaded objects in every worker
+    gc.collect()
+    gc.freeze()
+
+    children = set()
+    crashes = deque()  # times of the recent worker deaths
+    stopping = False
+    failed = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(app, sock)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass  # already exited and reaped
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        spawn()
+    logger.info(f"Serving on {SERVE_HOST}:{SERVE_PORT} with {workers} workers")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        multiprocess.mark_process_dead(pid)
+        if stopping:
+            continue
+
+        now = time.monotonic()
+        crashes.append(now)
+        while crashes and crashes[0] < now - SERVE_CRASH_WINDOW:
+            crashes.popleft()
+        if len(crashes) > SERVE_MAX_CRASHES:
+            logger.error(f"{len(crashes)} workers exited within {SERVE_CRASH_WINDOW:g} s; shutting down")
+            failed = True
+            stop(None, None)
+            continue
+
+        delay = respawn_delay(len(crashes))
+        logger.warning(f"Worker {pid} exited with status {status}; starting a new one in {delay:g} s")
+        time.sleep(delay)
+        if not stopping:
+            spawn()
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,43 @@
 import streamlit as st
 import folium
 from streamlit_folium import folium_static
-import requests
+import httpx
 from datetime import datetime
 
+from precog_client import CLASS_NAMES, PrecogClient, PrecogError
+from precog_client.client import PRECOG_API_URL, normalize_date
+
 # Streamlit configuration
 st.set_page_config(page_title="Crime Prediction", page_icon="🔍", layout="wide")
 
+# One pooled client for every rerun and session
+@st.cache_resource
+def get_client():
+    return PrecogClient(PRECOG_API_URL)
+
+# Predictions are cached by (address, hour), the only inputs the model sees
+@st.cache_data(ttl=3600, show_spinner=False)
+def cached_prediction(address, crime_hour):
+    return get_client().predict(address, crime_hour)["prediction"]
+
 # Function to call the prediction API
 def predict_crime(address, crime_date):
-    url = "http://localhost:8000/predict"
-    params = {"address": address, "crime_date": crime_date.isoformat()}
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return response.json().get("prediction")
-    else:
+    try:
+        return cached_prediction(" ".join(address.split()), normalize_date(crime_date))
+    except (PrecogError, httpx.HTTPError):
         return None
 
+# The map never changes, so build it once instead of on every rerun
+@st.cache_resource
+def build_map():
+    map_center = [43.651070, -79.347015]  # Toronto center
+    map_obj = folium.Map(location=map_center, zoom_start=12)
+
+    # Add click event to map
+    map_obj.add_child(folium.LatLngPopup())
+    map_obj.add_child(folium.ClickForMarker(popup="You clicked here!"))
+    return map_obj
+
 # Streamlit UI
 st.title("Crime Prediction")
 
@@ -31,19 +52,13 @@ if st.button("Predict Crime"):
     prediction = predict_crime(address, combined_datetime)
     if prediction:
         st.write("Crime Prediction Probabilities:")
-        crime_labels = ["AUTO THEFT", "ASSAULT", "ROBBERY", "THEFT OVER", "BREAK AND ENTER", "HOMICIDE"]
-        for crime, prob in zip(crime_labels, prediction[0]):
+        for crime, prob in zip(CLASS_NAMES, prediction):
             st.write(f"{crime}: {prob:.2f}")
     else:
         st.error("Error fetching prediction. Please try again.")
 
 # Interactive map
 st.subheader("Click on the map to select a location")
-map_center = [43.651070, -79.347015]  # Toronto center
-map_obj = folium.Map(location=map_center, zoom_start=12)
-
-# Add click event to map
-map_obj.add_child(folium.LatLngPopup())
 
 # Function to handle map click
 if 'map_click' not in st.session_state:
@@ -52,9 +67,7 @@ if 'map_click' not in st.session_state:
 def on_map_click(e):
     st.session_state.map_click = e['latlng']
 
-map_obj.add_child(folium.ClickForMarker(popup="You clicked here!"))
-
 if st.session_state.map_click:
     st.write(f"You clicked at: {st.session_state.map_click}")
 
-folium_static(map_obj)
+folium_static(build_map())
@@ -0,0 +1,169 @@
+import numpy as np
+
+from app.features import to_frame
+
+# LightGBM treats |x| <= kZeroThreshold as zero for missing_type=Zero splits
+ZERO_THRESHOLD = 1e-35
+
+# Below this many (row, tree) pairs, walk every pair for the full depth
+SMALL_BATCH_PAIRS = 4096
+
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+MISSING_TYPES = {'None': MISSING_NONE, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+
+
+class TreeEnsemble:
+    """A LightGBM multiclass booster flattened into NumPy arrays.
+
+    All trees share one node table, so every (row, tree) pair still walking
+    down is advanced one level with a handful of gathers per step, dropping
+    pairs as they reach a leaf. Leaf values are then summed per class and
+    passed through a softmax, as LGBMClassifier.predict_proba does.
+    """
+
+    # Takes the encoded matrix as is, no DataFrame wrapping needed
+    accepts_arrays = True
+
+    def __init__(self, feature, threshold, left, right, default_left, missing, value,
+                 roots, num_class, depth, average_output=False):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.missing = missing
+        self.value = value
+        self.roots = roots
+        self.num_class = num_class
+        self.depth = depth
+        self.average_output = average_output
+        self.is_leaf = left == np.arange(len(left))
+        self._has_missing_rules = bool(np.any(missing != MISSING_NONE))
+
+    @classmethod
+    def from_model(cls, model):
+        """Build the arrays from an LGBMClassifier or lightgbm.Booster."""
+        booster = getattr(model, 'booster_', model)
+        dump = booster.dump_model()
+        if not dump['objective'].startswith('multiclass ') and dump['objective'] != 'multiclass':
+            raise ValueError(f"Unsupported objective for the array engine: {dump['objective']}")
+
+        feature, threshold, left, right, default_left, missing, value = ([] for _ in range(7))
+        roots = []
+        depth = 0
+
+        def add(node, level):
+            nonlocal depth
+            index = len(feature)
+            for column in (feature, threshold, left, right, default_left, missing, value):
+                column.append(0)
+            if 'leaf_value' in node:
+                depth = max(depth, level)
+                feature[index], threshold[index] = 0, np.inf
+                left[index] = right[index] = index
+                value[index] = node['leaf_value']
+                return index
+            if node['decision_type'] != '<=':
+                raise ValueError("Categorical splits are not supported by the array engine.")
+            feature[index] = node['split_feature']
+            threshold[index] = node['threshold']
+            default_left[index] = node['default_left']
+            missing[index] = MISSING_TYPES[node['missing_type']]
+            left[index] = add(node['left_child'], level + 1)
+            right[index] = add(node['right_child'], level + 1)
+            return index
+
+        for tree in dump['tree_info']:
+            roots.append(add(tree['tree_structure'], 0))
+
+        return cls(
+            feature=np.asarray(feature, dtype=np.intp),
+            threshold=np.asarray(threshold, dtype=np.float64),
+            left=np.asarray(left, dtype=np.intp),
+            right=np.asarray(right, dtype=np.intp),
+            default_left=np.asarray(default_left, dtype=bool),
+            missing=np.asarray(missing, dtype=np.int8),
+            value=np.asarray(value, dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            num_class=dump['num_class'],
+            depth=depth,
+            average_output=dump.get('average_output', False),
+        )
+
+    def _step(self, nodes, x, check_missing):
+        """Move each node to the child chosen by its feature value `x`."""
+        if check_missing:
+            missing = self.missing[nodes]
+            is_nan = np.isnan(x)
+            x = np.where(is_nan & (missing != MISSING_NAN), 0.0, x)
+            use_default = ((missing == MISSING_NAN) & is_nan) | (
+                (missing == MISSING_ZERO) & (np.abs(x) <= ZERO_THRESHOLD))
+            go_left = np.where(use_default, self.default_left[nodes], x <= self.threshold[nodes])
+        else:
+            go_left = x <= self.threshold[nodes]
+        return np.where(go_left, self.left[nodes], self.right[nodes])
+
+    def leaves(self, X):
+        """Return the (rows, trees) node index of the leaf each row reaches in each tree."""
+        n_rows, n_trees = len(X), len(self.roots)
+        check_missing = self._has_missing_rules or bool(np.isnan(X).any())
+
+        if n_rows * n_trees <= SMALL_BATCH_PAIRS:
+            # Few pairs: a fixed number of full steps costs less than tracking
+            # which pairs are done (leaves loop back to themselves)
+            rows = np.arange(n_rows)[:, np.newaxis]
+            nodes = np.broadcast_to(self.roots, (n_rows, n_trees))
+            for _ in range(self.depth):
+                nodes = self._step(nodes, X[rows, self.feature[nodes]], check_missing)
+            return nodes
+
+        # Many pairs: only the (row, tree) pairs not yet at a leaf take another step
+        nodes = np.tile(self.roots, n_rows)
+        row_offsets = np.repeat(np.arange(n_rows) * X.shape[1], n_trees)
+        flat_X = X.ravel()
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        while active.size:
+            current = nodes[active]
+            current = self._step(current, flat_X[row_offsets[active] + self.feature[current]], check_missing)
+            nodes[active] = current
+            active = active[~self.is_leaf[current]]
+        return nodes.reshape(n_rows, n_trees)
+
+    def raw_score(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        values = self.value[self.leaves(X)]
+        # Trees are stored iteration by iteration, one tree per class
+        raw = values.reshape(len(X), -1, self.num_class).sum(axis=1)
+        if self.average_output:
+            raw /= values.shape[1] // self.num_class
+        return raw
+
+    def predict_proba(self, X):
+        raw = self.raw_score(X)
+        raw -= raw.max(axis=1, keepdims=True)
+        np.exp(raw, out=raw)
+        raw /= raw.sum(axis=1, keepdims=True)
+        return raw
+
+
+class AutoEngine:
+    """Use the array engine for small batches and LightGBM for large ones.
+
+    The array walk wins on per-call overhead for a handful of rows, while
+    LightGBM's compiled traversal wins once the batch is large.
+    """
+
+    accepts_arrays = True
+
+    def __init__(self, model, arrays, max_rows):
+        self.model = model
+        self.arrays = arrays
+        self.max_rows = max_rows
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if len(X) <= self.max_rows:
+            return self.arrays.predict_proba(X)
+        return self.model.predict_proba(to_frame(X))
@@ -0,0 +1,75 @@
+"""Compare the array tree engine with LGBMClassifier.predict_proba.
+
+Checks agreement on a held-out feature matrix and times both engines at
+batch sizes 1, 64 and 4096. Run from precog-matrix-fast-api with the
+package installed (pip install .):
+
+    python benchmarks/bench_treeeval.py --model models/crime_prediction_lightgbm_model.joblib \
+        --scaler models/scaler.joblib [--holdout holdout.npy]
+
+Without --holdout, rows are drawn at random inside Toronto bounds over
+2014-2024 and encoded with the production feature encoder.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.features import encode_features, to_frame
+from app.predict import load_model
+from app.preproc import LAT_BOUNDS, LONG_BOUNDS, load_scaler
+from app.treeeval import TreeEnsemble
+
+BATCH_SIZES = [1, 64, 4096]
+
+
+def random_rows(scaler, n, seed=0):
+    rng = np.random.default_rng(seed)
+    days = np.datetime64('2014-01-01T00', 'h') + rng.integers(0, 11 * 365 * 24, n)
+    dates = days.astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    return encode_features(
+        rng.uniform(*LAT_BOUNDS, n), rng.uniform(*LONG_BOUNDS, n),
+        months.astype('datetime64[Y]').astype(np.int64) + 1970,
+        months.astype(np.int64) % 12 + 1,
+        (dates - months.astype('datetime64[D]')).astype(np.int64) + 1,
+        (days - dates.astype('datetime64[h]')).astype(np.int64),
+        scaler=scaler)
+
+
+def latency(func, repeat):
+    """Return (p50, p99) of `repeat` calls in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default='models/crime_prediction_lightgbm_model.joblib')
+    parser.add_argument('--scaler', default='models/scaler.joblib')
+    parser.add_argument('--holdout', help='.npy file of encoded, scaled feature rows')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    arrays = TreeEnsemble.from_model(model)
+    X = np.load(args.holdout) if args.holdout else random_rows(load_scaler(args.scaler), 20000)
+
+    difference = np.abs(arrays.predict_proba(X) - model.predict_proba(to_frame(X))).max()
+    print(f"held-out rows: {len(X)}  max |arrays - predict_proba|: {difference:.3g}")
+
+    print(f"{'batch':>6} {'lightgbm p50':>13} {'p99':>8} {'arrays p50':>11} {'p99':>8}  (ms)")
+    for size in BATCH_SIZES:
+        batch = X[:size]
+        repeat = max(3, args.repeat * 64 // max(size, 64))
+        lgb = latency(lambda: model.predict_proba(to_frame(batch)), repeat)
+        arr = latency(lambda: arrays.predict_proba(batch), repeat)
+        print(f"{size:>6} {lgb[0]:>13.3f} {lgb[1]:>8.3f} {arr[0]:>11.3f} {arr[1]:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""Offline latency/throughput benchmarks for the prediction service.
+
+Runs without network access or production artifacts: the GoogleV3 geocoder
+is replaced by a deterministic stub and a synthetic LightGBM model and
+scaler with the production feature schema are trained into a temp dir.
+Run from precog-matrix-fast-api with the package installed (pip install .):
+
+    python benchmarks/run.py --output bench.json
+    python benchmarks/run.py --output new.json --baseline bench.json --max-regression 10
+
+Each stage (load_data, add_trigonometric_features, preproc, predict.predict,
+encode_features) is timed on its own, then the FastAPI app is driven end to
+end through its ASGI interface at each --concurrency level. Results (p50,
+p95, p99 in ms, requests/sec and peak RSS) go to a JSON file that can be
+compared against a stored baseline; the exit code is 1 on a regression.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+FEATURE_COLUMNS = ['LAT_WGS84', 'LONG_WGS84', 'OCC_YEAR', 'MONTH_SIN', 'MONTH_COS',
+                   'HOUR_SIN', 'HOUR_COS', 'OCC_DAY_SIN', 'OCC_DAY_COS',
+                   'OCC_DOY_SIN', 'OCC_DOY_COS', 'OCC_DOW_SIN', 'OCC_DOW_COS']
+STUB_ADDRESSES = [f"{number} Queen St W" for number in range(1, 201)]
+
+
+def make_artifacts(directory, rows=20000, trees=100, seed=0):
+    """Train a synthetic six-class model and scaler on random in-bounds rows."""
+    import joblib
+    import lightgbm
+    from sklearn.preprocessing import StandardScaler
+
+    from app.features import MODEL_COLUMNS, encode_features
+    from app.preproc import LAT_BOUNDS, LONG_BOUNDS
+
+    rng = np.random.default_rng(seed)
+    hours = np.datetime64('2014-01-01T00', 'h') + rng.integers(0, 10 * 365 * 24, rows)
+    raw = pd.DataFrame(encode_features(
+        rng.uniform(*LAT_BOUNDS, rows), rng.uniform(*LONG_BOUNDS, rows),
+        *calendar(hours)), columns=MODEL_COLUMNS)
+
+    scaler = StandardScaler().fit(raw[FEATURE_COLUMNS])
+    scaled = pd.DataFrame(scaler.transform(raw[FEATURE_COLUMNS]), columns=FEATURE_COLUMNS)[MODEL_COLUMNS]
+    labels = rng.integers(0, 6, rows)
+    model = lightgbm.LGBMClassifier(n_estimators=trees, verbose=-1, random_state=seed).fit(scaled, labels)
+
+    model_path = os.path.join(directory, 'crime_prediction_lightgbm_model.joblib')
+    scaler_path = os.path.join(directory, 'scaler.joblib')
+    joblib.dump(model, model_path)
+    joblib.dump(scaler, scaler_path)
+    return model_path, scaler_path
+
+
+def calendar(hours):
+    dates = hours.astype('datetime64[D]')
+    months = hours.astype('datetime64[M]')
+    return (months.astype('datetime64[Y]').astype(np.int64) + 1970,
+            months.astype(np.int64) % 12 + 1,
+            (dates - months.astype('datetime64[D]')).astype(np.int64) + 1,
+            (hours - dates.astype('datetime64[h]')).astype(np.int64))
+
+
+async def stub_geocoder(address):
+    """Deterministic in-bounds location for an address, with a little latency."""
+    from app.preproc import LAT_BOUNDS, LONG_BOUNDS
+
+    await asyncio.sleep(0.001)
+    digest = hashlib.sha256(address.encode()).digest()
+    u, v = int.from_bytes(digest[:4], 'big') / 2 ** 32, int.from_bytes(digest[4:8], 'big') / 2 ** 32
+    return (LAT_BOUNDS[0] + u * (LAT_BOUNDS[1] - LAT_BOUNDS[0]),
+            LONG_BOUNDS[0] + v * (LONG_BOUNDS[1] - LONG_BOUNDS[0]))
+
+
+def summarize(timings_ms, elapsed=None):
+    timings = np.asarray(timings_ms)
+    result = {
+        "n": len(timings),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "mean_ms": float(timings.mean()),
+    }
+    if elapsed:
+        result["requests_per_sec"] = len(timings) / elapsed
+    return result
+
+
+def time_calls(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return summarize(timings)
+
+
+def bench_stages(model_path, scaler_path, repeat):
+    from app.features import encode_features, scaler_params, to_frame
+    from app.predict import load_model, predict
+    from app.preproc import add_trigonometric_features, load_data, load_scaler, preproc
+
+    model, scaler = load_model(model_path), load_scaler(scaler_path)
+    row = (43.6532, -79.3832, 2024, 6, 9, 18)
+    cyclic = ['HOUR', 'OCC_DAY', 'MONTH', 'OCC_DOW', 'OCC_DOY']
+    loaded = load_data(*row)
+    processed = preproc(load_data(*row), scaler)
+    params = scaler_params(scaler)
+
+    return {
+        "load_data": time_calls(lambda: load_data(*row), repeat),
+        "add_trigonometric_features": time_calls(lambda: add_trigonometric_features(loaded.copy(), cyclic), repeat),
+        "preproc": time_calls(lambda: preproc(loaded.copy(), scaler), repeat),
+        "predict.predict": time_calls(lambda: predict(processed, model), repeat),
+        "encode_features": time_calls(lambda: encode_features(*row, params=params), repeat),
+        "encode_features+predict": time_calls(
+            lambda: predict(to_frame(encode_features(*row, params=params)), model), repeat),
+    }
+
+
+async def bench_endpoint(concurrency_levels, requests_per_level, cache_path):
+    import httpx
+
+    import app.fast as fast
+    from app.geocache import GeoCache
+
+    results = {}
+    async with fast.app.router.lifespan_context(fast.app):
+        fast.geocode_cache = GeoCache(None, path=cache_path, async_geocoder=stub_geocoder)
+        transport = httpx.ASGITransport(app=fast.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            rng = np.random.default_rng(1)
+
+            async def one(timings, errors):
+                params = {"address": STUB_ADDRESSES[rng.integers(len(STUB_ADDRESSES))],
+                          "crime_date": f"2024-06-{rng.integers(1, 31):02d}T{rng.integers(0, 24):02d}:00"}
+                start = time.perf_counter()
+                response = await client.get('/predict', params=params)
+                timings.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200 or "error" in response.json():
+                    errors.append(response.status_code)
+
+            for concurrency in concurrency_levels:
+                timings, errors = [], []
+                semaphore = asyncio.Semaphore(concurrency)
+
+                async def limited():
+                    async with semaphore:
+                        await one(timings, errors)
+
+                start = time.perf_counter()
+                await asyncio.gather(*(limited() for _ in range(requests_per_level)))
+                elapsed = time.perf_counter() - start
+                results[f"predict@{concurrency}"] = {**summarize(timings, elapsed), "errors": len(errors)}
+    return results
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def compare(current, baseline, max_regression):
+    """Print per-benchmark changes and return the names that regressed."""
+    regressions = []
+    for section in ('stages', 'endpoint'):
+        for name, stats in current.get(section, {}).items():
+            before = baseline.get(section, {}).get(name)
+            if not before:
+                continue
+            change = (stats['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100
+            flag = ''
+            if change > max_regression:
+                regressions.append(name)
+                flag = '  REGRESSION'
+            print(f"{name:<32} p50 {before['p50_ms']:9.3f} -> {stats['p50_ms']:9.3f} ms ({change:+.1f}%){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--baseline', help='previous results to compare against')
+    parser.add_argument('--max-regression', type=float, default=10.0, help='allowed p50 increase in percent')
+    parser.add_argument('--repeat', type=int, default=500, help='calls per stage benchmark')
+    parser.add_argument('--requests', type=int, default=1000, help='requests per concurrency level')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        model_path, scaler_path = make_artifacts(directory)
+        # The app reads its artifact and cache locations from the environment at import
+        os.environ['MODEL_PATH'], os.environ['SCALER_PATH'] = model_path, scaler_path
+        os.environ['GEOCODE_CACHE_PATH'] = os.path.join(directory, 'geocode.sqlite3')
+
+        results = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "stages": bench_stages(model_path, scaler_path, args.repeat),
+            "endpoint": asyncio.run(bench_endpoint(args.concurrency, args.requests,
+                                                   os.environ['GEOCODE_CACHE_PATH'])),
+        }
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    for section in ('stages', 'endpoint'):
+        for name, stats in results[section].items():
+            rps = f"  {stats['requests_per_sec']:8.1f} req/s" if 'requests_per_sec' in stats else ''
+            print(f"{name:<32} p50 {stats['p50_ms']:9.3f}  p95 {stats['p95_ms']:9.3f}  "
+                  f"p99 {stats['p99_ms']:9.3f} ms{rps}")
+    print(f"peak RSS {results['peak_rss_mb']:.1f} MB -> {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
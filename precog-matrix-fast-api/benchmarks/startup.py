@@ -0,0 +1,128 @@
+"""Cold-start time and per-worker memory of the serving modes (Linux only).
+
+Starts the API with synthetic artifacts (see run.py) as a single uvicorn
+process and as the pre-fork server with --workers workers, and reports:
+- the time until the first request succeeds
+- RSS, PSS, shared and private memory of every worker after some traffic
+
+PSS splits shared pages between the processes mapping them, so the sum of
+PSS is the real footprint of the whole server:
+
+    python benchmarks/startup.py --workers 4 --output startup.json
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from run import make_artifacts
+
+MODES = {
+    "uvicorn": lambda port: [sys.executable, '-m', 'uvicorn', 'app.fast:app', '--port', str(port)],
+    "prefork": lambda port: [sys.executable, '-m', 'app.serve'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url, process, timeout=120):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - start
+        except OSError:
+            time.sleep(0.02)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def memory_kb(pid):
+    """Rss, Pss, Shared and Private from /proc/<pid>/smaps_rollup, in kB."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        "rss_mb": fields['Rss'] / 1024,
+        "pss_mb": fields['Pss'] / 1024,
+        "shared_mb": (fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0)) / 1024,
+        "private_mb": (fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)) / 1024,
+    }
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def measure(mode, workers, env, requests):
+    port = free_port()
+    env = {**env, 'PORT': str(port), 'SERVE_WORKERS': str(workers), 'SERVE_HOST': '127.0.0.1'}
+    process = subprocess.Popen(MODES[mode](port), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f'http://127.0.0.1:{port}'
+        cold_start = wait_ready(f'{base}/', process)
+        # Exercise the model so lazily touched pages show up in the numbers
+        for i in range(requests):
+            urllib.request.urlopen(f'{base}/grid?crime_date=2024-06-{i % 28 + 1:02d}T12:00', timeout=30).read()
+
+        pids = children(process.pid) if mode == 'prefork' else [process.pid]
+        workers_memory = [memory_kb(pid) for pid in pids]
+        result = {
+            "cold_start_s": cold_start,
+            "workers": workers_memory,
+            "total_pss_mb": sum(worker['pss_mb'] for worker in workers_memory),
+        }
+        if mode == 'prefork':
+            result["parent"] = memory_kb(process.pid)
+            result["total_pss_mb"] += result["parent"]["pss_mb"]
+        return result
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default='startup.json')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=50, help='warm-up requests before reading memory')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        model_path, scaler_path = make_artifacts(directory)
+        env = {**os.environ, 'MODEL_PATH': model_path, 'SCALER_PATH': scaler_path,
+               'GEOCODE_CACHE_PATH': os.path.join(directory, 'geocode.sqlite3'),
+               'PYTHONPATH': os.pathsep.join(filter(None, [os.getcwd(), os.getenv('PYTHONPATH')]))}
+        results = {
+            "uvicorn": measure('uvicorn', 1, env, args.requests),
+            f"prefork@{args.workers}": measure('prefork', args.workers, env, args.requests),
+        }
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    for name, result in results.items():
+        print(f"{name:<12} cold start {result['cold_start_s']:6.2f} s  total PSS {result['total_pss_mb']:7.1f} MB")
+        for worker in result['workers']:
+            print(f"{'':<12} worker RSS {worker['rss_mb']:7.1f} MB  PSS {worker['pss_mb']:7.1f} MB  "
+                  f"shared {worker['shared_mb']:7.1f} MB  private {worker['private_mb']:7.1f} MB")
+    print(f"-> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
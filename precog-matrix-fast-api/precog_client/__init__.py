@@ -0,0 +1 @@
+from precog_client.client import CLASS_NAMES, AsyncPrecogClient, PrecogClient, PrecogError
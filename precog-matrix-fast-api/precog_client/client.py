@@ -0,0 +1,251 @@
+"""Python client for the PreCog Matrix API.
+
+Both clients keep a pool of keep-alive connections, retry on connection
+errors and 429/502/503/504 responses, and memoize predictions by
+(address, hour) so repeated questions never leave the process:
+
+    with PrecogClient("http://localhost:8000") as client:
+        client.predict("100 Queen St W", datetime(2024, 6, 9, 18))
+        client.predict_many([("100 Queen St W", "2024-06-09T18:00"), ...])
+
+    async with AsyncPrecogClient("http://localhost:8000") as client:
+        await client.predict_many(items)
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import httpx
+
+PRECOG_API_URL = os.getenv("PRECOG_API_URL", "http://localhost:8000")
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Order of the probabilities in every "prediction"
+CLASS_NAMES = ["AUTO THEFT", "ASSAULT", "ROBBERY", "THEFT OVER", "BREAK AND ENTER", "HOMICIDE"]
+
+
+class PrecogError(Exception):
+    """Raised when the API answers with an error for a request or a row."""
+
+
+def normalize_date(crime_date):
+    """Return the ISO string of the hour a datetime or ISO string falls in; the model only sees the hour."""
+    if isinstance(crime_date, str):
+        crime_date = datetime.fromisoformat(crime_date)
+    return crime_date.replace(minute=0, second=0, microsecond=0).isoformat()
+
+
+def memo_key(address, crime_date):
+    return " ".join(address.split()).lower(), normalize_date(crime_date)
+
+
+class Memo:
+    """Thread-safe LRU of prediction results with a time-to-live."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class BaseClient:
+    """Request building and memoization shared by the sync and async clients."""
+
+    def __init__(self, base_url=PRECOG_API_URL, timeout=10.0, retries=3, backoff=0.25, batch_size=1000,
+                 max_connections=20, memo_size=10000, memo_ttl=3600):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.memo = Memo(memo_size, memo_ttl)
+
+    def _delay(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2 ** attempt
+
+    @staticmethod
+    def _parse_predict(payload):
+        """/predict returns one row wrapped in a list; results here always hold the row itself."""
+        if "error" in payload:
+            raise PrecogError(payload["error"])
+        return {**payload, "prediction": payload["prediction"][0]}
+
+    def _split(self, items):
+        """Resolve memoized items; return (results, [(position, key, batch item)] still to fetch)."""
+        results = [None] * len(items)
+        pending = []
+        for position, (address, crime_date) in enumerate(items):
+            key = memo_key(address, crime_date)
+            cached = self.memo.get(key)
+            if cached is not None:
+                results[position] = cached
+            else:
+                pending.append((position, key, {"address": address, "crime_date": key[1]}))
+        return results, pending
+
+    def _chunks(self, pending):
+        # Each distinct key is sent once even if the caller repeats it
+        unique = list(OrderedDict((key, item) for _, key, item in pending).items())
+        return [unique[start:start + self.batch_size] for start in range(0, len(unique), self.batch_size)]
+
+    def _merge(self, results, pending, fetched):
+        for position, key, _ in pending:
+            result = fetched[key]
+            if "error" not in result:
+                self.memo.put(key, result)
+            results[position] = result
+        return results
+
+    @staticmethod
+    def _nearby_params(lat, lon, address, params):
+        return {name: value for name, value in {"lat": lat, "lon": lon, "address": address, **params}.items()
+                if value is not None}
+
+    @staticmethod
+    def _batch_results(chunk, payload):
+        return {key: {**row, "model_version": payload["model_version"]} if "error" not in row else row
+                for (key, _), row in zip(chunk, payload["results"])}
+
+
+class PrecogClient(BaseClient):
+    """Blocking client backed by one pooled httpx.Client."""
+
+    def __init__(self, base_url=PRECOG_API_URL, **options):
+        super().__init__(base_url, **options)
+        self.http = httpx.Client(base_url=base_url, timeout=self.timeout,
+                                 transport=httpx.HTTPTransport(retries=self.retries, limits=self.limits))
+
+    def _request(self, method, url, **kwargs):
+        for attempt in range(self.retries + 1):
+            response = self.http.request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                break
+            time.sleep(self._delay(attempt, response))
+        response.raise_for_status()
+        return response.json()
+
+    def predict(self, address, crime_date):
+        """Return {"prediction": [probabilities in CLASS_NAMES order], "model_version": ..., ...}."""
+        key = memo_key(address, crime_date)
+        cached = self.memo.get(key)
+        if cached is not None:
+            return cached
+        payload = self._parse_predict(self._request("GET", "/predict", params={"address": address, "crime_date": key[1]}))
+        self.memo.put(key, payload)
+        return payload
+
+    def predict_many(self, items):
+        """Predict [(address, crime_date)] through /predict/batch; one result dict per item, in order.
+
+        Rows the API rejects come back as {"error": ...} instead of raising.
+        """
+        results, pending = self._split(items)
+        fetched = {}
+        for chunk in self._chunks(pending):
+            payload = self._request("POST", "/predict/batch", json={"items": [item for _, item in chunk]})
+            fetched.update(self._batch_results(chunk, payload))
+        return self._merge(results, pending, fetched)
+
+    def grid(self, crime_date, level=0):
+        return self._request("GET", "/grid", params={"crime_date": normalize_date(crime_date), "level": level})
+
+    def nearby(self, lat=None, lon=None, address=None, **params):
+        """Historical incidents around a point or address; `params` as /nearby takes them (mode, radius, k, hours, ...)."""
+        return self._request("GET", "/nearby", params=self._nearby_params(lat, lon, address, params))
+
+    def close(self):
+        self.http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncPrecogClient(BaseClient):
+    """asyncio client backed by one pooled httpx.AsyncClient; batch chunks are sent concurrently."""
+
+    def __init__(self, base_url=PRECOG_API_URL, concurrency=4, **options):
+        super().__init__(base_url, **options)
+        self.concurrency = concurrency
+        self.http = httpx.AsyncClient(base_url=base_url, timeout=self.timeout,
+                                      transport=httpx.AsyncHTTPTransport(retries=self.retries, limits=self.limits))
+
+    async def _request(self, method, url, **kwargs):
+        for attempt in range(self.retries + 1):
+            response = await self.http.request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                break
+            await asyncio.sleep(self._delay(attempt, response))
+        response.raise_for_status()
+        return response.json()
+
+    async def predict(self, address, crime_date):
+        key = memo_key(address, crime_date)
+        cached = self.memo.get(key)
+        if cached is not None:
+            return cached
+        payload = self._parse_predict(
+            await self._request("GET", "/predict", params={"address": address, "crime_date": key[1]}))
+        self.memo.put(key, payload)
+        return payload
+
+    async def predict_many(self, items):
+        results, pending = self._split(items)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send(chunk):
+            async with semaphore:
+                payload = await self._request("POST", "/predict/batch", json={"items": [item for _, item in chunk]})
+            return self._batch_results(chunk, payload)
+
+        fetched = {}
+        for part in await asyncio.gather(*(send(chunk) for chunk in self._chunks(pending))):
+            fetched.update(part)
+        return self._merge(results, pending, fetched)
+
+    async def grid(self, crime_date, level=0):
+        return await self._request("GET", "/grid", params={"crime_date": normalize_date(crime_date), "level": level})
+
+    async def nearby(self, lat=None, lon=None, address=None, **params):
+        return await self._request("GET", "/nearby", params=self._nearby_params(lat, lon, address, params))
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
@@ -5,6 +5,11 @@ with open("requirements.txt") as f:
     content = f.readlines()
 requirements = [x.strip() for x in content if "git+" not in x]
 
+# Training and UI extras: pip install .[training]
+with open("requirements-training.txt") as f:
+    training_requirements = [x.strip() for x in f.readlines()
+                             if x.strip() and not x.startswith(("#", "-r")) and "git+" not in x]
+
 setup(name='precog-matrix',
       version="0.0.12",
       description="Precog Matrix Model (api_pred)",
@@ -12,6 +17,7 @@ setup(name='precog-matrix',
       author="Andre, Mauro and Rafael",
       author_email="mauromsilva@gmail.com",
       install_requires=requirements,
+      extras_require={"training": training_requirements},
       packages=find_packages()
       #test_suite="tests",
       # include_package_data: to install data from MANIFEST.in
@@ -0,0 +1,36 @@
+import asyncio
+import threading
+
+import pytest
+
+
+class StubGeocoder:
+    """Geocoder returning a fixed point per address and counting its calls.
+
+    With `delay` the async variant sleeps before answering so concurrent
+    lookups overlap; `gate` holds the sync variant until it is set.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def point(self, address):
+        return 43.6 + len(address) / 1000, -79.4
+
+    def __call__(self, address):
+        self.gate.wait(5)
+        self.calls.append(address)
+        return self.point(address)
+
+    async def coroutine(self, address):
+        self.calls.append(address)
+        await asyncio.sleep(self.delay)
+        return self.point(address)
+
+
+@pytest.fixture
+def geocoder():
+    return StubGeocoder(delay=0.05)
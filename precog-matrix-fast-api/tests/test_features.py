@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import StandardScaler
+
+from app.features import (FEATURE_COLUMNS, MODEL_COLUMNS, calendar_fields, encode_features, feature_values,
+                          hourly_calendar, scaler_params)
+from app.preproc import LAT_BOUNDS, LONG_BOUNDS, load_data_batch, preproc
+
+# (year, month, day, hour): leap day, year end and start, first and last hour,
+# and a Sunday (2024-06-09) and Saturday (2024-06-08) for the DOW remap
+EDGE_DATES = [(2024, 2, 29, 0), (2020, 2, 29, 23), (2023, 12, 31, 23), (2024, 12, 31, 0),
+              (2024, 1, 1, 0), (2024, 6, 9, 12), (2024, 6, 8, 23), (2014, 1, 5, 0), (2014, 1, 4, 23)]
+
+
+def random_rows(rng, n):
+    dates = pd.Timestamp('2014-01-01') + pd.to_timedelta(rng.integers(0, 11 * 366, n), unit='D')
+    return dict(lat=rng.uniform(*LAT_BOUNDS, n), long=rng.uniform(*LONG_BOUNDS, n),
+                year=dates.year.to_numpy(), month=dates.month.to_numpy(), day=dates.day.to_numpy(),
+                hour=rng.integers(0, 24, n))
+
+
+def edge_rows(rng):
+    year, month, day, hour = (np.array(column) for column in zip(*EDGE_DATES))
+    return dict(lat=rng.uniform(*LAT_BOUNDS, len(year)), long=rng.uniform(*LONG_BOUNDS, len(year)),
+                year=year, month=month, day=day, hour=hour)
+
+
+@pytest.fixture(scope='module')
+def scaler():
+    """Scaler fitted on the pandas features of random rows, as in training."""
+    rows = random_rows(np.random.default_rng(0), 5000)
+    frame = load_data_batch(**rows)
+    frame = frame.assign(**{f'{column}_{func}': getattr(np, func.lower())(2 * np.pi * frame[column] / length)
+                            for column, length in (('HOUR', 24), ('OCC_DAY', 31), ('MONTH', 12),
+                                                   ('OCC_DOW', 7), ('OCC_DOY', 365))
+                            for func in ('SIN', 'COS')})
+    return StandardScaler().fit(frame[FEATURE_COLUMNS])
+
+
+def pandas_path(rows, scaler):
+    return preproc(load_data_batch(**rows), scaler)
+
+
+@pytest.mark.parametrize('rows', [
+    random_rows(np.random.default_rng(1), 2000),
+    edge_rows(np.random.default_rng(2)),
+], ids=['random', 'edge-dates'])
+def test_matches_pandas_path(rows, scaler):
+    expected = pandas_path(rows, scaler)
+    assert list(expected.columns) == MODEL_COLUMNS
+    np.testing.assert_array_equal(encode_features(**rows, scaler=scaler), expected.to_numpy(dtype=np.float64))
+
+
+def test_feature_values_cover_encoded_features():
+    rows = random_rows(np.random.default_rng(4), 5000)
+    raw = encode_features(**rows)
+    for j, values in enumerate(feature_values()):
+        if values is not None:
+            assert np.isin(raw[:, j], values).all(), MODEL_COLUMNS[j]
+
+
+def test_params_match_scaler(scaler):
+    rows = edge_rows(np.random.default_rng(3))
+    np.testing.assert_array_equal(encode_features(**rows, params=scaler_params(scaler)),
+                                  encode_features(**rows, scaler=scaler))
+
+
+def test_single_row_matches_pandas_path(scaler):
+    rows = dict(lat=43.6532, long=-79.3832, year=2024, month=2, day=29, hour=0)
+    expected = pandas_path({name: [value] for name, value in rows.items()}, scaler)
+    np.testing.assert_array_equal(encode_features(**rows, scaler=scaler), expected.to_numpy(dtype=np.float64))
+
+
+def test_calendar_fields_match_pandas():
+    year, month, day, _ = (np.array(column) for column in zip(*EDGE_DATES))
+    dow, doy = calendar_fields(year, month, day)
+    frame = load_data_batch(np.zeros(len(year)), np.zeros(len(year)), year, month, day, np.zeros(len(year)))
+    np.testing.assert_array_equal(dow, frame['OCC_DOW'])
+    np.testing.assert_array_equal(doy, frame['OCC_DOY'])
+
+
+@pytest.mark.parametrize('date, dow', [((2024, 6, 9), 1), ((2024, 6, 10), 2), ((2024, 6, 8), 7)])
+def test_day_of_week_starts_on_sunday(date, dow):
+    assert calendar_fields(*([value] for value in date))[0][0] == dow
+
+
+@pytest.mark.parametrize('date', [(2023, 2, 29), (2024, 4, 31), (2024, 13, 1), (2024, 0, 10), (2024, 1, 0)])
+def test_invalid_dates_raise(date):
+    with pytest.raises(ValueError, match='Invalid date'):
+        encode_features(43.65, -79.38, *date, 12)
+
+
+def test_hourly_calendar_crosses_leap_day_and_year_end():
+    year, month, day, hour = hourly_calendar('2024-02-28T22', 28)
+    assert (year[0], month[0], day[0], hour[0]) == (2024, 2, 28, 22)
+    assert (year[2], month[2], day[2], hour[2]) == (2024, 2, 29, 0)
+    assert (year[-1], month[-1], day[-1], hour[-1]) == (2024, 3, 1, 1)
+
+    year, month, day, hour = hourly_calendar('2023-12-31T23', 2)
+    assert list(zip(year, month, day, hour)) == [(2023, 12, 31, 23), (2024, 1, 1, 0)]
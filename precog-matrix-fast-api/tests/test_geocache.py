@@ -0,0 +1,223 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import geocache
+from app.geocache import GeoCache, normalize_address
+
+
+@pytest.fixture
+def cache(tmp_path, geocoder):
+    return GeoCache(geocoder, path=str(tmp_path / 'geocode.sqlite3'), async_geocoder=geocoder.coroutine)
+
+
+@pytest.mark.parametrize('address, key', [
+    ('100 Queen St W', '100 queen st w'),
+    ('100  Queen Street West, Toronto, Ontario, Canada', '100 queen st w toronto on'),
+    ('100 queen st. w.', '100 queen st w'),
+    ('１００ Queen Avenue', '100 queen ave'),  # full-width digits fold under NFKC
+    ('  Bay St  ', 'bay st'),
+])
+def test_normalize_address(address, key):
+    assert normalize_address(address) == key
+
+
+def test_spellings_share_an_entry(cache, geocoder):
+    first = cache.geocode('100 Queen Street West')
+    assert cache.geocode('100 queen st. w.') == first
+    assert len(geocoder.calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_expire_after_ttl(tmp_path, geocoder, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(geocache.time, 'time', lambda: now[0])
+    cache = GeoCache(geocoder, path=str(tmp_path / 'geocode.sqlite3'), ttl=60)
+
+    cache.geocode('1 Yonge St')
+    now[0] += 59
+    cache.geocode('1 Yonge St')
+    assert len(geocoder.calls) == 1
+
+    now[0] += 2
+    assert cache.lookup(normalize_address('1 Yonge St')) is None
+    cache.geocode('1 Yonge St')
+    assert len(geocoder.calls) == 2
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, geocoder, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(geocache.time, 'time', lambda: now[0])
+    cache = GeoCache(geocoder, path=str(tmp_path / 'geocode.sqlite3'), max_entries=2, memory_entries=0)
+
+    for address in ('1 A St', '2 B St'):
+        now[0] += 1
+        cache.geocode(address)
+    now[0] += 1
+    cache.geocode('1 A St')  # now more recently used than '2 B St'
+    now[0] += 1
+    cache.geocode('3 C St')
+
+    assert cache.lookup(normalize_address('2 B St')) is None
+    assert cache.lookup(normalize_address('1 A St')) is not None
+    assert cache.lookup(normalize_address('3 C St')) is not None
+
+
+def test_entries_persist_across_instances(tmp_path, geocoder):
+    path = str(tmp_path / 'geocode.sqlite3')
+    point = GeoCache(geocoder, path=path).geocode('100 Queen St W')
+
+    other = GeoCache(geocoder, path=path)
+    assert other.geocode('100 Queen Street West') == point
+    assert len(geocoder.calls) == 1
+    assert (other.hits, other.misses) == (1, 0)
+
+
+def test_concurrent_threads_share_one_call(cache, geocoder):
+    geocoder.gate.clear()
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(cache.geocode, '100 Queen St W') for _ in range(8)]
+        threading.Timer(0.1, geocoder.gate.set).start()
+        results = [future.result(5) for future in futures]
+
+    assert len(set(results)) == 1
+    assert len(geocoder.calls) == 1
+    assert cache.misses == 1
+
+
+def test_concurrent_coroutines_share_one_call(cache, geocoder):
+    async def run():
+        return await asyncio.gather(*(cache.ageocode_status('100 Queen St W') for _ in range(10)))
+
+    results = asyncio.run(run())
+    assert len(geocoder.calls) == 1
+    assert len({point for point, _ in results}) == 1
+    assert sorted(hit for _, hit in results) == [False] + [True] * 9
+
+
+def test_cancelled_waiter_does_not_affect_others(cache, geocoder):
+    async def run():
+        leader = asyncio.create_task(cache.ageocode_status('100 Queen St W'))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(cache.ageocode_status('100 Queen St W')) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        waiters[0].cancel()
+        results = await asyncio.gather(leader, *waiters, return_exceptions=True)
+        return results
+
+    leader, cancelled, *others = asyncio.run(run())
+    assert isinstance(cancelled, asyncio.CancelledError)
+    assert leader[1] is False
+    assert all(result == (leader[0], True) for result in others)
+    assert len(geocoder.calls) == 1
+
+
+def test_cancelled_leader_hands_the_lookup_to_a_waiter(cache, geocoder):
+    async def run():
+        leader = asyncio.create_task(cache.ageocode_status('100 Queen St W'))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(cache.ageocode_status('100 Queen St W')) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*waiters)
+
+    results = asyncio.run(run())
+    assert len({point for point, _ in results}) == 1
+    assert sorted(hit for _, hit in results) == [False, True, True]
+    assert len(geocoder.calls) == 2
+
+
+def test_errors_reach_every_waiter(tmp_path):
+    calls = []
+
+    async def failing(address):
+        calls.append(address)
+        await asyncio.sleep(0.05)
+        raise ValueError(address)
+
+    cache = GeoCache(None, path=str(tmp_path / 'geocode.sqlite3'), async_geocoder=failing)
+
+    async def run():
+        return await asyncio.gather(*(cache.ageocode('1 A St') for _ in range(4)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(calls) == 1
+    assert cache.lookup(normalize_address('1 A St')) is None
+
+
+def stored_keys(cache):
+    return {key for (key,) in cache._execute("SELECT key FROM geocode")}
+
+
+def test_eviction_waits_for_the_slack(tmp_path, geocoder, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(geocache.time, 'time', lambda: now[0])
+    cache = GeoCache(geocoder, path=str(tmp_path / 'geocode.sqlite3'), max_entries=10)
+
+    for i in range(11):
+        now[0] += 1
+        cache.geocode(f'{i} A St')
+    assert len(stored_keys(cache)) == 11  # within 10% of max_entries
+
+    now[0] += 1
+    cache.geocode('11 A St')
+    assert stored_keys(cache) == {normalize_address(f'{i} A St') for i in range(2, 12)}
+
+
+def test_memory_hits_count_as_use_for_eviction(tmp_path, geocoder, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(geocache.time, 'time', lambda: now[0])
+    cache = GeoCache(geocoder, path=str(tmp_path / 'geocode.sqlite3'), max_entries=2)
+
+    for address in ('1 A St', '2 B St', '1 A St', '3 C St'):  # the second '1 A St' is served from memory
+        now[0] += 1
+        cache.geocode(address)
+
+    assert len(geocoder.calls) == 3
+    assert stored_keys(cache) == {normalize_address('1 A St'), normalize_address('3 C St')}
+
+
+def test_memory_hits_are_written_in_batches(tmp_path, geocoder, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(geocache.time, 'time', lambda: now[0])
+    monkeypatch.setattr(geocache, 'TOUCH_BATCH', 2)
+    cache = GeoCache(geocoder, path=str(tmp_path / 'geocode.sqlite3'))
+    cache.geocode('1 A St')
+    cache.geocode('2 B St')
+
+    def accessed():
+        return dict(cache._execute("SELECT key, accessed FROM geocode"))
+
+    now[0] += 1
+    cache.geocode('1 A St')
+    assert set(accessed().values()) == {1000.0}
+    now[0] += 1
+    cache.geocode('2 B St')
+    assert accessed() == {normalize_address('1 A St'): 1001.0, normalize_address('2 B St'): 1002.0}
+
+
+def test_async_lookups_keep_sqlite_off_the_event_loop(cache, geocoder, monkeypatch):
+    threads = []
+    connection = cache._connection
+
+    def recording_connection():
+        threads.append(threading.get_ident())
+        return connection()
+
+    monkeypatch.setattr(cache, '_connection', recording_connection)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        await cache.ageocode('100 Queen St W')
+        cache._memory.clear()
+        await cache.ageocode('100 Queen St W')
+        return loop_thread
+
+    loop_thread = asyncio.run(run())
+    assert threads and loop_thread not in threads
+    assert len(geocoder.calls) == 1
@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from app import grid
+from app.grid import GridCache, cell_centers, grid_shape
+from app.registry import ModelBundle
+
+BUNDLE = ModelBundle(model=None, scaler=None, version='v1', feature_params=None)
+
+
+@pytest.fixture
+def computed(monkeypatch):
+    """Replace the scoring pass with a slow stub; returns the list of keys it was called with."""
+    calls = []
+    lock = threading.Lock()
+
+    def compute_grid(bundle, year, month, day, hour, level):
+        with lock:
+            calls.append((bundle.version, year, month, day, hour, level))
+        time.sleep(0.05)
+        if hour == 99:
+            raise ValueError("bad hour")
+        return np.full((6,) + grid_shape(level), hour, dtype=np.float32)
+
+    monkeypatch.setattr(grid, 'compute_grid', compute_grid)
+    return calls
+
+
+def test_cell_centers_stay_inside_the_bounds():
+    lats, longs = cell_centers(1)
+    assert (len(lats), len(longs)) == grid_shape(1)
+    assert grid.LAT_BOUNDS[0] < lats.min() and lats.max() < grid.LAT_BOUNDS[1]
+    assert np.all(np.diff(lats) < 0) and np.all(np.diff(longs) > 0)
+
+
+def test_rasters_are_cached_and_read_only(computed):
+    cache = GridCache()
+    first = cache.get(BUNDLE, 2024, 6, 9, 12, 0)
+    assert cache.get(BUNDLE, 2024, 6, 9, 12, 0) is first
+    assert not first.flags.writeable
+    assert len(computed) == 1
+
+
+def test_concurrent_misses_compute_once(computed):
+    cache = GridCache()
+    with ThreadPoolExecutor(8) as pool:
+        rasters = list(pool.map(lambda _: cache.get(BUNDLE, 2024, 6, 9, 12, 0), range(8)))
+    assert all(raster is rasters[0] for raster in rasters)
+    assert len(computed) == 1
+
+
+def test_errors_reach_every_waiter_and_are_not_cached(computed):
+    cache = GridCache()
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(cache.get, BUNDLE, 2024, 6, 9, 99, 0) for _ in range(4)]
+        errors = [future.exception() for future in futures]
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert len(computed) == 1
+
+    with pytest.raises(ValueError):
+        cache.get(BUNDLE, 2024, 6, 9, 99, 0)
+    assert len(computed) == 2
+
+
+def test_least_recently_used_rasters_are_evicted(computed):
+    cache = GridCache(max_entries=2)
+    for hour in (1, 2, 1, 3):
+        cache.get(BUNDLE, 2024, 6, 9, hour, 0)
+    cache.get(BUNDLE, 2024, 6, 9, 1, 0)
+    cache.get(BUNDLE, 2024, 6, 9, 2, 0)
+    assert [key[4] for key in computed] == [1, 2, 3, 2]
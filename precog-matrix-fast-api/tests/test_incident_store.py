@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from app import incident_store
+from app.incident_store import CRIME_TYPES, STORE_SCHEMA, IncidentStore, partition_path, write_store
+
+DFMATRIX_CRIMES = ['Assault', 'Auto Theft', 'Break and Enter', 'Homicide', 'Robbery', 'Theft Over']
+
+
+def dfmatrix(rng, n, years=(2020, 2021)):
+    dates = pd.Timestamp(f'{years[0]}-01-01') + pd.to_timedelta(
+        rng.integers(0, 365 * (years[1] - years[0] + 1), n), unit='D')
+    frame = pd.DataFrame({
+        'EVENT_UNIQUE_ID': [f'GO-{i}' for i in range(n)],
+        'LAT_WGS84': rng.uniform(43.6, 43.8, n), 'LONG_WGS84': rng.uniform(-79.6, -79.2, n),
+        'OCC_YEAR': dates.year, 'OCC_MONTH_NUM': dates.month, 'OCC_DAY': dates.day,
+        'OCC_HOUR': rng.integers(0, 24, n), 'OCC_DOW_NUM': (dates.dayofweek + 1) % 7 + 1, 'OCC_DOY': dates.dayofyear,
+    })
+    counts = rng.integers(0, 3, (n, len(DFMATRIX_CRIMES)))
+    counts[counts.sum(axis=1) == 0, 0] = 1
+    for i, name in enumerate(DFMATRIX_CRIMES):
+        frame[name] = counts[:, i]
+    return frame
+
+
+@pytest.fixture
+def frame():
+    return dfmatrix(np.random.default_rng(0), 500)
+
+
+@pytest.fixture
+def store(tmp_path, frame):
+    write_store(frame, str(tmp_path))
+    return IncidentStore(str(tmp_path))
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Paths of the partitions read from disk."""
+    paths = []
+    read_partition = incident_store.read_partition
+
+    def recording(path):
+        paths.append(path)
+        return read_partition(path)
+
+    monkeypatch.setattr(incident_store, 'read_partition', recording)
+    return paths
+
+
+def test_one_partition_per_month(store, frame):
+    expected = sorted({(int(y), int(m)) for y, m in zip(frame['OCC_YEAR'], frame['OCC_MONTH_NUM'])})
+    assert [(year, month) for year, month, _ in store.partitions()] == expected
+    assert all(path == partition_path(store.root, year, month) for year, month, path in store.partitions())
+
+
+def test_filters_open_only_matching_partitions(store, frame, opened):
+    result = store.query(['EVENT_UNIQUE_ID'], years=(2021, 2021), months=[3, 4])
+
+    assert sorted(opened) == [partition_path(store.root, 2021, 3), partition_path(store.root, 2021, 4)]
+    selected = frame[(frame['OCC_YEAR'] == 2021) & frame['OCC_MONTH_NUM'].isin([3, 4])]
+    assert sorted(result['EVENT_UNIQUE_ID']) == sorted(selected['EVENT_UNIQUE_ID'])
+
+
+def test_years_are_an_inclusive_range(store, frame):
+    result = store.query(['OCC_YEAR'], years=(2020, 2020))
+    assert len(result) == (frame['OCC_YEAR'] == 2020).sum()
+    assert set(result['OCC_YEAR']) == {2020}
+
+
+def test_columns_are_projected(store):
+    table = store.scan(['LAT_WGS84', 'ROBBERY'], crime_types=['HOMICIDE'], bbox=(43.65, -79.5, 43.75, -79.3))
+    assert table.schema == pa.schema([STORE_SCHEMA.field('LAT_WGS84'), STORE_SCHEMA.field('ROBBERY')])
+
+
+def test_crime_type_and_bbox_filters(store, frame):
+    result = store.query(['EVENT_UNIQUE_ID'], crime_types=['HOMICIDE', 'ROBBERY'],
+                         bbox=(43.65, -79.5, 43.75, -79.3))
+    selected = frame[((frame['Homicide'] > 0) | (frame['Robbery'] > 0))
+                     & frame['LAT_WGS84'].astype(np.float32).between(43.65, 43.75)
+                     & frame['LONG_WGS84'].astype(np.float32).between(-79.5, -79.3)]
+    assert sorted(result['EVENT_UNIQUE_ID']) == sorted(selected['EVENT_UNIQUE_ID'])
+
+
+def test_counts_are_int8_columns_named_by_crime_type(store, frame):
+    table = store.scan()
+    assert table.schema == STORE_SCHEMA
+    result = table.to_pandas().set_index('EVENT_UNIQUE_ID').loc[frame['EVENT_UNIQUE_ID']]
+    for crime, name in zip(CRIME_TYPES, DFMATRIX_CRIMES):
+        assert table.schema.field(crime).type == pa.int8()
+        np.testing.assert_array_equal(result[crime].to_numpy(), frame[name].to_numpy())
+
+
+def test_main_category_is_the_most_frequent_crime_type(tmp_path):
+    frame = dfmatrix(np.random.default_rng(1), 3)
+    counts = np.array([[0, 0, 0, 0, 2, 1],
+                       [1, 0, 1, 0, 0, 0],  # ties go to the first type
+                       [0, 0, 0, 1, 0, 0]])
+    frame[DFMATRIX_CRIMES] = counts
+    write_store(frame, str(tmp_path))
+
+    result = IncidentStore(str(tmp_path)).query(['EVENT_UNIQUE_ID', 'MCI_CATEGORY']).set_index('EVENT_UNIQUE_ID')
+    assert list(result.loc[frame['EVENT_UNIQUE_ID'], 'MCI_CATEGORY']) == ['ROBBERY', 'ASSAULT', 'HOMICIDE']
+    assert list(result['MCI_CATEGORY'].cat.categories) == CRIME_TYPES
+
+
+def test_rewrite_replaces_or_appends_partitions(tmp_path, frame):
+    write_store(frame, str(tmp_path))
+    month = frame[(frame['OCC_YEAR'] == 2020) & (frame['OCC_MONTH_NUM'] == 1)]
+    extra = dfmatrix(np.random.default_rng(2), 5, years=(2020, 2020)).assign(OCC_MONTH_NUM=1)
+    store = IncidentStore(str(tmp_path))
+
+    assert write_store(extra, str(tmp_path), append=True) == [(2020, 1)]
+    assert len(store.query(years=(2020, 2020), months=[1])) == len(month) + 5
+    write_store(extra, str(tmp_path))
+    assert len(store.query(years=(2020, 2020), months=[1])) == 5
+    assert len(store.query()) == len(frame) - len(month) + 5
+
+
+def test_empty_store_keeps_the_schema(tmp_path):
+    store = IncidentStore(str(tmp_path / 'missing'))
+    assert store.partitions() == []
+    assert store.scan(['OCC_YEAR', 'ASSAULT']).schema == pa.schema(
+        [STORE_SCHEMA.field('OCC_YEAR'), STORE_SCHEMA.field('ASSAULT')])
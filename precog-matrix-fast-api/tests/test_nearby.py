@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import app.fast as fast
+from app.incident_store import CRIME_TYPES, write_store
+from app.nearby import NearbyIndex, parse_window, project
+
+CENTER = (43.70, -79.40)
+
+
+@pytest.fixture(scope='module')
+def index(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    n = 3000
+    dates = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 730, n), unit='D')
+    frame = pd.DataFrame({
+        'EVENT_UNIQUE_ID': [f'GO-{i}' for i in range(n)],
+        'LAT_WGS84': CENTER[0] + rng.normal(0, 0.01, n), 'LONG_WGS84': CENTER[1] + rng.normal(0, 0.015, n),
+        'OCC_YEAR': dates.year, 'OCC_MONTH_NUM': dates.month, 'OCC_DAY': dates.day,
+        'OCC_HOUR': rng.integers(0, 24, n), 'OCC_DOW_NUM': (dates.dayofweek + 1) % 7 + 1, 'OCC_DOY': dates.dayofyear,
+    })
+    counts = (rng.random((n, len(CRIME_TYPES))) < 0.3).astype(np.int64)
+    counts[counts.sum(axis=1) == 0, 0] = 1
+    for i, crime in enumerate(CRIME_TYPES):
+        frame[crime.title()] = counts[:, i]
+    root = tmp_path_factory.mktemp('incidents')
+    write_store(frame, str(root))
+    return NearbyIndex.load(str(root))
+
+
+def brute_force(index, lat, long, radius=np.inf, crime_types=None, hours=None, dows=None):
+    """Indices and distances of the matching incidents, nearest first, by a scan of every incident."""
+    distances = np.hypot(*(project(index.lat, index.long) - project(lat, long)[0]).T)
+    keep = distances <= radius
+    if crime_types:
+        keep &= np.any([(index.types >> CRIME_TYPES.index(crime.upper())) & 1 for crime in crime_types], axis=0)
+    if hours is not None:
+        keep &= hours[index.hour]
+    if dows is not None:
+        keep &= dows[index.dow]
+    indices = np.flatnonzero(keep)
+    return ordered(indices, distances[indices])
+
+
+def ordered(indices, distances):
+    """Sort by distance, breaking ties (incidents at the same point) by index."""
+    order = np.lexsort((indices, distances))
+    return indices[order], distances[order]
+
+
+FILTERS = [
+    {},
+    {'crime_types': ['ROBBERY']},
+    {'crime_types': ['homicide', 'Auto Theft'], 'hours': parse_window('22-3', 0, 23)},
+    {'hours': parse_window('9-17', 0, 23), 'dows': parse_window('7,1', 1, 7)},
+]
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+@pytest.mark.parametrize('radius', [50, 400, 2000])
+def test_radius_and_count_match_a_scan(index, filters, radius):
+    expected, distances = brute_force(index, *CENTER, radius, **filters)
+    indices, found_distances = ordered(*index.within(*CENTER, radius, **filters))
+    np.testing.assert_array_equal(indices, expected)
+    np.testing.assert_allclose(found_distances, distances)
+    assert index.count(*CENTER, radius, **filters) == len(expected)
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+@pytest.mark.parametrize('k, radius', [(1, np.inf), (25, np.inf), (25, 300), (5000, np.inf)])
+def test_nearest_matches_a_scan(index, filters, k, radius):
+    expected, distances = brute_force(index, 43.69, -79.41, radius, **filters)
+    indices, found_distances = ordered(*index.nearest(43.69, -79.41, k, radius, **filters))
+    np.testing.assert_array_equal(indices, expected[:k])
+    np.testing.assert_allclose(found_distances, distances[:k])
+
+
+@pytest.mark.parametrize('text, first, last, expected', [
+    ('22-3', 0, 23, [22, 23, 0, 1, 2, 3]),
+    ('7,1', 1, 7, [1, 7]),
+    ('6-1', 1, 7, [6, 7, 1]),
+    ('5', 0, 23, [5]),
+    ('1-3, 5', 1, 7, [1, 2, 3, 5]),
+])
+def test_parse_window(text, first, last, expected):
+    table = parse_window(text, first, last)
+    assert sorted(np.flatnonzero(table)) == sorted(expected)
+
+
+@pytest.mark.parametrize('text, first, last', [('24', 0, 23), ('0-3', 1, 7), ('a', 0, 23), ('3-x', 0, 23)])
+def test_parse_window_rejects_invalid_windows(text, first, last):
+    with pytest.raises(ValueError):
+        parse_window(text, first, last)
+
+
+@pytest.fixture
+def client():
+    return TestClient(fast.app)
+
+
+def test_nearby_without_a_store(client, monkeypatch):
+    monkeypatch.setattr(fast, 'nearby_index', None)
+    assert client.get('/nearby', params={'lat': CENTER[0], 'lon': CENTER[1]}).status_code == 503
+
+
+def test_nearby_endpoint(client, index, monkeypatch):
+    monkeypatch.setattr(fast, 'nearby_index', index)
+    params = {'lat': CENTER[0], 'lon': CENTER[1], 'radius': 400, 'hours': '22-3', 'dows': '7,1',
+              'crime_type': ['ASSAULT', 'robbery']}
+    response = client.get('/nearby', params={**params, 'limit': 5})
+    assert response.status_code == 200
+    body = response.json()
+    expected, _ = brute_force(index, *CENTER, 400, crime_types=['ASSAULT', 'ROBBERY'],
+                              hours=parse_window('22-3', 0, 23), dows=parse_window('7,1', 1, 7))
+    assert body['count'] == len(expected)
+    assert body['incidents']['event_id'] == index.event_id[expected[:5]].astype(str).tolist()
+    assert client.get('/nearby', params={**params, 'mode': 'count'}).json()['count'] == len(expected)
+
+
+@pytest.mark.parametrize('params', [
+    {'hours': '22-25'}, {'hours': 'night'}, {'dows': '0-3'}, {'crime_type': 'ARSON'},
+    {'mode': 'nearest'}, {'radius': 0}, {'k': 0, 'mode': 'knn'},
+])
+def test_nearby_rejects_invalid_requests(client, index, monkeypatch, params):
+    monkeypatch.setattr(fast, 'nearby_index', index)
+    response = client.get('/nearby', params={'lat': CENTER[0], 'lon': CENTER[1], **params})
+    assert response.status_code == 400
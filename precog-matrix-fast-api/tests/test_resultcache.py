@@ -0,0 +1,62 @@
+import numpy as np
+
+from app.registry import ModelBundle
+from app.resultcache import ResultCache
+
+ROW = (43.6532, -79.3832, 2024, 6, 9, 12)
+
+
+def bundle(version):
+    return ModelBundle(model=None, scaler=None, version=version, feature_params=None)
+
+
+def cache_with_entry(version):
+    cache = ResultCache(max_entries=10, precision=0.001)
+    keys, found, _, _ = cache.lookup(bundle(version), *ROW)
+    assert found == [None]
+    cache.store(bundle(version), keys, np.full(6, 1 / 6))
+    return cache
+
+
+def test_hit_after_store():
+    cache = cache_with_entry('v1')
+    _, found, _, _ = cache.lookup(bundle('v1'), *ROW)
+    np.testing.assert_array_equal(found[0], np.full(6, 1 / 6))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_nearby_points_share_a_cell():
+    cache = cache_with_entry('v1')
+    _, found, lat, lon = cache.lookup(bundle('v1'), ROW[0] + 0.0001, ROW[1] + 0.0001, *ROW[2:])
+    assert found[0] is not None
+    assert np.isclose(lat[0], 43.6535) and np.isclose(lon[0], -79.3835)
+
+
+def test_old_version_bypasses_the_cache_without_clearing_it():
+    cache = cache_with_entry('v1')
+    cache.set_version('v2')
+    keys, _, _, _ = cache.lookup(bundle('v2'), *ROW)
+    cache.store(bundle('v2'), keys, np.zeros(6))
+
+    # An in-flight request still holding the previous bundle neither reads nor replaces v2 entries
+    assert cache.lookup(bundle('v1'), *ROW)[1] == [None]
+    cache.store(bundle('v1'), keys, np.ones(6))
+    assert cache.version == 'v2'
+    _, found, _, _ = cache.lookup(bundle('v2'), *ROW)
+    np.testing.assert_array_equal(found[0], np.zeros(6))
+
+
+def test_set_version_drops_previous_entries():
+    cache = cache_with_entry('v1')
+    cache.set_version('v2')
+    assert len(cache) == 0
+    assert cache.lookup(bundle('v2'), *ROW)[1] == [None]
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResultCache(max_entries=2, precision=0)
+    for lat in (43.60, 43.61, 43.62):
+        keys, _, _, _ = cache.lookup(bundle('v1'), lat, *ROW[1:])
+        cache.store(bundle('v1'), keys, np.zeros(6))
+    assert len(cache) == 2
+    assert cache.lookup(bundle('v1'), 43.60, *ROW[1:])[1] == [None]
@@ -0,0 +1,86 @@
+import copy
+
+import joblib
+import lightgbm
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import StandardScaler
+
+from app.features import FEATURE_COLUMNS, MODEL_COLUMNS, encode_features, feature_values, scaler_params, to_frame
+from app.incident_store import CRIME_TYPES, IncidentStore, write_store
+from app.preproc import LAT_BOUNDS, LONG_BOUNDS
+from training.retrain import encode_labels, publish, read_rows, rescale_thresholds, retrain
+
+DFMATRIX_CRIMES = ['Assault', 'Auto Theft', 'Break and Enter', 'Homicide', 'Robbery', 'Theft Over']
+
+
+def dfmatrix(rng, start, end, n):
+    """Cleaned-matrix rows between two dates whose crime type depends on the calendar."""
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days
+    dates = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, n), unit='D')
+    hour = rng.integers(0, 24, n)
+    crime = (hour // 4 + dates.dayofweek.to_numpy() + rng.integers(0, 2, n)) % len(DFMATRIX_CRIMES)
+    frame = pd.DataFrame({
+        'EVENT_UNIQUE_ID': [f'GO-{i}' for i in range(n)],
+        'LAT_WGS84': rng.uniform(*LAT_BOUNDS, n), 'LONG_WGS84': rng.uniform(*LONG_BOUNDS, n),
+        'OCC_YEAR': dates.year, 'OCC_MONTH_NUM': dates.month, 'OCC_DAY': dates.day, 'OCC_HOUR': hour,
+        'OCC_DOW_NUM': (dates.dayofweek + 1) % 7 + 1, 'OCC_DOY': dates.dayofyear,
+    })
+    for i, name in enumerate(DFMATRIX_CRIMES):
+        frame[name] = (crime == i).astype(np.int64)
+    return frame
+
+
+@pytest.fixture
+def artifacts(tmp_path):
+    """A store holding 2019-2021 and a model trained on 2019-2020 without a manifest."""
+    rng = np.random.default_rng(0)
+    write_store(dfmatrix(rng, '2019-01-01', '2022-01-01', 6000), tmp_path / 'store')
+    store = IncidentStore(tmp_path / 'store')
+    columns, crimes, _ = read_rows([path for year, _, path in store.partitions() if year < 2021])
+    scaler = StandardScaler().fit(pd.DataFrame(encode_features(*columns), columns=MODEL_COLUMNS)[FEATURE_COLUMNS])
+    model = lightgbm.LGBMClassifier(n_estimators=40, num_leaves=15, verbose=-1).fit(
+        to_frame(encode_features(*columns, params=scaler_params(scaler))),
+        encode_labels(crimes, np.arange(len(CRIME_TYPES))))
+    paths = {name: str(tmp_path / f'{name}.joblib') for name in ('model', 'scaler')}
+    joblib.dump(model, paths['model'])
+    joblib.dump(scaler, paths['scaler'])
+    return dict(store=store, rng=rng, root=tmp_path, model_path=paths['model'], scaler_path=paths['scaler'],
+                manifest_path=str(tmp_path / 'manifest.json'), versions_dir=str(tmp_path / 'versions'))
+
+
+def run(artifacts, **kwargs):
+    directory = retrain(artifacts['store'], artifacts['model_path'], artifacts['scaler_path'],
+                        artifacts['manifest_path'], artifacts['versions_dir'], trees=5, **kwargs)
+    publish(directory, artifacts['model_path'], artifacts['scaler_path'], artifacts['manifest_path'])
+    return directory
+
+
+def test_consecutive_retrains_keep_predictions(artifacts):
+    # Each retrain checks that its rescaled trees score the new rows as the
+    # served model did and raises otherwise; the later runs rescale trees
+    # whose thresholds were themselves rescaled.
+    run(artifacts, since='2021-01')
+    for first, last in (('2022-01-01', '2022-04-01'), ('2022-04-01', '2022-07-01')):
+        write_store(dfmatrix(artifacts['rng'], first, last, 1500), artifacts['root'] / 'store')
+        run(artifacts)
+
+
+def test_rescaled_trees_keep_predictions(artifacts):
+    run(artifacts, since='2021-01')
+    model = joblib.load(artifacts['model_path'])
+    scaler = joblib.load(artifacts['scaler_path'])
+    rows = dfmatrix(artifacts['rng'], '2014-01-01', '2025-01-01', 4000)
+    columns = [rows[name].to_numpy() for name in ('LAT_WGS84', 'LONG_WGS84', 'OCC_YEAR', 'OCC_MONTH_NUM',
+                                                  'OCC_DAY', 'OCC_HOUR')]
+    raw = encode_features(*columns)
+    old_params = scaler_params(scaler)
+    shifted = pd.DataFrame(raw[:500] * 3, columns=MODEL_COLUMNS)[FEATURE_COLUMNS]
+    new_params = scaler_params(copy.deepcopy(scaler).partial_fit(shifted))
+    booster = model.booster_
+    for params_before, params_after in ((old_params, new_params), (new_params, old_params)):
+        expected = booster.predict(to_frame(encode_features(*columns, params=params_before)))
+        booster = rescale_thresholds(booster, params_before, params_after, feature_values())
+        np.testing.assert_allclose(booster.predict(to_frame(encode_features(*columns, params=params_after))),
+                                   expected, rtol=0, atol=1e-9)
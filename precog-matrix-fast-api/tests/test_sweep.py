@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.predict import CLASS_NAMES
+from training.sweep import (FEATURES_FILE, LABELS_FILE, YEARS_FILE, is_unpromising, leaderboard, random_configs,
+                            sweep, year_folds)
+
+SPACE = {'num_leaves': [7, 15], 'learning_rate': [0.1, 0.3], 'min_child_samples': [5, 20]}
+
+
+def test_year_folds():
+    years = np.repeat([2014, 2015, 2016, 2017, 2018], 3)
+    assert year_folds(years) == [(2016, 2017), (2017, 2018)]
+    assert year_folds(years, first_train_years=1) == [(2014, 2015), (2015, 2016), (2016, 2017), (2017, 2018)]
+    assert year_folds(years, first_train_years=5) == []
+
+
+def test_random_configs_are_distinct_draws_from_the_space():
+    configs = random_configs(SPACE, 200, seed=0)
+    assert len(configs) == 8  # every combination, each kept once
+    assert len({tuple(sorted(config.items())) for config in configs}) == len(configs)
+    assert all(config[name] in values for config in configs for name, values in SPACE.items())
+    assert random_configs(SPACE, 5, seed=1) == random_configs(SPACE, 5, seed=1)
+
+
+@pytest.mark.parametrize('loss, fold_losses, expected', [
+    (0.9, [0.5, 0.6, 0.7, 0.8], True),
+    (0.6, [0.5, 0.6, 0.7, 0.8], False),
+    (0.9, [0.5, 0.6, 0.7], False),  # too few reports to judge
+    (0.8, [0.8, 0.8, 0.8, 0.8], False),  # ties are not worse
+])
+def test_is_unpromising(loss, fold_losses, expected):
+    assert is_unpromising(loss, fold_losses, quantile=0.5, min_reports=4) == expected
+
+
+def fold_result(config, fold, loss):
+    per_class = [0.5] * len(CLASS_NAMES)
+    return {'config': config, 'fold': list(fold), 'log_loss': loss, 'accuracy': 1 - loss / 2, 'trees': 10,
+            'seconds': 1.0, 'precision': per_class, 'recall': per_class, 'f1': per_class,
+            'support': [1] * len(CLASS_NAMES)}
+
+
+def test_leaderboard_puts_complete_configurations_first():
+    configs = random_configs(SPACE, 200, seed=0)[:3]
+    folds = [(2016, 2017), (2017, 2018)]
+    results = [fold_result(0, folds[0], 0.9), fold_result(0, folds[1], 0.9),
+               fold_result(1, folds[0], 0.4),  # best so far, but pruned after one fold
+               fold_result(2, folds[0], 0.7), fold_result(2, folds[1], 0.5)]
+
+    board = leaderboard(configs, results, {1}, len(folds))
+    assert list(board['config']) == [2, 0, 1]
+    assert list(board['complete']) == [True, True, False]
+    assert list(board['pruned']) == [False, False, True]
+    assert list(board['folds']) == [2, 2, 1]
+    assert board.loc[0, 'log_loss'] == pytest.approx(0.6)
+    assert board.loc[0, 'num_leaves'] == configs[2]['num_leaves']
+
+
+def test_sweep_never_prunes_a_complete_configuration(tmp_path):
+    rng = np.random.default_rng(0)
+    years = np.repeat(np.arange(2014, 2019), 200).astype(np.int16)
+    features = rng.normal(size=(len(years), 4))
+    labels = (features[:, 0] > 0).astype(np.int64) + 2 * (rng.random(len(years)) < features[:, 1].clip(0, 1))
+    np.save(tmp_path / FEATURES_FILE, features)
+    np.save(tmp_path / LABELS_FILE, labels)
+    np.save(tmp_path / YEARS_FILE, years)
+
+    configs = random_configs(SPACE, 200, seed=0)
+    folds = year_folds(years)
+    results, pruned = sweep(str(tmp_path), configs, folds, workers=2, prune_quantile=0, min_reports=1,
+                            max_trees=5, stopping_rounds=2)
+    board = leaderboard(configs, results, pruned, len(folds))
+
+    assert pruned
+    assert not (board['pruned'] & board['complete']).any()
+    assert (board['pruned'] | board['complete']).all()
+    assert pd.Series(board['complete']).is_monotonic_decreasing
+    assert all(result['fold'] in [list(fold) for fold in folds] for result in results)
@@ -0,0 +1,56 @@
+import lightgbm
+import numpy as np
+import pytest
+
+from app.features import MODEL_COLUMNS, to_frame
+from app.registry import ENGINE_TOLERANCE
+from app.treeeval import AutoEngine, TreeEnsemble
+
+
+def training_rows(rng, n):
+    """Encoded-like rows with NaN and exact zeros in some columns, and a label that depends on them."""
+    X = rng.normal(size=(n, len(MODEL_COLUMNS)))
+    X[rng.random(n) < 0.2, 0] = np.nan
+    X[rng.random(n) < 0.3, 1] = 0.0
+    X[:, 2] = np.round(X[:, 2])
+    y = (np.nan_to_num(X[:, 0], nan=2.0) > 0).astype(int) + 2 * (X[:, 1] == 0) + (X[:, 2] > 0)
+    return X, y % 4
+
+
+def rows(rng, n):
+    """Rows to score, with missing values and zeros in every column."""
+    X = rng.normal(size=(n, len(MODEL_COLUMNS)))
+    X[rng.random(X.shape) < 0.1] = np.nan
+    X[rng.random(X.shape) < 0.1] = 0.0
+    X[:, 2] = np.round(X[:, 2])
+    return X
+
+
+@pytest.fixture(scope='module', params=[{}, {'zero_as_missing': True}, {'use_missing': False}],
+                ids=['nan-missing', 'zero-missing', 'no-missing'])
+def model(request):
+    X, y = training_rows(np.random.default_rng(0), 2000)
+    return lightgbm.LGBMClassifier(n_estimators=30, num_leaves=15, min_child_samples=5, verbose=-1,
+                                   **request.param).fit(to_frame(X), y)
+
+
+@pytest.mark.parametrize('n', [1, 7, 3000])
+def test_matches_predict_proba(model, n):
+    X = rows(np.random.default_rng(n), n)
+    arrays = TreeEnsemble.from_model(model)
+    np.testing.assert_allclose(arrays.predict_proba(X), model.predict_proba(to_frame(X)),
+                               rtol=0, atol=ENGINE_TOLERANCE)
+
+
+def test_single_row_vector(model):
+    X = rows(np.random.default_rng(1), 1)
+    np.testing.assert_allclose(TreeEnsemble.from_model(model).predict_proba(X[0]), model.predict_proba(to_frame(X)),
+                               rtol=0, atol=ENGINE_TOLERANCE)
+
+
+@pytest.mark.parametrize('n', [1, 5, 50])
+def test_auto_engine_matches_predict_proba(model, n):
+    X = rows(np.random.default_rng(n), n)
+    engine = AutoEngine(model, TreeEnsemble.from_model(model), max_rows=10)
+    np.testing.assert_allclose(engine.predict_proba(X), model.predict_proba(to_frame(X)),
+                               rtol=0, atol=ENGINE_TOLERANCE)
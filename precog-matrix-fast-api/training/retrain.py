@@ -0,0 +1,352 @@
+"""Continue training the served model on newly published months of incidents.
+
+Instead of refitting on the whole history, each run reads only the incident
+store partitions the current model has not seen, updates the scaler
+statistics with StandardScaler.partial_fit and adds trees to the current
+LightGBM model (init_model), so the cost follows the size of the new data:
+
+    python -m training.retrain --store raw_data/incidents --trees 50
+
+Every run writes `models/versions/<version>/` with the model, the scaler and
+a manifest.json holding their SHA-256 checksums, the parent version and the
+partitions trained on (checksum, size and mtime, so later runs only hash the
+partitions that changed on disk), then publishes it to MODEL_PATH and
+SCALER_PATH. The registry checks the manifest on load, so a running API
+picks the new version up through MODEL_WATCH_INTERVAL or POST /admin/reload.
+"""
+import argparse
+import copy
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+
+import joblib
+import lightgbm
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from app.features import FEATURE_COLUMNS, MODEL_COLUMNS, encode_features, feature_values, scaler_params, to_frame
+from app.incident_store import INCIDENT_STORE_PATH, IncidentStore, read_partition
+from app.predict import CLASS_NAMES
+from app.registry import MODEL_MANIFEST_PATH, MODEL_PATH, SCALER_PATH, file_sha256, file_version
+
+TRAIN_COLUMNS = ['LAT_WGS84', 'LONG_WGS84', 'OCC_YEAR', 'OCC_MONTH', 'OCC_DAY', 'OCC_HOUR', 'MCI_CATEGORY']
+VERSIONS_DIR = os.path.join(os.path.dirname(MODEL_PATH), 'versions')
+MANIFEST_FILE = 'manifest.json'
+PARITY_TOLERANCE = 1e-9
+
+
+def partition_key(year, month):
+    return f'{year:04d}-{month:02d}'
+
+
+def read_manifest(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def partition_stat(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def new_partitions(store, trained, since=None):
+    """Split the store partitions into ({key: entry} already trained on, [(key, path, entry)] to train on).
+
+    An entry is a partition's SHA-256 with the size and mtime it had when
+    hashed. A partition whose size and mtime still match its entry in
+    `trained` (a manifest's map) is not read at all; the others are hashed
+    and are new if missing from `trained` or changed since. With `since`
+    ('YYYY-MM') the partitions from that month on are new and the earlier
+    ones count as part of the current model.
+    """
+    trained = dict(trained)
+    found = []
+    for year, month, path in store.partitions():
+        key = partition_key(year, month)
+        stat = partition_stat(path)
+        entry = trained.get(key)
+        if isinstance(entry, str):
+            # Manifests written before sizes and mtimes were recorded
+            entry = {'sha256': entry}
+        if (since is None or key < since) and entry is not None and all(
+                entry.get(name) == value for name, value in stat.items()):
+            continue
+        current = {'sha256': file_sha256(path), **stat}
+        if since is not None and key < since:
+            trained[key] = current
+        elif since is not None or entry is None or entry['sha256'] != current['sha256']:
+            found.append((key, path, current))
+        else:
+            # Touched without changing: remember the new mtime so it is not hashed again
+            trained[key] = current
+    return trained, found
+
+
+def read_rows(paths):
+    """Return the calendar columns, crime types and number of skipped rows of the given partitions.
+
+    Rows whose day does not exist in their month (left by the day imputation
+    in cleaning) are skipped: the API can never be asked about them.
+    """
+    table = pa.concat_tables([read_partition(path).select(TRAIN_COLUMNS) for path in paths])
+    dates = pd.to_datetime(pd.DataFrame({'year': table['OCC_YEAR'].to_numpy(), 'month': table['OCC_MONTH'].to_numpy(),
+                                         'day': table['OCC_DAY'].to_numpy()}), errors='coerce')
+    valid = dates.notna().to_numpy()
+    table = table.filter(pa.array(valid))
+    columns = [table[name].to_numpy() for name in TRAIN_COLUMNS[:-1]]
+    crimes = table['MCI_CATEGORY'].to_pandas().astype(str).to_numpy()
+    return columns, crimes, int((~valid).sum())
+
+
+def encode_labels(crimes, classes):
+    """Map crime type names onto the model's classes (names, or indices into CLASS_NAMES)."""
+    if np.asarray(classes).dtype.kind in 'OUS':
+        return crimes
+    codes = pd.Categorical(crimes, categories=CLASS_NAMES).codes
+    if (codes < 0).any():
+        raise ValueError(f"Unknown crime types: {sorted(set(crimes[codes < 0]))}")
+    return codes.astype(np.int64)
+
+
+def update_scaler(scaler, raw):
+    """Return a copy of `scaler` whose statistics also cover the raw MODEL_COLUMNS rows."""
+    updated = copy.deepcopy(scaler)
+    names = list(getattr(scaler, 'feature_names_in_', FEATURE_COLUMNS))
+    updated.partial_fit(pd.DataFrame(raw, columns=MODEL_COLUMNS)[names])
+    return updated
+
+
+def last_left(thresholds, mean, scale, max_steps=64):
+    """Return the largest raw value x with (x - mean) / scale <= threshold, per threshold.
+
+    Computed with the same float operations the scaler applies to inputs, so
+    the boundary is exact rather than within an ulp of it.
+    """
+    x = thresholds * scale + mean
+    finite = np.isfinite(x)
+    for _ in range(max_steps):
+        over = finite & ((x - mean) / scale > thresholds)
+        if not over.any():
+            break
+        x = np.where(over, np.nextafter(x, -np.inf), x)
+    for _ in range(max_steps):
+        above = np.nextafter(x, np.inf)
+        under = finite & ((above - mean) / scale <= thresholds)
+        if not under.any():
+            break
+        x = np.where(under, above, x)
+    return x
+
+
+def rescale_thresholds(booster, old_params, new_params, values=None):
+    """Return a copy of `booster` that splits inputs scaled with `new_params` as `booster` split `old_params` ones.
+
+    Scaling is increasing, so a split sends left exactly the raw values up to
+    the largest one the old scaler maps under its threshold, and the new
+    threshold is that value under the new scaler. `values` (see
+    feature_values) lists the raw values of the discrete features: their
+    thresholds sit within an ulp of one, and values only a few ulps apart
+    (sin and cos of different hours that are equal on paper) can fall on
+    either side, so the boundary is taken between the neighbouring values
+    the feature can really take. Other features use the exact float
+    boundary.
+    """
+    old_mean, old_scale = old_params
+    new_mean, new_scale = new_params
+    values = values if values is not None else [None] * len(old_mean)
+
+    def convert_feature(thresholds, j):
+        known = values[j]
+        if known is not None:
+            old = (known - old_mean[j]) / old_scale[j]
+            new = (known - new_mean[j]) / new_scale[j]
+            left = np.searchsorted(old, thresholds, side='right') - 1
+            inside = (left >= 0) & (left < len(known) - 1)
+            if inside.any():
+                merged = new[left[inside]] == new[left[inside] + 1]
+                if merged.any():
+                    raise ValueError(f"New scaling merges two values of {MODEL_COLUMNS[j]}; a split cannot be kept.")
+                converted = np.empty_like(thresholds)
+                converted[inside] = new[left[inside]]
+                converted[~inside] = convert_feature_bounds(thresholds[~inside], j)
+                return converted
+        return convert_feature_bounds(thresholds, j)
+
+    def convert_feature_bounds(thresholds, j):
+        raw = last_left(thresholds, old_mean[j], old_scale[j])
+        return np.where(np.isfinite(raw), (raw - new_mean[j]) / new_scale[j], thresholds)
+
+    def convert(thresholds, features):
+        converted = np.empty_like(thresholds)
+        for j in np.unique(features):
+            at = features == j
+            converted[at] = convert_feature(thresholds[at], j)
+        return converted
+
+    lines = []
+    features = None
+    for line in booster.model_to_string().splitlines():
+        key, _, value = line.partition('=')
+        if key == 'tree_sizes':
+            # Byte offsets of the trees, no longer valid once thresholds are rewritten
+            continue
+        if key == 'split_feature':
+            features = np.array(value.split(), dtype=np.int64)
+        elif key == 'threshold':
+            thresholds = convert(np.array(value.split(), dtype=np.float64), features)
+            line = 'threshold=' + ' '.join(repr(float(t)) for t in thresholds)
+        elif key == 'feature_infos':
+            infos = []
+            for j, info in enumerate(value.split()):
+                if info.startswith('['):
+                    low, high = convert(np.array(info[1:-1].split(':'), dtype=np.float64), np.array([j, j]))
+                    info = f'[{float(low)!r}:{float(high)!r}]'
+                infos.append(info)
+            line = 'feature_infos=' + ' '.join(infos)
+        lines.append(line)
+    return lightgbm.Booster(model_str='\n'.join(lines) + '\n')
+
+
+def continue_training(model, booster, features, labels, trees, learning_rate=None):
+    """Add `trees` boosting rounds to `booster` on the new rows; return a new LGBMClassifier."""
+    labels = np.asarray(labels)
+    weights = np.ones(len(labels))
+    # The classifier derives its classes from the labels: a month without a
+    # homicide would otherwise shrink the model to five classes. Zero-weight
+    # rows add the missing ones without touching gradients or leaf values.
+    missing = np.setdiff1d(model.classes_, labels)
+    if len(missing):
+        features = pd.concat([features, features.iloc[np.zeros(len(missing), dtype=np.int64)]], ignore_index=True)
+        labels = np.concatenate([labels, missing])
+        weights = np.concatenate([weights, np.zeros(len(missing))])
+
+    params = {**model.get_params(), 'n_estimators': trees}
+    if learning_rate is not None:
+        params['learning_rate'] = learning_rate
+    updated = lightgbm.LGBMClassifier(**params)
+    updated.fit(features, labels, sample_weight=weights, init_model=booster)
+    if not np.array_equal(updated.classes_, model.classes_):
+        raise ValueError(f"Classes changed from {model.classes_} to {updated.classes_}.")
+    return updated
+
+
+def write_version(model, scaler, manifest, versions_dir=VERSIONS_DIR):
+    """Write model, scaler and manifest to `versions_dir/<version>/`; return that directory."""
+    os.makedirs(versions_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=versions_dir, prefix='.staging-')
+    model_file = os.path.join(staging, os.path.basename(MODEL_PATH))
+    scaler_file = os.path.join(staging, os.path.basename(SCALER_PATH))
+    joblib.dump(model, model_file)
+    joblib.dump(scaler, scaler_file)
+
+    version = file_version(model_file, scaler_file)
+    manifest = {
+        'version': version,
+        **manifest,
+        'files': {
+            'model': {'name': os.path.basename(model_file), 'sha256': file_sha256(model_file)},
+            'scaler': {'name': os.path.basename(scaler_file), 'sha256': file_sha256(scaler_file)},
+        },
+    }
+    with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    directory = os.path.join(versions_dir, version)
+    if os.path.exists(directory):
+        shutil.rmtree(staging)
+    else:
+        os.rename(staging, directory)
+    return directory
+
+
+def publish(directory, model_path=MODEL_PATH, scaler_path=SCALER_PATH, manifest_path=MODEL_MANIFEST_PATH):
+    """Copy a version over the served artifacts, manifest first.
+
+    Each file is replaced atomically. Once the new manifest is in place the
+    registry rejects every pair but the one it names, so until both the model
+    and the scaler are copied the previous version keeps serving, including
+    on the first publish over artifacts that had no manifest. If a copy
+    fails, publishing the same version again completes it.
+    """
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        files = json.load(f)['files']
+    for source, target in ((MANIFEST_FILE, manifest_path), (files['model']['name'], model_path),
+                           (files['scaler']['name'], scaler_path)):
+        tmp_path = f'{target}.tmp'
+        shutil.copyfile(os.path.join(directory, source), tmp_path)
+        os.replace(tmp_path, target)
+
+
+def retrain(store, model_path=MODEL_PATH, scaler_path=SCALER_PATH, manifest_path=MODEL_MANIFEST_PATH,
+            versions_dir=VERSIONS_DIR, trees=50, learning_rate=None, since=None):
+    """Train on the new partitions of `store`; return the new version directory, or None if nothing is new."""
+    current = read_manifest(manifest_path)
+    if current is None and since is None:
+        raise ValueError(f"No manifest at {manifest_path}; pass since='YYYY-MM' for the first incremental run.")
+    trained, partitions = new_partitions(store, current['partitions'] if current is not None else {}, since)
+    if not partitions:
+        return None
+
+    model = joblib.load(model_path)
+    scaler = joblib.load(scaler_path)
+    columns, crimes, skipped = read_rows([path for _, path, _ in partitions])
+
+    old_params = scaler_params(scaler)
+    updated_scaler = update_scaler(scaler, encode_features(*columns))
+    new_params = scaler_params(updated_scaler)
+    booster = rescale_thresholds(model.booster_, old_params, new_params, feature_values())
+
+    new_features = to_frame(encode_features(*columns, params=new_params))
+    # The rewritten trees must score new-scale rows exactly as the old model scored old-scale ones
+    expected = model.predict_proba(to_frame(encode_features(*columns, params=old_params)))
+    actual = booster.predict(new_features)
+    difference = abs(actual - expected).max()
+    if difference > PARITY_TOLERANCE:
+        raise ValueError(f"Rescaled trees differ from the current model by {difference}.")
+
+    updated = continue_training(model, booster, new_features, encode_labels(crimes, model.classes_),
+                                trees, learning_rate)
+    return write_version(updated, updated_scaler, {
+        'parent': current['version'] if current is not None else file_version(model_path, scaler_path),
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'rows': len(crimes),
+        'skipped_rows': skipped,
+        'total_rows': int(np.max(updated_scaler.n_samples_seen_)),
+        'trees': updated.booster_.num_trees(),
+        'new_partitions': [key for key, _, _ in partitions],
+        'partitions': {**trained, **{key: entry for key, _, entry in partitions}},
+    }, versions_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Continue training the model on new incident store partitions.")
+    parser.add_argument('--store', default=INCIDENT_STORE_PATH)
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--scaler', default=SCALER_PATH)
+    parser.add_argument('--manifest', default=MODEL_MANIFEST_PATH)
+    parser.add_argument('--versions', default=VERSIONS_DIR, help='directory the versioned artifacts go to')
+    parser.add_argument('--trees', type=int, default=50, help='boosting rounds to add')
+    parser.add_argument('--learning-rate', type=float)
+    parser.add_argument('--since', help="train on every partition from this month on ('YYYY-MM'); "
+                                        "required when the current model has no manifest")
+    parser.add_argument('--no-publish', action='store_true', help='write the version without serving it')
+    args = parser.parse_args()
+
+    directory = retrain(IncidentStore(args.store), args.model, args.scaler, args.manifest, args.versions,
+                        args.trees, args.learning_rate, args.since)
+    if directory is None:
+        print("No new partitions to train on")
+        return
+    if not args.no_publish:
+        publish(directory, args.model, args.scaler, args.manifest)
+    print(f"Wrote {directory}" + ("" if args.no_publish else f" and published it to {args.model}"))
+
+
+if __name__ == '__main__':
+    main()
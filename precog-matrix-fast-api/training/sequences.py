@@ -0,0 +1,177 @@
+"""Sliding-window training sequences for the sequence (LSTM) models, without copies.
+
+create_sequences in datacleaningprontoV2.ipynb appends a (data[i:i+window],
+label) tuple for every row and stacks them, so the windows hold `window`
+copies of the scaled features. Here the scaled features are written once to
+a .npy file, sorted by location cell and time, and every window is a strided
+view into its memory map. Only the rows of the current mini-batch are ever
+read into memory:
+
+    build_sequence_files(dfmatrix, 'sequences')
+    dataset = SequenceDataset.open('sequences', window=10)
+    train, test = dataset.split(0.2, seed=42)
+    model.fit(train.batches(256, repeat=True), steps_per_epoch=train.steps(256), ...)
+
+A window is the `window` incidents before an incident in the same cell and
+its label is the crime counts of that incident, so no window mixes events
+from unrelated places.
+"""
+import argparse
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from sklearn.preprocessing import StandardScaler
+
+# Columns of the cleaned dfmatrix, as selected in datacleaningprontoV2.ipynb
+SEQUENCE_FEATURES = ['LAT_WGS84', 'LONG_WGS84', 'OCC_YEAR', 'MONTH_SIN', 'MONTH_COS', 'HOUR_SIN', 'HOUR_COS',
+                     'OCC_DAY_SIN', 'OCC_DAY_COS', 'OCC_DOY_SIN', 'OCC_DOY_COS', 'OCC_DOW_SIN', 'OCC_DOW_COS',
+                     'Assault', 'Auto Theft', 'Break and Enter', 'Homicide', 'Robbery', 'Theft Over']
+LABEL_COLUMNS = ['Assault', 'Auto Theft', 'Break and Enter', 'Homicide', 'Robbery', 'Theft Over']
+TIME_COLUMNS = ['OCC_YEAR', 'OCC_DOY', 'OCC_HOUR']
+CELL_SIZE = 0.01  # degrees, about 1 km
+
+FEATURES_FILE = 'features.npy'
+LABELS_FILE = 'labels.npy'
+GROUPS_FILE = 'groups.npy'
+SCALER_FILE = 'scaler.joblib'
+
+
+def sliding_windows(data, window):
+    """Return a read-only (rows - window + 1, window, columns) view of every run of `window` rows."""
+    data = np.asarray(data)
+    if data.ndim == 1:
+        data = data[:, None]
+    return sliding_window_view(data, (window, data.shape[1]))[:, 0]
+
+
+def create_sequences(data, labels, window_size):
+    """Drop-in for the notebook function: (X_seq, y_seq) with the same contents, as views."""
+    return sliding_windows(data, window_size)[:-1], np.asarray(labels)[window_size:]
+
+
+def location_cells(lat, lon, cell_size=CELL_SIZE):
+    """Return an int64 id per row for the `cell_size`-degree cell it falls in."""
+    lat_cell = np.floor(np.asarray(lat, dtype=np.float64) / cell_size).astype(np.int64)
+    lon_cell = np.floor(np.asarray(lon, dtype=np.float64) / cell_size).astype(np.int64)
+    if not len(lat_cell):
+        return lat_cell
+    lon_cell -= lon_cell.min()
+    return (lat_cell - lat_cell.min()) * (lon_cell.max() + 1) + lon_cell
+
+
+def window_starts(groups, window):
+    """Return the first row of every window whose rows and label row share one group.
+
+    Rows must be sorted so each group is contiguous; a window then stays inside
+    its group exactly when its first row and its label row agree.
+    """
+    rows = len(groups) - window
+    if rows <= 0:
+        return np.empty(0, dtype=np.int64)
+    groups = np.asarray(groups)
+    return np.flatnonzero(groups[:rows] == groups[window:])
+
+
+def build_sequence_files(frame, directory, scaler=None, features=SEQUENCE_FEATURES, labels=LABEL_COLUMNS,
+                         cell_size=CELL_SIZE, chunksize=100000):
+    """Write scaled features, labels and cell ids of `frame`, sorted by cell and time, to `directory`.
+
+    Features are scaled and written `chunksize` rows at a time straight into a
+    float32 memory map. Without a `scaler` a StandardScaler is fitted with
+    partial_fit; either way it is saved next to the arrays and returned.
+    """
+    os.makedirs(directory, exist_ok=True)
+    groups = location_cells(frame['LAT_WGS84'], frame['LONG_WGS84'], cell_size)
+    order = np.lexsort([frame[column].to_numpy() for column in reversed(TIME_COLUMNS)] + [groups])
+    columns = frame[features]
+
+    if scaler is None:
+        scaler = StandardScaler()
+        for start in range(0, len(frame), chunksize):
+            scaler.partial_fit(columns.iloc[start:start + chunksize])
+
+    out = np.lib.format.open_memmap(os.path.join(directory, FEATURES_FILE), mode='w+',
+                                    dtype=np.float32, shape=(len(frame), len(features)))
+    for start in range(0, len(frame), chunksize):
+        out[start:start + chunksize] = scaler.transform(columns.iloc[order[start:start + chunksize]])
+    out.flush()
+    del out
+
+    np.save(os.path.join(directory, LABELS_FILE), frame[labels].to_numpy(dtype=np.float32)[order])
+    np.save(os.path.join(directory, GROUPS_FILE), groups[order])
+    joblib.dump(scaler, os.path.join(directory, SCALER_FILE))
+    return scaler
+
+
+class SequenceDataset:
+    """Windows over a (memory-mapped) feature array, served as lazily gathered mini-batches.
+
+    `starts` holds the first row of every usable window; indexing one window
+    returns a view, and only `batches` copies, one batch at a time.
+    """
+
+    def __init__(self, features, labels, window, groups=None, starts=None):
+        self.features = features
+        self.labels = labels
+        self.window = window
+        self.windows = sliding_windows(features, window)
+        if starts is None:
+            starts = window_starts(np.zeros(len(features), dtype=np.int8) if groups is None else groups, window)
+        self.starts = starts
+
+    @classmethod
+    def open(cls, directory, window):
+        """Memory-map the arrays written by build_sequence_files."""
+        load = lambda name: np.load(os.path.join(directory, name), mmap_mode='r')
+        return cls(load(FEATURES_FILE), load(LABELS_FILE), window, groups=load(GROUPS_FILE))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        start = self.starts[index]
+        return self.windows[start], self.labels[start + self.window]
+
+    def subset(self, starts):
+        return SequenceDataset(self.features, self.labels, self.window, starts=starts)
+
+    def split(self, test_size=0.2, seed=None):
+        """Randomly split the windows in two datasets sharing the same arrays, like train_test_split."""
+        shuffled = np.random.default_rng(seed).permutation(self.starts)
+        n_test = int(np.ceil(len(shuffled) * test_size))
+        return self.subset(np.sort(shuffled[n_test:])), self.subset(np.sort(shuffled[:n_test]))
+
+    def steps(self, batch_size):
+        return -(-len(self.starts) // batch_size)
+
+    def batches(self, batch_size=256, shuffle=True, seed=None, repeat=False):
+        """Yield (windows, labels) arrays of up to `batch_size` windows; with `repeat`, one epoch after another."""
+        rng = np.random.default_rng(seed)
+        while True:
+            starts = rng.permutation(self.starts) if shuffle else self.starts
+            for begin in range(0, len(starts), batch_size):
+                # Gather in file order so the batch reads the memory map sequentially
+                batch = np.sort(starts[begin:begin + batch_size])
+                yield self.windows[batch], self.labels[batch + self.window]
+            if not repeat:
+                return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the sequence-model training arrays for a cleaned matrix.")
+    parser.add_argument('matrix', help='Parquet file written by data_cleaning.py')
+    parser.add_argument('--output', default='raw_data/sequences')
+    parser.add_argument('--cell-size', type=float, default=CELL_SIZE, help='location cell size in degrees')
+    parser.add_argument('--chunksize', type=int, default=100000)
+    args = parser.parse_args()
+
+    frame = pd.read_parquet(args.matrix, columns=list(dict.fromkeys(SEQUENCE_FEATURES + LABEL_COLUMNS + TIME_COLUMNS)))
+    build_sequence_files(frame, args.output, cell_size=args.cell_size, chunksize=args.chunksize)
+    print(f"Wrote {len(frame)} rows x {len(SEQUENCE_FEATURES)} features to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""Process-parallel LightGBM parameter sweep over rolling year folds.
+
+Every configuration (a grid, or random draws from SEARCH_SPACE) is trained
+on 2014..N and validated on N + 1 for each year N, smallest training set
+first. Folds run in a process pool; the encoded features are written once
+to .npy files that every worker memory-maps, and rows are sorted by year so
+each fold is a slice of the map instead of a pickled copy:
+
+    python -m training.sweep --store raw_data/incidents --search random --trials 60 --output sweep
+
+A fit stops adding trees once the log-loss on the most recent
+`--stopping-fraction` of its training rows stops improving, so the
+validation year stays unseen until it is scored, and a configuration whose
+log-loss on a fold is worse than the `--prune-quantile` of the others on
+that fold gets no further folds. Results go to
+leaderboard.csv (mean log-loss, accuracy and per-class precision, recall
+and F1 per configuration) and results.json (every fold).
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import lightgbm
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, log_loss, precision_recall_fscore_support
+
+from app.features import encode_features
+from app.incident_store import INCIDENT_STORE_PATH, IncidentStore
+from app.predict import CLASS_NAMES
+from training.retrain import encode_labels, read_rows
+
+# LightGBM parameters (LGBMClassifier names) and the values tried for each
+SEARCH_SPACE = {
+    'num_leaves': [15, 31, 63, 127],
+    'learning_rate': [0.03, 0.1, 0.3],
+    'min_child_samples': [10, 20, 50, 100],
+    'colsample_bytree': [0.6, 0.8, 1.0],
+    'reg_lambda': [0.0, 1.0, 10.0],
+}
+MAX_TREES = 1000
+STOPPING_ROUNDS = 50
+STOPPING_FRACTION = 0.1  # most recent training rows held out for early stopping
+
+FEATURES_FILE = 'features.npy'
+LABELS_FILE = 'labels.npy'
+YEARS_FILE = 'years.npy'
+
+# Memory maps opened once per worker process
+_shared = {}
+
+
+def grid_configs(space):
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_configs(space, trials, seed=None):
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(trials):
+        configs.append({name: values[rng.integers(len(values))] for name, values in space.items()})
+    # Draws can repeat; keep the first of each
+    return list({json.dumps(config, sort_keys=True): config for config in configs}.values())
+
+
+def year_folds(years, first_train_years=3):
+    """Return [(last training year, validation year)] for every year with at least `first_train_years` before it."""
+    available = np.unique(years)
+    return [(int(year) - 1, int(year)) for year in available[first_train_years:]]
+
+
+def write_shared(store, directory):
+    """Encode every incident of `store` into year-sorted .npy files in `directory`; return the years present.
+
+    Features are left unscaled: tree splits do not change under the scaler,
+    so a configuration ranks the same either way.
+    """
+    columns, crimes, _ = read_rows([path for _, _, path in store.partitions()])
+    order = np.argsort(columns[2], kind='stable')
+    np.save(os.path.join(directory, FEATURES_FILE), encode_features(*columns)[order])
+    np.save(os.path.join(directory, LABELS_FILE), encode_labels(crimes, np.arange(len(CLASS_NAMES)))[order])
+    np.save(os.path.join(directory, YEARS_FILE), columns[2][order].astype(np.int16))
+    return columns[2][order]
+
+
+def open_shared(directory):
+    """Pool initializer: memory-map the arrays written by write_shared."""
+    for name, file in (('features', FEATURES_FILE), ('labels', LABELS_FILE), ('years', YEARS_FILE)):
+        _shared[name] = np.load(os.path.join(directory, file), mmap_mode='r')
+
+
+def run_fold(config_id, params, fold, threads, max_trees=MAX_TREES, stopping_rounds=STOPPING_ROUNDS,
+             stopping_fraction=STOPPING_FRACTION):
+    """Train one configuration on one fold in a worker; return its metrics.
+
+    Early stopping watches the last `stopping_fraction` of the training rows
+    (the latest years, as rows are sorted by year), never the validation year.
+    """
+    features, labels, years = _shared['features'], _shared['labels'], _shared['years']
+    train_end = int(np.searchsorted(years, fold[0], side='right'))
+    valid_end = int(np.searchsorted(years, fold[1], side='right'))
+    fit_end = train_end - max(int(train_end * stopping_fraction), 1)
+
+    start = time.perf_counter()
+    # Native API with a fixed class count: a training fold may miss a rare class
+    train = lightgbm.Dataset(features[:fit_end], labels[:fit_end])
+    stopping = lightgbm.Dataset(features[fit_end:train_end], labels[fit_end:train_end], reference=train)
+    booster = lightgbm.train({'objective': 'multiclass', 'num_class': len(CLASS_NAMES), 'num_threads': threads,
+                              'verbose': -1, **params},
+                             train, num_boost_round=max_trees, valid_sets=[stopping],
+                             callbacks=[lightgbm.early_stopping(stopping_rounds, verbose=False)])
+
+    truth = labels[train_end:valid_end]
+    probabilities = booster.predict(features[train_end:valid_end], num_iteration=booster.best_iteration)
+    precision, recall, f1, support = precision_recall_fscore_support(
+        truth, probabilities.argmax(axis=1), labels=np.arange(len(CLASS_NAMES)), zero_division=0)
+    return {
+        'config': config_id,
+        'fold': list(fold),
+        'log_loss': float(log_loss(truth, probabilities, labels=np.arange(len(CLASS_NAMES)))),
+        'accuracy': float(accuracy_score(truth, probabilities.argmax(axis=1))),
+        'trees': int(booster.best_iteration or max_trees),
+        'seconds': time.perf_counter() - start,
+        'precision': precision.tolist(),
+        'recall': recall.tolist(),
+        'f1': f1.tolist(),
+        'support': support.tolist(),
+    }
+
+
+def is_unpromising(loss, fold_losses, quantile, min_reports):
+    """Median-style pruning: worse than `quantile` of the configurations already scored on this fold."""
+    return len(fold_losses) >= min_reports and loss > np.quantile(fold_losses, quantile)
+
+
+def sweep(directory, configs, folds, workers=None, threads=1, prune_quantile=0.5, min_reports=4,
+          max_trees=MAX_TREES, stopping_rounds=STOPPING_ROUNDS, stopping_fraction=STOPPING_FRACTION):
+    """Run every configuration fold by fold in a process pool; return ([fold results], {pruned config ids}).
+
+    A configuration's next fold is queued as soon as its previous one
+    finishes, so the pool never waits for a whole round. Only a
+    configuration with folds left can be pruned.
+    """
+    workers = workers or os.cpu_count()
+    results = []
+    pruned = set()
+    losses = {}  # fold index -> log-losses reported so far
+    # spawn, not fork: forking a parent that has touched OpenMP can deadlock LightGBM
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=open_shared, initargs=(directory,)) as pool:
+        pending = {}
+
+        def submit(config_id, index):
+            future = pool.submit(run_fold, config_id, configs[config_id], folds[index], threads,
+                                 max_trees, stopping_rounds, stopping_fraction)
+            pending[future] = (config_id, index)
+
+        for config_id in range(len(configs)):
+            submit(config_id, 0)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                config_id, index = pending.pop(future)
+                result = future.result()
+                results.append(result)
+                fold_losses = losses.setdefault(index, [])
+                if index + 1 < len(folds):
+                    if is_unpromising(result['log_loss'], fold_losses, prune_quantile, min_reports):
+                        pruned.add(config_id)
+                    else:
+                        submit(config_id, index + 1)
+                fold_losses.append(result['log_loss'])
+    return results, pruned
+
+
+def leaderboard(configs, results, pruned, n_folds):
+    """One row per configuration, complete ones first, by mean validation log-loss."""
+    rows = []
+    for config_id, config in enumerate(configs):
+        folds = [result for result in results if result['config'] == config_id]
+        row = {
+            'config': config_id,
+            'complete': len(folds) == n_folds,
+            'pruned': config_id in pruned,
+            'folds': len(folds),
+            'log_loss': np.mean([result['log_loss'] for result in folds]),
+            'accuracy': np.mean([result['accuracy'] for result in folds]),
+            'trees': np.mean([result['trees'] for result in folds]),
+            'seconds': np.sum([result['seconds'] for result in folds]),
+            **config,
+        }
+        for metric in ('precision', 'recall', 'f1'):
+            per_class = np.mean([result[metric] for result in folds], axis=0)
+            row.update({f'{metric}_{crime}': value for crime, value in zip(CLASS_NAMES, per_class)})
+        rows.append(row)
+    return pd.DataFrame(rows).sort_values(['complete', 'log_loss'], ascending=[False, True], ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep LightGBM parameters over rolling year folds.")
+    parser.add_argument('--store', default=INCIDENT_STORE_PATH)
+    parser.add_argument('--output', default='sweep')
+    parser.add_argument('--search', choices=['grid', 'random'], default='random')
+    parser.add_argument('--space', help='JSON file of {parameter: [values]} replacing SEARCH_SPACE')
+    parser.add_argument('--trials', type=int, default=40, help='configurations drawn by the random search')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--first-train-years', type=int, default=3, help='years in the smallest training fold')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--threads', type=int, default=1, help='LightGBM threads per worker')
+    parser.add_argument('--max-trees', type=int, default=MAX_TREES)
+    parser.add_argument('--stopping-rounds', type=int, default=STOPPING_ROUNDS)
+    parser.add_argument('--stopping-fraction', type=float, default=STOPPING_FRACTION,
+                        help='most recent share of the training rows used for early stopping')
+    parser.add_argument('--prune-quantile', type=float, default=0.5,
+                        help='stop a configuration worse than this quantile of the others on a fold (1 disables)')
+    parser.add_argument('--min-reports', type=int, default=4, help='results on a fold needed before pruning on it')
+    args = parser.parse_args()
+
+    space = SEARCH_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+    configs = grid_configs(space) if args.search == 'grid' else random_configs(space, args.trials, args.seed)
+    os.makedirs(args.output, exist_ok=True)
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        folds = year_folds(write_shared(IncidentStore(args.store), directory), args.first_train_years)
+        if not folds:
+            raise SystemExit(f"Need more than {args.first_train_years} years of incidents for a fold.")
+        results, pruned = sweep(directory, configs, folds, args.workers, args.threads, args.prune_quantile,
+                                args.min_reports, args.max_trees, args.stopping_rounds, args.stopping_fraction)
+    elapsed = time.perf_counter() - start
+
+    board = leaderboard(configs, results, pruned, len(folds))
+    board.to_csv(os.path.join(args.output, 'leaderboard.csv'), index=False)
+    with open(os.path.join(args.output, 'results.json'), 'w') as f:
+        json.dump({'folds': folds, 'configs': configs, 'pruned': sorted(pruned), 'results': results}, f, indent=2)
+
+    fit_seconds = sum(result['seconds'] for result in results)
+    print(f"{len(results)} fits of {len(configs)} configurations over {len(folds)} folds in {elapsed:.1f} s "
+          f"({fit_seconds / elapsed:.1f} fits running on average); {len(pruned)} pruned")
+    print(board.head(10)[['config', 'folds', 'pruned', 'log_loss', 'accuracy', 'trees'] + list(space)]
+          .to_string(index=False))
+    print(f"-> {args.output}")
+
+
+if __name__ == '__main__':
+    main()